@@ -0,0 +1,91 @@
+"""
+Peak memory of UnifiedDataLoader compared with the previous concatenate + split + scale pipeline.
+
+Every method runs in a fresh process and reports the growth of its peak RSS while loading,
+relative to the size of the loaded dataset. Files are read from the dataset cache in both cases,
+so parsing is not measured.
+
+    python benchmarks/data_loading_memory.py --rows 2000000 --files 4
+"""
+import os
+import sys
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from snapper_ml.config.models import Data
+from snapper_ml.data import UnifiedDataLoader, DELIMITER, SEED, VALIDATION_SPLIT, \
+    find_data_files, load_files, warm_cache
+
+
+def _peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _legacy_load(data: Data):
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    datasets = load_files(find_data_files(data), data)
+    X = np.concatenate(datasets, axis=0)
+    y = np.concatenate([np.full(dataset.shape[0], i) for i, dataset in enumerate(datasets)], axis=0)
+    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=VALIDATION_SPLIT, random_state=SEED)
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X_train)
+    X_val = scaler.transform(X_val)
+    return X_train, X_val, y_train, y_val
+
+
+def _preallocated_load(data: Data):
+    UnifiedDataLoader.set_data(data)
+    return UnifiedDataLoader.load_data()
+
+
+METHODS = {'legacy': _legacy_load, 'preallocated': _preallocated_load}
+
+
+def measure(method: str, data: Data):
+    before = _peak_rss_bytes()
+    result = METHODS[method](data)
+    growth = _peak_rss_bytes() - before
+    dataset_bytes = sum(array.nbytes for array in result)
+    print(f'{method:>14}: dataset {dataset_bytes / 2 ** 20:8.1f} MB, '
+          f'peak RSS growth {growth / 2 ** 20:8.1f} MB ({growth / dataset_bytes:.2f}x)')
+
+
+def generate_files(folder: str, rows: int, files: int, columns: int):
+    rng = np.random.default_rng(SEED)
+    for i in range(files):
+        values = rng.normal(size=(rows // files, columns))
+        np.savetxt(os.path.join(folder, f'part{i}.txt'), values, delimiter=DELIMITER, fmt='%.6f')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--columns', type=int, default=23)
+    parser.add_argument('--method', choices=list(METHODS))
+    parser.add_argument('--folder')
+    args = parser.parse_args()
+
+    if args.method:
+        measure(args.method, Data(folder=args.folder, files=['*.txt']))
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.environ['SNAPPER_ML_CACHE_DIR'] = os.path.join(folder, 'cache')
+        generate_files(folder, args.rows, args.files, args.columns)
+        warm_cache(Data(folder=folder, files=['*.txt']))
+
+        for method in METHODS:
+            subprocess.run([sys.executable, __file__, '--method', method, '--folder', folder], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Startup time and per-trial storage latency of the local mode and of the docker-compose stack.
+
+Startup is the time to create the MLflow experiment and the Optuna study. Every trial samples
+--params parameters, reports --steps intermediate values and logs its run to MLflow, so the
+time per trial is the storage latency paid by a trial that does no work.
+
+The docker-compose stack is read from MLFLOW_TRACKING_URI and OPTUNA_STORAGE_URI (the .env file
+of the project), or given with --mlflow_uri and --optuna_uri. Start it with ``make docker``.
+
+    python benchmarks/local_mode.py --trials 20
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import mlflow
+import optuna
+from dotenv import find_dotenv, load_dotenv
+
+from snapper_ml.config.models import GroupConfig, Settings
+from snapper_ml.mlflow import create_mlflow_experiment
+from snapper_ml.optuna import create_optuna_study
+
+
+def run(name: str, settings: Settings, num_trials: int, num_params: int, num_steps: int):
+    config = GroupConfig(name=f'local-mode-{uuid.uuid4().hex[:8]}',
+                         num_trials=num_trials,
+                         param_space={'x': 'uniform(0, 1)'},
+                         metric={'name': 'score', 'direction': 'maximize'},
+                         run=[__file__])
+
+    start = time.perf_counter()
+    create_mlflow_experiment(config.name, settings)
+    study = create_optuna_study(config, settings)
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(num_trials):
+        trial = study.ask()
+        params = {f'x{i}': trial.suggest_float(f'x{i}', 0, 1) for i in range(num_params)}
+        with mlflow.start_run():
+            mlflow.log_params(params)
+            for step in range(num_steps):
+                trial.report(sum(params.values()) / (step + 1), step)
+                mlflow.log_metric('score', sum(params.values()) / (step + 1), step=step)
+        study.tell(trial, sum(params.values()))
+    per_trial = (time.perf_counter() - start) / num_trials
+
+    print(f'{name:>14}: startup {1000 * startup:8.1f} ms, {1000 * per_trial:8.1f} ms per trial')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=20)
+    parser.add_argument('--params', type=int, default=5)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--mlflow_uri', default=None)
+    parser.add_argument('--optuna_uri', default=None)
+    args = parser.parse_args()
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    load_dotenv(find_dotenv())
+
+    with tempfile.TemporaryDirectory() as folder:
+        stacks = {'local': Settings(MLFLOW_TRACKING_URI='', OPTUNA_STORAGE_URI='', LOCAL_STORAGE_DIR=folder)}
+        mlflow_uri = args.mlflow_uri or os.getenv('MLFLOW_TRACKING_URI')
+        optuna_uri = args.optuna_uri or os.getenv('OPTUNA_STORAGE_URI')
+        if mlflow_uri and optuna_uri:
+            stacks['docker-compose'] = Settings(MLFLOW_TRACKING_URI=mlflow_uri, OPTUNA_STORAGE_URI=optuna_uri)
+
+        for name, settings in stacks.items():
+            try:
+                run(name, settings, args.trials, args.params, args.steps)
+            except Exception as e:
+                print(f'{name:>14}: could not connect to the storages ({type(e).__name__}: {e})')
+
+
+if __name__ == '__main__':
+    main()
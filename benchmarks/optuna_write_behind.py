@@ -0,0 +1,61 @@
+"""
+Time per trial of the plain Optuna storage and of the write-behind storage.
+
+Every trial suggests --params parameters and reports --steps intermediate values, like a model
+trained for some epochs. With the plain storage each of them is a separate transaction. With
+the write-behind storage they are written together when the trial finishes.
+
+    python benchmarks/optuna_write_behind.py --trials 30 --params 10 --steps 50
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import optuna
+
+from snapper_ml.optuna.storages import WriteBehindStorage
+
+
+def run(storage, num_trials: int, num_params: int, num_steps: int) -> float:
+    study = optuna.create_study(study_name='write-behind', storage=storage,
+                                sampler=optuna.samplers.RandomSampler(seed=0))
+
+    def objective(trial: optuna.Trial) -> float:
+        params = [trial.suggest_float(f'x{i}', 0, 1) for i in range(num_params)]
+        for step in range(num_steps):
+            trial.report(sum(params) / (step + 1), step)
+        return sum(params)
+
+    start = time.perf_counter()
+    study.optimize(objective, n_trials=num_trials)
+    return (time.perf_counter() - start) / num_trials
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=30)
+    parser.add_argument('--params', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--storage', default=None, help='Database URL. A temporary SQLite file by default')
+    args = parser.parse_args()
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as folder:
+        results = {}
+        for method in ['plain', 'write-behind']:
+            url = args.storage or f'sqlite:///{folder}/{method}.db'
+            if 'write-behind' in optuna.get_all_study_names(url):
+                optuna.delete_study(study_name='write-behind', storage=url)
+            storage = WriteBehindStorage(url) if method == 'write-behind' else url
+            results[method] = run(storage, args.trials, args.params, args.steps)
+            print(f'{method:>12}: {1000 * results[method]:8.1f} ms per trial')
+        print(f'The write-behind storage is {results["plain"] / results["write-behind"]:.1f}x faster per trial')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Per-trial framework overhead of a group, with warm worker actors and with one setup per trial.
+
+The objective does no work, so the time per trial is the overhead of the framework: process setup,
+MLflow run, autologging, system info and Optuna storage. The "cold" method emulates the previous
+behaviour, where every lease was a new Ray task that repeated the process-level setup and collected
+the system info again. The "warm" method runs the trials in a pool of GroupWorker actors.
+
+    python benchmarks/trial_overhead.py --trials 40 --workers 2
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import ray
+
+from snapper_ml.callbacks.core import CallbacksHandler
+from snapper_ml.config.models import GroupConfig, Settings
+from snapper_ml.experiments import GroupWorker
+from snapper_ml.mlflow import create_mlflow_experiment
+from snapper_ml.optuna import create_optuna_study
+from snapper_ml.scheduler import TrialScheduler
+
+
+def objective(x: float):
+    return {'score': x}
+
+
+def _worker_kwargs(config: GroupConfig) -> dict:
+    return dict(func=objective,
+                group_config=config,
+                shared_data=None,
+                autologging_backends=None,
+                callbacks_handler=CallbacksHandler(callbacks=[], config=config),
+                log_seeds=True,
+                delete_if_failed=False,
+                log_system_info=True)
+
+
+@ray.remote(num_cpus=1)
+def cold_lease(study, num_trials: int, kwargs: dict):
+    from snapper_ml import mlflow as snapper_mlflow
+    # Forget everything this process already did, like a fresh setup per lease
+    snapper_mlflow._get_system_info.cache_clear()
+    snapper_mlflow._autologged_backends.clear()
+    GroupWorker(**kwargs).run_trials(study, num_trials)
+
+
+def run(method: str, config: GroupConfig, settings: Settings, num_workers: int) -> float:
+    create_mlflow_experiment(config.name, settings)
+    study = create_optuna_study(config, settings)
+    kwargs = _worker_kwargs(config)
+
+    if method == 'warm':
+        workers = [ray.remote(num_cpus=1)(GroupWorker).remote(**kwargs) for _ in range(num_workers)]
+        ray.get([worker.__ray_ready__.remote() for worker in workers])
+        submit = lambda worker, num_trials: worker.run_trials.remote(study, num_trials)
+    else:
+        workers = list(range(num_workers))
+        submit = lambda worker, num_trials: cold_lease.remote(study, num_trials, kwargs)
+
+    start = time.perf_counter()
+    TrialScheduler(workers, submit, num_trials=config.num_trials).run()
+    elapsed = time.perf_counter() - start
+    # Each worker runs trials one after another, so this is the overhead paid by every trial
+    per_trial = elapsed * num_workers / config.num_trials
+    print(f'{method:>5}: {config.num_trials} trials in {elapsed:6.2f}s, {1000 * per_trial:8.1f} ms per trial')
+    return per_trial
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.environ['MLFLOW_TRACKING_URI'] = f'sqlite:///{folder}/mlflow.db'
+        settings = Settings(MLFLOW_TRACKING_URI=os.environ['MLFLOW_TRACKING_URI'],
+                            OPTUNA_STORAGE_URI=f'sqlite:///{folder}/optuna.db')
+        ray.init(num_cpus=args.workers, include_dashboard=False, log_to_driver=False,
+                 runtime_env={'env_vars': {'PYTHONPATH': ROOT}})
+
+        try:
+            results = {}
+            for method in ['cold', 'warm']:
+                config = GroupConfig(name=f'trial-overhead-{method}',
+                                     num_trials=args.trials,
+                                     param_space={'x': 'uniform(0, 1)'},
+                                     metric={'name': 'score', 'direction': 'maximize'},
+                                     run=[__file__])
+                results[method] = run(method, config, settings, args.workers)
+            print(f'Warm workers reduce the per-trial overhead {results["cold"] / results["warm"]:.1f}x')
+        finally:
+            ray.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Checkpoints of the trials of a group, to pause them and resume them later on any worker.
+
+With ASHA (the ``asha`` field of the group), trials are paused at every rung and only the promoted
+ones continue. The main function saves its state with :func:`save` before yielding the results of
+every step, and loads it with :func:`load` when it starts::
+
+    @job
+    def main(lr: float, epochs: int = 81):
+        model, first_epoch = build_model(lr), 0
+        state = checkpoint.load()
+        if state:
+            model.set_weights(state['weights'])
+            first_epoch = state['epoch']
+
+        for epoch in range(first_epoch, epochs):
+            loss = train_epoch(model)
+            checkpoint.save({'weights': model.get_weights(), 'epoch': epoch + 1})
+            yield {'loss': loss}
+
+Saving is cheap: the state is only kept in memory, and written (pickled, as an artifact of the
+MLflow run of the trial) when the trial is paused. A promoted trial continues its MLflow run.
+"""
+import os
+import pickle
+import tempfile
+from typing import *
+
+import mlflow
+from mlflow.exceptions import MlflowException
+
+from .loggings import logger
+
+CHECKPOINT_DIR = 'checkpoint'
+CHECKPOINT_FILE = 'checkpoint.pkl'
+
+_NOT_SAVED = object()
+_loaded: Any = None
+_saved: Any = _NOT_SAVED
+
+
+def save(state: Any):
+    """
+    Save the state needed to resume the trial after the current step. It must be picklable.
+
+    :param state: State of the trial, like the weights of the model and the number of steps run
+    """
+    global _saved
+    _saved = state
+
+
+def load() -> Optional[Any]:
+    """
+    State saved by the trial before it was paused, or None if the trial starts from the first step.
+    """
+    return _loaded
+
+
+def reset():
+    """
+    Forget the saved and loaded states, before a trial starts.
+    """
+    global _loaded, _saved
+    _loaded, _saved = None, _NOT_SAVED
+
+
+def restore(run_id: str):
+    """
+    Load the checkpoint stored in an MLflow run, to be returned by :func:`load`.
+    """
+    reset()
+    global _loaded
+    try:
+        path = mlflow.artifacts.download_artifacts(run_id=run_id,
+                                                   artifact_path=f'{CHECKPOINT_DIR}/{CHECKPOINT_FILE}')
+    except (MlflowException, OSError):
+        logger.warning(f'The MLflow run {run_id} has no checkpoint. The trial starts from the first step')
+        return
+    with open(path, 'rb') as f:
+        _loaded = pickle.load(f)
+
+
+def store() -> bool:
+    """
+    Write the last saved state to the active MLflow run.
+
+    :return: Whether the trial saved a state
+    """
+    if _saved is _NOT_SAVED:
+        return False
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, CHECKPOINT_FILE)
+        with open(path, 'wb') as f:
+            pickle.dump(_saved, f)
+        mlflow.log_artifact(path, artifact_path=CHECKPOINT_DIR)
+    logger.info(f'Checkpoint stored in the MLflow run {mlflow.active_run().info.run_id}')
+    return True
@@ -2,13 +2,40 @@ import os
 from enum import Enum
 from typing import *
 from pydantic import field_validator, model_validator, field_serializer, ConfigDict, BaseModel, PositiveFloat, DirectoryPath, \
-    PositiveInt, FilePath, AnyUrl, FieldValidationInfo
+    PositiveInt, NonNegativeInt, FilePath, AnyUrl, FieldValidationInfo, PrivateAttr
 from ..optuna import SAMPLERS, PRUNERS
+from ..optuna.storages import JOURNAL_SCHEME
 from ..optuna.types import ParamDistribution
+from ..utils import parse_bytes
 from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
-    MLFLOW_TRACKING_URI: str
-    OPTUNA_STORAGE_URI: Optional[str]
+    # If the storage URIs are not given, jobs run in local mode: MLflow runs and Optuna studies
+    # are stored in files under LOCAL_STORAGE_DIR, with no tracking or database servers
+    MLFLOW_TRACKING_URI: Optional[str] = None
+    OPTUNA_STORAGE_URI: Optional[str] = None
+    LOCAL_STORAGE_DIR: str = '.snapper'
+    DATASET_HOLDER_MAX_BYTES: Optional[PositiveInt] = None
+    # Names of the storage URIs that were not given and use the local storage
+    _local_storages: Set[str] = PrivateAttr(default_factory=set)
+
+    @model_validator(mode='after')
+    def use_local_storage(self):
+        local_dir = os.path.abspath(self.LOCAL_STORAGE_DIR)
+        if not self.MLFLOW_TRACKING_URI:
+            self.MLFLOW_TRACKING_URI = 'sqlite:///' + os.path.join(local_dir, 'mlflow.db')
+            self._local_storages.add('MLFLOW_TRACKING_URI')
+        if not self.OPTUNA_STORAGE_URI:
+            self.OPTUNA_STORAGE_URI = JOURNAL_SCHEME + os.path.join(local_dir, 'optuna.journal')
+            self._local_storages.add('OPTUNA_STORAGE_URI')
+        return self
+
+    def is_local(self, storage: str) -> bool:
+        """
+        Whether a storage URI (MLFLOW_TRACKING_URI or OPTUNA_STORAGE_URI) was not given and
+        uses the local storage.
+        """
+        return storage in self._local_storages
+
 
 class JobTypes(Enum):
     JOB = "job"
@@ -16,6 +43,11 @@ class JobTypes(Enum):
     GROUP = "group"
 
 
+class StudyMode(Enum):
+    WORKERS = 'workers'
+    DRIVER = 'driver'
+
+
 class RayConfig(BaseModel):
     address: Optional[str] = None
     num_cpus: Optional[PositiveInt] = None
@@ -41,13 +73,101 @@ class Metric(BaseModel):
     direction: OptimizationDirection = OptimizationDirection.MINIMIZE
     model_config = ConfigDict(extra='forbid')
 
+class DataParser(Enum):
+    FAST = 'fast'
+    GENFROMTXT = 'genfromtxt'
+
+
+class DataType(Enum):
+    FLOAT64 = 'float64'
+    FLOAT32 = 'float32'
+    FLOAT16 = 'float16'
+
+
 class Data(BaseModel):
     folder: Optional[str] = ''
     files: List[str]
+    cache: bool = True
+    parser: DataParser = DataParser.FAST
+    num_workers: Optional[PositiveInt] = None
+    dtype: DataType = DataType.FLOAT64
+    batch_size: Optional[PositiveInt] = None
+    incremental: bool = False
+    persist: bool = False
+    header: bool = False
+    usecols: Optional[List[Union[int, str]]] = None
+    drop_columns: Optional[List[Union[int, str]]] = None
+
+    @model_validator(mode='after')
+    def check_column_selection(self):
+        if self.usecols is not None and self.drop_columns is not None:
+            raise ValueError('usecols and drop_columns fields cannot be used simultaneously. Use one of them.')
+        columns = (self.usecols or []) + (self.drop_columns or [])
+        if not self.header and any(isinstance(c, str) for c in columns):
+            raise ValueError('Columns can only be selected by name when the data files have a header.')
+        if self.incremental and not self.cache:
+            raise ValueError('Incremental loading requires the cache to be enabled.')
+        return self
 
 class WorkerResourcesConfig(BaseModel):
     cpu: PositiveFloat = 1.0
     gpu: float = 0.0
+    # Bytes reserved for every worker, a size like 6GB, or auto to use the peak memory of previous trials
+    memory: Optional[Union[PositiveInt, Literal['auto']]] = None
+    # Threads of the native libraries (BLAS, OpenMP, TensorFlow). auto uses the CPUs of the worker, null doesn't limit them
+    threads: Optional[Union[PositiveInt, Literal['auto']]] = 'auto'
+    # Pin every worker to its own cores, as many as its threads
+    pin_cpus: bool = False
+
+    @field_validator('memory', mode='before')
+    @classmethod
+    def parse_memory(cls, value):
+        if isinstance(value, str):
+            value = value.strip().lower()
+            return value if value == 'auto' else parse_bytes(value)
+        return value
+
+    @property
+    def num_threads(self) -> Optional[int]:
+        if self.threads == 'auto':
+            return max(1, int(self.cpu))
+        return self.threads
+
+    @model_validator(mode='after')
+    def check_pin_cpus(self):
+        if self.pin_cpus and not self.threads:
+            raise ValueError('pin_cpus pins the workers to as many cores as threads. Set threads.')
+        return self
+    model_config = ConfigDict(extra='forbid')
+
+
+class OptunaStorageConfig(BaseModel):
+    history_cache: bool = True
+    write_behind: bool = False
+    flush_interval: Optional[PositiveFloat] = 5.0
+    model_config = ConfigDict(extra='forbid')
+
+
+class ConcurrencyConfig(BaseModel):
+    elastic: bool = True
+    auto_tune: bool = False
+    check_interval: PositiveFloat = 30.0
+    trials_per_level: PositiveInt = 5
+    model_config = ConfigDict(extra='forbid')
+
+
+class AshaConfig(BaseModel):
+    min_resource: PositiveInt = 1
+    reduction_factor: int = 3
+    max_resource: PositiveInt
+
+    @model_validator(mode='after')
+    def check_resources(self):
+        if self.reduction_factor < 2:
+            raise ValueError('reduction_factor must be at least 2')
+        if self.min_resource > self.max_resource:
+            raise ValueError('min_resource cannot be greater than max_resource')
+        return self
     model_config = ConfigDict(extra='forbid')
 
 
@@ -152,10 +272,48 @@ class GroupConfig(JobConfig):
     pruner: Optional[PrunerEnum] = None
     num_trials: PositiveInt
     resources_per_worker: WorkerResourcesConfig = WorkerResourcesConfig()
+    concurrency: ConcurrencyConfig = ConcurrencyConfig()
     timeout_per_trial: Optional[PositiveFloat] = None
+    max_retries: NonNegativeInt = 3
+    # Workers are replaced by new processes after running this number of trials
+    max_trials_per_worker: Optional[PositiveInt] = None
+    # Workers are replaced by new processes when their resident memory reaches this size (bytes or a size like 8GB)
+    max_worker_memory: Optional[PositiveInt] = None
+    trials_per_lease: PositiveInt = 1
+    fresh_start: bool = False
+    study_mode: StudyMode = StudyMode.WORKERS
+    optuna_storage: OptunaStorageConfig = OptunaStorageConfig()
+    asha: Optional[AshaConfig] = None
     param_space: Dict[str, Union[ParamDistribution, List[ParamDistribution]]]
     metric: Optional[Metric] = None
 
+    @field_validator('max_worker_memory', mode='before')
+    @classmethod
+    def parse_max_worker_memory(cls, value):
+        return parse_bytes(value) if isinstance(value, str) else value
+
+    @model_validator(mode='after')
+    def check_auto_memory(self):
+        if self.resources_per_worker.memory == 'auto' and not self.concurrency.elastic:
+            raise ValueError('memory: auto starts more workers once the first trials report their peak memory. '
+                             'It requires concurrency.elastic')
+        return self
+
+    @model_validator(mode='after')
+    def check_asha(self):
+        if self.asha and self.study_mode != StudyMode.DRIVER:
+            raise ValueError('ASHA promotions are decided by the driver. Use study_mode: driver')
+        if self.asha and self.pruner:
+            raise ValueError('asha and pruner fields cannot be used simultaneously. Use one of them.')
+        return self
+
+    @model_validator(mode='after')
+    def check_pruner(self):
+        if self.pruner and self.study_mode == StudyMode.DRIVER:
+            raise ValueError('Workers do not report intermediate values in study_mode: driver, so trials '
+                             'cannot be pruned. Use asha instead, or study_mode: workers')
+        return self
+
     @field_serializer('param_space')
     def serialize(self, paramDistribution : str):
         return paramDistribution
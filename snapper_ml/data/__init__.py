@@ -0,0 +1,421 @@
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from math import ceil
+from typing import Tuple, List, Optional, Iterator, Iterable
+import numpy as np
+from snapper_ml import DataLoader
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+from snapper_ml.config.models import Data, DataParser, DataType
+from .cache import DatasetCache, CacheEntry, iter_row_chunks
+from .manifest import IngestManifest, ManifestRecord
+from .statistics import ColumnStatistics
+from .parsing import read_numeric_text, iter_numeric_text, read_header, resolve_columns
+from ..loggings import logger
+
+Dataset = Tuple[np.ndarray, np.ndarray]
+VALIDATION_SPLIT = 0.2
+SEED = 1234
+DELIMITER = '   '
+DEFAULT_DROP_COLUMNS = [0, 1, 2]
+LABEL_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def find_data_files(data: Data) -> List[str]:
+    train_files = []
+    for file_pattern in data.files:
+        glob_pattern = os.path.join(data.folder, file_pattern)
+        matched_files = glob.glob(glob_pattern)
+        train_files.extend(matched_files)
+
+    if not train_files:
+        raise ValueError(f"No train files loaded.")
+
+    return train_files
+
+
+def select_columns(path: str, data: Data) -> List[int]:
+    """
+    Indices of the columns of *path* that are kept according to the
+    usecols or drop_columns fields of *data*.
+    """
+    names, num_columns = read_header(path, DELIMITER, data.header)
+
+    if data.usecols is not None:
+        return resolve_columns(data.usecols, names, num_columns)
+
+    drop_columns = DEFAULT_DROP_COLUMNS if data.drop_columns is None else data.drop_columns
+    dropped = set(resolve_columns(drop_columns, names, num_columns))
+    return [i for i in range(num_columns) if i not in dropped]
+
+
+def parse_dtype(data: Data) -> np.dtype:
+    # Raw values may overflow half precision, so float16 is only applied after scaling
+    return np.dtype(np.float32 if data.dtype == DataType.FLOAT16 else data.dtype.value)
+
+
+def label_dtype(num_classes: int, data: Data) -> np.dtype:
+    """
+    Smallest signed integer type that fits *num_classes* labels. Full precision
+    datasets keep the default integer type.
+    """
+    if data.dtype == DataType.FLOAT64:
+        return np.dtype(int)
+    return next(np.dtype(t) for t in LABEL_DTYPES if np.iinfo(t).max >= num_classes - 1)
+
+
+def split_indices(num_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Train and validation row indices. They are the same ones that
+    train_test_split(test_size=VALIDATION_SPLIT, random_state=SEED) selects.
+    """
+    num_val = ceil(VALIDATION_SPLIT * num_rows)
+    permutation = np.random.RandomState(SEED).permutation(num_rows)
+    return permutation[num_val:], permutation[:num_val]
+
+
+def split_destination(num_rows: int) -> np.ndarray:
+    """
+    Position of every row in the train rows of :func:`split_indices`, or -(position + 1) in the
+    validation ones.
+    """
+    train_indices, val_indices = split_indices(num_rows)
+    destination = np.empty(num_rows, dtype=np.int64)
+    destination[train_indices] = np.arange(len(train_indices))
+    destination[val_indices] = -1 - np.arange(len(val_indices))
+    return destination
+
+
+def _train_statistics(dataset: np.ndarray,
+                      destination: np.ndarray,
+                      entry: Optional[CacheEntry] = None,
+                      split_key: Optional[str] = None) -> ColumnStatistics:
+    """
+    Statistics of the train rows of *dataset*, the ones with a non-negative *destination*.
+
+    With a cache entry, they are stored in its statistics sidecar under *split_key*, so warm
+    loads build the scaler without reading the data.
+    """
+    def split(chunks: Iterable[np.ndarray]) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        offset = 0
+        for chunk in chunks:
+            yield chunk, destination[offset:offset + len(chunk)] < 0
+            offset += len(chunk)
+
+    if entry is not None:
+        return entry.split_statistics(split_key, split)[0]
+
+    statistics = ColumnStatistics.empty(dataset.shape[1])
+    for chunk, is_validation in split(iter_row_chunks(dataset)):
+        statistics = statistics.merge(ColumnStatistics.from_array(chunk[~is_validation]))
+    return statistics
+
+
+def _split_scaled(datasets: List[np.ndarray],
+                  scaler_class,
+                  data: Data,
+                  entries: Optional[List[CacheEntry]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Split, label and scale the concatenation of *datasets* without materializing it.
+
+    The output buffers are allocated once. The scaler is built from the merged statistics of
+    the training rows of every source (kept in the sidecars of the cache *entries*, if given),
+    and then every source chunk is scaled and scattered into its train and validation positions,
+    so peak memory stays close to the size of the output instead of several full copies.
+    """
+    num_rows = sum(len(dataset) for dataset in datasets)
+    num_columns = datasets[0].shape[1]
+    destination = split_destination(num_rows)
+
+    offsets = np.cumsum([0] + [len(dataset) for dataset in datasets])
+    scaler = ColumnStatistics.merge_all(
+        _train_statistics(dataset, destination[offset:offset + len(dataset)],
+                          entries[i] if entries else None,
+                          f'unified-{SEED}-{VALIDATION_SPLIT}-{num_rows}-{offset}')
+        for i, (dataset, offset) in enumerate(zip(datasets, offsets))
+    ).to_scaler(scaler_class)
+
+    labels_dtype = label_dtype(len(datasets), data)
+    num_train = int(np.count_nonzero(destination >= 0))
+    X_train = np.empty((num_train, num_columns), dtype=data.dtype.value)
+    X_val = np.empty((num_rows - num_train, num_columns), dtype=data.dtype.value)
+    y_train = np.empty(num_train, dtype=labels_dtype)
+    y_val = np.empty(num_rows - num_train, dtype=labels_dtype)
+
+    for i, (dataset, offset) in enumerate(zip(datasets, offsets)):
+        for chunk in iter_row_chunks(dataset):
+            chunk_destination = destination[offset:offset + len(chunk)]
+            offset += len(chunk)
+            is_train = chunk_destination >= 0
+            scaled = scaler.transform(chunk)
+            X_train[chunk_destination[is_train]] = scaled[is_train]
+            X_val[-1 - chunk_destination[~is_train]] = scaled[~is_train]
+            y_train[chunk_destination[is_train]] = i
+            y_val[-1 - chunk_destination[~is_train]] = i
+
+    return X_train, X_val, y_train, y_val
+
+
+def _scale(scaler, X_train: np.ndarray, X_val: np.ndarray, data: Data) -> Tuple[np.ndarray, np.ndarray]:
+    X_train = scaler.transform(X_train).astype(data.dtype.value, copy=False)
+    X_val = scaler.transform(X_val).astype(data.dtype.value, copy=False)
+    return X_train, X_val
+
+
+def _parse_options(path: str, data: Data) -> dict:
+    # Both parsers produce the same arrays, so the parser is not part of the cache key
+    return {'delimiter': DELIMITER,
+            'dtype': parse_dtype(data).name,
+            'header': data.header,
+            'usecols': select_columns(path, data)}
+
+
+def _parse_file(path: str, data: Data, parse_options: Optional[dict] = None) -> np.ndarray:
+    options = parse_options or _parse_options(path, data)
+
+    if data.parser == DataParser.GENFROMTXT:
+        return np.genfromtxt(path, delimiter=DELIMITER, dtype=options['dtype'], encoding='utf-8', ndmin=2,
+                             usecols=options['usecols'], skip_header=int(options['header']))
+    return read_numeric_text(path, delimiter=DELIMITER, dtype=options['dtype'],
+                             usecols=options['usecols'], skip_header=options['header'])
+
+
+def _iter_parsed_chunks(path: str, data: Data, parse_options: Optional[dict] = None) -> Iterator[np.ndarray]:
+    options = parse_options or _parse_options(path, data)
+
+    if data.parser == DataParser.GENFROMTXT:
+        yield _parse_file(path, data, options)
+        return
+
+    yield from iter_numeric_text(path, delimiter=DELIMITER, dtype=options['dtype'],
+                                 usecols=options['usecols'], skip_header=options['header'])
+
+
+def iter_file_chunks(path: str, data: Data) -> Iterator[np.ndarray]:
+    """
+    Yield consecutive row blocks of a data file without loading the whole file in memory.
+    When the cache is enabled, a missing entry is stored block by block while parsing.
+    """
+    if not data.cache:
+        yield from _iter_parsed_chunks(path, data)
+        return
+
+    yield from iter_row_chunks(_load_streamed_file(path, data).open())
+
+
+def _load_cached_file(path: str, data: Data) -> CacheEntry:
+    options = _parse_options(path, data)
+    return DatasetCache().load_entry(path, options, partial(_parse_file, data=data, parse_options=options))
+
+
+def _load_streamed_file(path: str, data: Data) -> CacheEntry:
+    # Missing entries are stored block by block, so the file is never fully loaded in memory
+    options = _parse_options(path, data)
+    return DatasetCache().load_entry(path, options, partial(_iter_parsed_chunks, data=data, parse_options=options))
+
+
+def load_file(path: str, data: Data) -> np.ndarray:
+    """
+    Parse a single data file, going through the dataset cache when it is enabled.
+    Cached files are returned as read-only memory-mapped arrays.
+    """
+    if not data.cache:
+        return _parse_file(path, data)
+    return _load_cached_file(path, data).open()
+
+
+def _get_num_workers(data: Data, num_files: int) -> int:
+    return max(1, min(data.num_workers or os.cpu_count() or 1, num_files))
+
+
+def _map_files(func, paths: List[str], data: Data) -> list:
+    num_workers = _get_num_workers(data, len(paths))
+
+    if num_workers == 1:
+        return [func(path, data) for path in paths]
+
+    logger.info(f'Loading {len(paths)} files using {num_workers} processes...')
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(func, paths, repeat(data)))
+
+
+def load_entries(paths: List[str], data: Data) -> List[CacheEntry]:
+    """
+    Parse and cache several data files concurrently in a process pool.
+    Cached files are not parsed again.
+    """
+    return _map_files(_load_cached_file, paths, data)
+
+
+def stream_entries(paths: List[str], data: Data) -> List[CacheEntry]:
+    """
+    Same as :func:`load_entries`, but missing entries are parsed and stored block by block,
+    so files larger than memory can be cached.
+    """
+    return _map_files(_load_streamed_file, paths, data)
+
+
+def load_files(paths: List[str], data: Data) -> List[np.ndarray]:
+    """
+    Parse several data files concurrently in a process pool.
+
+    When the cache is enabled, workers only store the parsed arrays in the cache
+    and this process memory-maps them, so arrays are never sent through pipes.
+    """
+    if data.cache:
+        return [entry.open() for entry in load_entries(paths, data)]
+    return _map_files(_parse_file, paths, data)
+
+
+def split_chunks(chunks: Iterable[np.ndarray], seed: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Attach a validation mask to consecutive row blocks of a file.
+
+    Every row is assigned independently by a generator seeded with SEED and *seed*, so the
+    split of a file doesn't depend on the rest of files and every pass selects the same rows.
+    """
+    rng = np.random.default_rng([SEED, seed])
+    for chunk in chunks:
+        yield chunk, rng.random(len(chunk)) < VALIDATION_SPLIT
+
+
+def split_statistics(entry: CacheEntry, seed: int) -> Tuple[ColumnStatistics, ColumnStatistics]:
+    """
+    Statistics of the train and validation rows of a cached file for the split drawn with *seed*
+    (see :func:`split_chunks`). They are stored in the statistics sidecar of the entry, so they
+    are only computed the first time.
+    """
+    split_key = f'rows-{SEED}-{seed}-{VALIDATION_SPLIT}'
+    return entry.split_statistics(split_key, partial(split_chunks, seed=seed))
+
+
+def ingest_files(data: Data) -> IngestManifest:
+    """
+    Bring the ingest manifest of *data* up to date with the files that currently match it.
+
+    Only new or modified files are parsed, and only their split and training statistics
+    are computed. The records of unchanged files are kept as they are.
+    """
+    manifest = IngestManifest.open(data)
+    files = find_data_files(data)
+    changes = manifest.diff(files)
+    cache = DatasetCache()
+
+    # Records whose cache entry was evicted need to be ingested again, unless their file was removed
+    missing = [path for path, record in manifest.records.items()
+               if path not in changes.modified and path not in changes.removed
+               and not cache.get_by_key(record.cache_key)]
+    to_ingest = changes.new + changes.modified + missing
+
+    if not to_ingest and not changes.removed:
+        logger.info(f'All {len(files)} data files were already ingested')
+        return manifest
+
+    logger.info(f'Ingesting data files: {len(changes.new)} new, {len(changes.modified)} modified, '
+                f'{len(missing)} evicted from cache and {len(changes.removed)} removed')
+    manifest.remove(changes.removed)
+
+    for path, entry in zip(to_ingest, load_entries(to_ingest, data)):
+        label = manifest.label_for(path)
+        train_statistics, _ = split_statistics(entry, label)
+        manifest.records[path] = ManifestRecord(fingerprint=entry.fingerprint,
+                                                cache_key=entry.key,
+                                                label=label,
+                                                num_rows=entry.shape[0],
+                                                num_train_rows=train_statistics.count,
+                                                statistics=train_statistics)
+
+    manifest.save()
+    return manifest
+
+
+def load_incremental(data: Data, scaler_class) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Incremental counterpart of UnifiedDataLoader.load_data.
+
+    The split of every file is drawn independently (see :func:`split_chunks`) and the scaler is
+    built from the merged training statistics of the manifest, so adding a file only requires
+    parsing that file. Labels follow the ingestion order of the files, and rows are grouped by file.
+    """
+    manifest = ingest_files(data)
+    records = manifest.sorted_records()
+    cache = DatasetCache()
+    scaler = ColumnStatistics.merge_all(record.statistics for record in records).to_scaler(scaler_class)
+    labels_dtype = label_dtype(len(records), data)
+    num_train = sum(record.num_train_rows for record in records)
+    num_val = sum(record.num_rows - record.num_train_rows for record in records)
+    num_columns = len(records[0].statistics.sum)
+
+    X_train = np.empty((num_train, num_columns), dtype=data.dtype.value)
+    X_val = np.empty((num_val, num_columns), dtype=data.dtype.value)
+    y_train = np.empty(num_train, dtype=labels_dtype)
+    y_val = np.empty(num_val, dtype=labels_dtype)
+    train_offset, val_offset = 0, 0
+
+    for label, record in enumerate(records):
+        array = cache.get_by_key(record.cache_key).open()
+        for chunk, is_validation in split_chunks(iter_row_chunks(array), record.label):
+            scaled = scaler.transform(chunk)
+            train_rows, val_rows = scaled[~is_validation], scaled[is_validation]
+            X_train[train_offset:train_offset + len(train_rows)] = train_rows
+            X_val[val_offset:val_offset + len(val_rows)] = val_rows
+            y_train[train_offset:train_offset + len(train_rows)] = label
+            y_val[val_offset:val_offset + len(val_rows)] = label
+            train_offset += len(train_rows)
+            val_offset += len(val_rows)
+
+    return X_train, X_val, y_train, y_val
+
+
+def warm_cache(data: Data) -> List[str]:
+    """
+    Parse and cache every file matched by *data*, so later loads skip parsing.
+
+    :return: The list of matched files
+    """
+    files = find_data_files(data)
+    load_files(files, data.model_copy(update={'cache': True}))
+    return files
+
+
+class SplitDataLoader(DataLoader):
+    @classmethod
+    def load_data(cls) -> Tuple[List[Dataset], List[Dataset]]:
+        train_files = find_data_files(cls.data)
+        entries = load_entries(train_files, cls.data) if cls.data.cache else None
+        datasets = [entry.open() for entry in entries] if entries else load_files(train_files, cls.data)
+        labels_dtype = label_dtype(len(datasets), cls.data)
+        train_datasets, val_datasets, = [], []
+        for i, dataset in enumerate(datasets):
+            class_vector = np.full(dataset.shape[0], i, dtype=labels_dtype)
+            X_train, X_val, y_train, y_val = train_test_split(dataset, class_vector,
+                                                              test_size=VALIDATION_SPLIT,
+                                                              random_state=SEED)
+            statistics = _train_statistics(dataset, split_destination(len(dataset)),
+                                           entries[i] if entries else None,
+                                           f'split-{SEED}-{VALIDATION_SPLIT}')
+            X_train, X_val = _scale(statistics.to_scaler(MinMaxScaler), X_train, X_val, cls.data)
+            train_datasets.append((X_train, y_train))
+            val_datasets.append((X_val, y_val))
+
+        return train_datasets, val_datasets
+
+
+class UnifiedDataLoader(DataLoader):
+    @classmethod
+    def load_data(cls) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if cls.data.incremental:
+            return load_incremental(cls.data, StandardScaler)
+
+        train_files = find_data_files(cls.data)
+        if cls.data.cache:
+            entries = load_entries(train_files, cls.data)
+            return _split_scaled([entry.open() for entry in entries], StandardScaler, cls.data, entries)
+        return _split_scaled(load_files(train_files, cls.data), StandardScaler, cls.data)
+
+
+from .streaming import StreamingDataLoader, StreamingDataset
@@ -0,0 +1,371 @@
+"""
+Persistent on-disk cache for parsed dataset files.
+
+Parsing the raw text files is by far the most expensive step of loading a dataset,
+so every parsed file is stored as a binary ``.npy`` array that can be memory-mapped
+by later loads. Entries are keyed by the path, size, modification time and content
+hash of the source file, together with the options used to parse it, so a modified
+file or a different parsing configuration never hits a stale entry.
+
+Every entry also has a statistics sidecar with the per-column statistics of the file
+(and of the partitions of the splits it has been used with), so scalers can be built
+and datasets inspected without another pass over the data.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from dataclasses import dataclass, asdict, field
+from typing import *
+
+import numpy as np
+
+from .statistics import ColumnStatistics
+from ..loggings import logger
+
+CACHE_DIR_ENV = 'SNAPPER_ML_CACHE_DIR'
+DEFAULT_CACHE_DIR = './artifacts/cache'
+ARRAY_FILENAME = 'data.npy'
+META_FILENAME = 'meta.json'
+STATISTICS_FILENAME = 'statistics.json'
+HASH_CHUNK_SIZE = 1 << 20
+CHUNK_ROWS = 1 << 16
+
+ParseOptions = Dict[str, Any]
+SplitFunction = Callable[[Iterable[np.ndarray]], Iterator[Tuple[np.ndarray, np.ndarray]]]
+
+
+def get_cache_dir() -> str:
+    return os.getenv(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_row_chunks(array: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> Iterator[np.ndarray]:
+    """
+    Yield consecutive blocks of at most *chunk_rows* rows of *array*.
+
+    Memory-mapped arrays are read with regular file reads instead of through the mapping,
+    so a full pass over a cached file does not leave all of its pages resident.
+    """
+    num_rows = len(array)
+    is_readable_memmap = isinstance(array, np.memmap) and array.filename and array.flags.c_contiguous
+
+    if not is_readable_memmap:
+        for start in range(0, num_rows, chunk_rows):
+            yield array[start:start + chunk_rows]
+        return
+
+    row_shape = array.shape[1:]
+    row_size = int(np.prod(row_shape, dtype=np.int64))
+    with open(array.filename, 'rb') as f:
+        for start in range(0, num_rows, chunk_rows):
+            rows = min(chunk_rows, num_rows - start)
+            f.seek(array.offset + start * row_size * array.dtype.itemsize)
+            yield np.fromfile(f, dtype=array.dtype, count=rows * row_size).reshape(rows, *row_shape)
+
+
+@dataclass(frozen=True)
+class FileFingerprint:
+    """
+    Identity of a source file: absolute path, size, modification time and content hash.
+    """
+    path: str
+    size: int
+    mtime_ns: int
+    digest: str
+
+    @classmethod
+    def from_path(cls, path: str) -> 'FileFingerprint':
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return cls(path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns, digest=_hash_file(path))
+
+    def matches(self, path: Optional[str] = None) -> bool:
+        """
+        Whether the file on disk still has the same size and modification time.
+        It does not re-hash the contents, so it is cheap enough to be used for listings.
+        """
+        try:
+            stat = os.stat(path or self.path)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    directory: str
+    fingerprint: FileFingerprint
+    parse_options: ParseOptions
+    shape: Tuple[int, ...]
+    dtype: str
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def array_path(self) -> str:
+        return os.path.join(self.directory, ARRAY_FILENAME)
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape, dtype=np.int64)) * np.dtype(self.dtype).itemsize
+
+    def open(self, mmap_mode: Optional[str] = 'r') -> np.ndarray:
+        return np.load(self.array_path, mmap_mode=mmap_mode)
+
+    @property
+    def statistics_path(self) -> str:
+        return os.path.join(self.directory, STATISTICS_FILENAME)
+
+    def _read_sidecar(self) -> dict:
+        try:
+            with open(self.statistics_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_sidecar(self, sidecar: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sidecar, f)
+        os.replace(tmp_path, self.statistics_path)
+
+    def statistics(self) -> ColumnStatistics:
+        """
+        Statistics of the whole file. They are computed when the entry is stored.
+        """
+        sidecar = self._read_sidecar()
+        if 'all' not in sidecar:
+            stats = ColumnStatistics.merge_all(ColumnStatistics.from_array(chunk)
+                                               for chunk in iter_row_chunks(self.open()))
+            sidecar['all'] = stats.to_dict()
+            self._write_sidecar(sidecar)
+        return ColumnStatistics.from_dict(sidecar['all'])
+
+    def split_statistics(self, split_key: str, split: SplitFunction) -> Tuple[ColumnStatistics, ColumnStatistics]:
+        """
+        Statistics of the train and validation partitions of the file, computed only
+        the first time the entry is used with a split.
+
+        :param split_key: Unique name of the split, used as key in the sidecar
+        :param split: Function that attaches a validation mask to every row block of the file
+        """
+        sidecar = self._read_sidecar()
+        splits = sidecar.setdefault('splits', {})
+
+        if split_key not in splits:
+            num_columns = self.shape[1]
+            train, validation = ColumnStatistics.empty(num_columns), ColumnStatistics.empty(num_columns)
+            for chunk, is_validation in split(iter_row_chunks(self.open())):
+                train = train.merge(ColumnStatistics.from_array(chunk[~is_validation]))
+                validation = validation.merge(ColumnStatistics.from_array(chunk[is_validation]))
+            splits[split_key] = {'train': train.to_dict(), 'validation': validation.to_dict()}
+            self._write_sidecar(sidecar)
+
+        return (ColumnStatistics.from_dict(splits[split_key]['train']),
+                ColumnStatistics.from_dict(splits[split_key]['validation']))
+
+    def to_dict(self) -> dict:
+        result = asdict(self)
+        result.pop('directory')
+        return result
+
+    @classmethod
+    def from_directory(cls, directory: str) -> 'CacheEntry':
+        with open(os.path.join(directory, META_FILENAME)) as f:
+            meta = json.load(f)
+        meta['fingerprint'] = FileFingerprint(**meta['fingerprint'])
+        meta['shape'] = tuple(meta['shape'])
+        return cls(directory=directory, **meta)
+
+
+class DatasetCache:
+    """
+    Directory of cached parsed arrays, one sub-directory per entry.
+
+    Entries are written to a temporary directory first and then renamed, so concurrent
+    processes warming the same file never observe a partially written entry.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = os.path.abspath(root or get_cache_dir())
+
+    @staticmethod
+    def make_key(fingerprint: FileFingerprint, parse_options: ParseOptions) -> str:
+        payload = json.dumps({'fingerprint': asdict(fingerprint), 'parse_options': parse_options},
+                             sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _entry_directory(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, fingerprint: FileFingerprint, parse_options: ParseOptions) -> Optional[CacheEntry]:
+        return self.get_by_key(self.make_key(fingerprint, parse_options))
+
+    def get_by_key(self, key: str) -> Optional[CacheEntry]:
+        directory = self._entry_directory(key)
+        if not os.path.exists(os.path.join(directory, META_FILENAME)):
+            return None
+        try:
+            return CacheEntry.from_directory(directory)
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f'Ignoring corrupted cache entry {directory}: {e}')
+            return None
+
+    def _commit(self, entry: CacheEntry, tmp_directory: str) -> CacheEntry:
+        try:
+            with open(os.path.join(tmp_directory, META_FILENAME), 'w') as f:
+                json.dump(entry.to_dict(), f, indent=2)
+            os.replace(tmp_directory, entry.directory)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            if not os.path.exists(os.path.join(entry.directory, META_FILENAME)):
+                raise
+        return entry
+
+    def _make_tmp_directory(self, key: str) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.mkdtemp(prefix=f'.{key}-', dir=self.root)
+
+    def put(self, fingerprint: FileFingerprint, parse_options: ParseOptions, array: np.ndarray) -> CacheEntry:
+        key = self.make_key(fingerprint, parse_options)
+        tmp_directory = self._make_tmp_directory(key)
+        entry = CacheEntry(key=key,
+                           directory=self._entry_directory(key),
+                           fingerprint=fingerprint,
+                           parse_options=parse_options,
+                           shape=tuple(array.shape),
+                           dtype=array.dtype.str)
+        try:
+            np.save(os.path.join(tmp_directory, ARRAY_FILENAME), array)
+            statistics = [ColumnStatistics.from_array(chunk) for chunk in iter_row_chunks(array)]
+            self._write_statistics(tmp_directory, statistics)
+        except OSError:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            raise
+        return self._commit(entry, tmp_directory)
+
+    @staticmethod
+    def _write_statistics(directory: str, statistics: List[ColumnStatistics]):
+        if statistics:
+            with open(os.path.join(directory, STATISTICS_FILENAME), 'w') as f:
+                json.dump({'all': ColumnStatistics.merge_all(statistics).to_dict()}, f)
+
+    def put_chunks(self,
+                   fingerprint: FileFingerprint,
+                   parse_options: ParseOptions,
+                   chunks: Iterable[np.ndarray]) -> CacheEntry:
+        """
+        Same as :meth:`put`, but the array is given as consecutive row blocks, so files
+        larger than memory can be cached. Blocks are spooled to disk and then copied
+        into the final ``.npy`` file once the number of rows is known.
+        """
+        key = self.make_key(fingerprint, parse_options)
+        tmp_directory = self._make_tmp_directory(key)
+        spool_path = os.path.join(tmp_directory, 'spool.bin')
+        num_rows, row_shape, dtype = 0, None, None
+        statistics = []
+
+        try:
+            with open(spool_path, 'wb') as spool:
+                for chunk in chunks:
+                    row_shape, dtype = chunk.shape[1:], chunk.dtype
+                    num_rows += len(chunk)
+                    np.ascontiguousarray(chunk).tofile(spool)
+                    statistics.append(ColumnStatistics.from_array(chunk))
+
+            if dtype is None:
+                raise ValueError(f'No rows were parsed from {fingerprint.path}')
+
+            array = np.lib.format.open_memmap(os.path.join(tmp_directory, ARRAY_FILENAME), mode='w+',
+                                              dtype=dtype, shape=(num_rows, *row_shape))
+            spooled = np.memmap(spool_path, dtype=dtype, mode='r', shape=(num_rows, *row_shape))
+            for start in range(0, num_rows, CHUNK_ROWS):
+                array[start:start + CHUNK_ROWS] = spooled[start:start + CHUNK_ROWS]
+            array.flush()
+            del array, spooled
+            os.remove(spool_path)
+            self._write_statistics(tmp_directory, statistics)
+        except (OSError, ValueError):
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            raise
+
+        entry = CacheEntry(key=key,
+                           directory=self._entry_directory(key),
+                           fingerprint=fingerprint,
+                           parse_options=parse_options,
+                           shape=(num_rows, *row_shape),
+                           dtype=dtype.str)
+        return self._commit(entry, tmp_directory)
+
+    def load_entry(self,
+                   path: str,
+                   parse_options: ParseOptions,
+                   parser: Callable[[str], Union[np.ndarray, Iterable[np.ndarray]]]) -> CacheEntry:
+        """
+        Return the cache entry of *path*, parsing and storing it only on a cache miss.
+
+        :param path: Source file
+        :param parse_options: Options that affect the parsed result. They are part of the key
+        :param parser: Function that parses the source file into an array, or into an iterator
+               of row blocks. In the latter case, the file is never fully loaded in memory
+        """
+        fingerprint = FileFingerprint.from_path(path)
+        entry = self.get(fingerprint, parse_options)
+
+        if entry:
+            logger.debug(f'Dataset cache hit for {path}')
+        else:
+            logger.info(f'Dataset cache miss for {path}. Parsing file...')
+            parsed = parser(path)
+            if isinstance(parsed, np.ndarray):
+                entry = self.put(fingerprint, parse_options, parsed)
+            else:
+                entry = self.put_chunks(fingerprint, parse_options, parsed)
+
+        return entry
+
+    def load(self,
+             path: str,
+             parse_options: ParseOptions,
+             parser: Callable[[str], np.ndarray],
+             mmap_mode: Optional[str] = 'r') -> np.ndarray:
+        """
+        Same as :meth:`load_entry`, but it returns the array opened with *mmap_mode*.
+        """
+        return self.load_entry(path, parse_options, parser).open(mmap_mode=mmap_mode)
+
+    def entries(self) -> List[CacheEntry]:
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for name in sorted(os.listdir(self.root)):
+            directory = self._entry_directory(name)
+            if name.startswith('.') or not os.path.exists(os.path.join(directory, META_FILENAME)):
+                continue
+            try:
+                entries.append(CacheEntry.from_directory(directory))
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f'Ignoring corrupted cache entry {directory}: {e}')
+        return entries
+
+    def evict(self, predicate: Callable[[CacheEntry], bool] = lambda entry: True) -> List[CacheEntry]:
+        """
+        Remove every entry for which *predicate* returns True.
+
+        :return: The list of removed entries
+        """
+        evicted = [entry for entry in self.entries() if predicate(entry)]
+        for entry in evicted:
+            shutil.rmtree(entry.directory, ignore_errors=True)
+        return evicted
@@ -0,0 +1,124 @@
+"""
+Manifest of the files already ingested for a data configuration.
+
+When files are added to a data folder over time, the manifest makes reloading incremental:
+unchanged files are identified by their size and modification time, so they are neither hashed
+nor parsed again, and their split and training statistics are reused. Only new or modified files
+are parsed (and cached), and their statistics are merged into the existing ones.
+"""
+import os
+import json
+import hashlib
+import tempfile
+from dataclasses import dataclass, asdict
+from typing import *
+
+from snapper_ml.config.models import Data
+from .cache import FileFingerprint, get_cache_dir
+from .statistics import ColumnStatistics
+
+MANIFESTS_DIRNAME = 'manifests'
+# Fields that don't change the parsed values, or the split, do not identify a different dataset
+LOADING_OPTIONS = {'cache', 'num_workers', 'parser', 'batch_size', 'persist'}
+
+
+def data_fingerprint(data: Data, **extra: Any) -> str:
+    """
+    Hash of the fields of *data* that define the loaded values, along with any other *extra*
+    JSON-serializable values that identify them.
+    """
+    config = data.model_dump(mode='json', exclude=LOADING_OPTIONS)
+    config['folder'] = os.path.abspath(data.folder or '.')
+    payload = json.dumps({'config': config, **extra}, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+@dataclass
+class ManifestRecord:
+    fingerprint: FileFingerprint
+    cache_key: str
+    label: int
+    num_rows: int
+    num_train_rows: int
+    statistics: ColumnStatistics
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'statistics': self.statistics.to_dict()}
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'ManifestRecord':
+        return cls(**{**values,
+                      'fingerprint': FileFingerprint(**values['fingerprint']),
+                      'statistics': ColumnStatistics.from_dict(values['statistics'])})
+
+
+@dataclass
+class ManifestChanges:
+    new: List[str]
+    modified: List[str]
+    removed: List[str]
+
+    def __bool__(self):
+        return bool(self.new or self.modified or self.removed)
+
+
+class IngestManifest:
+    """
+    JSON file, stored next to the dataset cache, with one record per ingested file.
+
+    Labels are assigned once, in ingestion order, so adding files never changes
+    the label (or the split) of the files already ingested.
+    """
+
+    def __init__(self, path: str, records: Optional[Dict[str, ManifestRecord]] = None, next_label: int = 0):
+        self.path = path
+        self.records = records or {}
+        self.next_label = next_label
+
+    @staticmethod
+    def manifest_id(data: Data) -> str:
+        return data_fingerprint(data)
+
+    @classmethod
+    def open(cls, data: Data, root: Optional[str] = None) -> 'IngestManifest':
+        directory = os.path.join(os.path.abspath(root or get_cache_dir()), MANIFESTS_DIRNAME)
+        path = os.path.join(directory, f'{cls.manifest_id(data)}.json')
+
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path) as f:
+            content = json.load(f)
+
+        records = {k: ManifestRecord.from_dict(v) for k, v in content['records'].items()}
+        return cls(path, records, content['next_label'])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        content = {'next_label': self.next_label,
+                   'records': {k: v.to_dict() for k, v in self.records.items()}}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp_path, self.path)
+
+    def diff(self, files: Iterable[str]) -> ManifestChanges:
+        paths = [os.path.abspath(file) for file in files]
+        new = [path for path in paths if path not in self.records]
+        modified = [path for path in paths if path in self.records and not self.records[path].fingerprint.matches()]
+        removed = sorted(set(self.records) - set(paths))
+        return ManifestChanges(new=new, modified=modified, removed=removed)
+
+    def label_for(self, path: str) -> int:
+        if path in self.records:
+            return self.records[path].label
+        label = self.next_label
+        self.next_label += 1
+        return label
+
+    def remove(self, paths: Iterable[str]):
+        for path in paths:
+            self.records.pop(path, None)
+
+    def sorted_records(self) -> List[ManifestRecord]:
+        return sorted(self.records.values(), key=lambda record: record.label)
@@ -0,0 +1,119 @@
+"""
+Per-column statistics that can be computed independently per file and merged algebraically.
+"""
+from dataclasses import dataclass
+from typing import *
+
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+
+@dataclass
+class ColumnStatistics:
+    """
+    Count, sum, sum of squared deviations from the mean (M2), minimum and maximum of every column.
+
+    Unlike the raw sum of squares, M2 can be merged without catastrophic cancellation
+    (Chan et al. parallel algorithm).
+    """
+    count: int
+    sum: np.ndarray
+    m2: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+
+    @classmethod
+    def empty(cls, num_columns: int) -> 'ColumnStatistics':
+        return cls(count=0,
+                   sum=np.zeros(num_columns),
+                   m2=np.zeros(num_columns),
+                   min=np.full(num_columns, np.inf),
+                   max=np.full(num_columns, -np.inf))
+
+    @classmethod
+    def from_array(cls, X: np.ndarray) -> 'ColumnStatistics':
+        if not len(X):
+            return cls.empty(X.shape[1])
+        X = np.asarray(X, dtype=np.float64)
+        mean = X.mean(axis=0)
+        return cls(count=len(X),
+                   sum=X.sum(axis=0),
+                   m2=((X - mean) ** 2).sum(axis=0),
+                   min=X.min(axis=0),
+                   max=X.max(axis=0))
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.sum / max(self.count, 1)
+
+    @property
+    def var(self) -> np.ndarray:
+        return self.m2 / max(self.count, 1)
+
+    def merge(self, other: 'ColumnStatistics') -> 'ColumnStatistics':
+        if not other.count:
+            return self
+        if not self.count:
+            return other
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        return ColumnStatistics(count=count,
+                                sum=self.sum + other.sum,
+                                m2=m2,
+                                min=np.minimum(self.min, other.min),
+                                max=np.maximum(self.max, other.max))
+
+    __add__ = merge
+
+    @classmethod
+    def merge_all(cls, statistics: Iterable['ColumnStatistics']) -> 'ColumnStatistics':
+        result = None
+        for stats in statistics:
+            result = stats if result is None else result.merge(stats)
+        if result is None:
+            raise ValueError('At least one ColumnStatistics instance is required')
+        return result
+
+    def to_dict(self) -> dict:
+        return {'count': self.count,
+                'sum': self.sum.tolist(),
+                'm2': self.m2.tolist(),
+                'min': self.min.tolist(),
+                'max': self.max.tolist()}
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'ColumnStatistics':
+        return cls(count=int(values['count']),
+                   **{k: np.asarray(values[k], dtype=np.float64) for k in ['sum', 'm2', 'min', 'max']})
+
+    def to_scaler(self, scaler_class=StandardScaler):
+        """
+        Build a fitted StandardScaler or MinMaxScaler without another pass over the data.
+        """
+        num_columns = len(self.sum)
+
+        if issubclass(scaler_class, StandardScaler):
+            scaler = scaler_class()
+            scaler.mean_ = self.mean
+            scaler.var_ = self.var
+            # Same handling of constant columns as StandardScaler.fit
+            scale = np.sqrt(self.var)
+            scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+            scaler.scale_ = scale
+        elif issubclass(scaler_class, MinMaxScaler):
+            scaler = scaler_class()
+            feature_min, feature_max = scaler.feature_range
+            data_range = self.max - self.min
+            safe_range = np.where(data_range == 0.0, 1.0, data_range)
+            scaler.data_min_ = self.min
+            scaler.data_max_ = self.max
+            scaler.data_range_ = data_range
+            scaler.scale_ = (feature_max - feature_min) / safe_range
+            scaler.min_ = feature_min - self.min * scaler.scale_
+        else:
+            raise ValueError(f'Scaler {scaler_class.__name__} cannot be built from column statistics')
+
+        scaler.n_samples_seen_ = self.count
+        scaler.n_features_in_ = num_columns
+        return scaler
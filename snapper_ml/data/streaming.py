@@ -0,0 +1,196 @@
+"""
+Out-of-core data loading.
+
+:class:`StreamingDataLoader` never loads the whole dataset in memory. Its load_data method
+only fits the scaler, in a single pass over the training rows (or none at all when the statistics
+of the files are already in the dataset cache), and returns a small
+:class:`StreamingDataset` that is shared with the workers instead of the data itself.
+The main function then iterates over fixed-size batches that are read from disk on demand.
+"""
+import os
+from typing import *
+
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from snapper_ml import DataLoader
+from snapper_ml.config.models import Data
+from . import find_data_files, iter_file_chunks, label_dtype, stream_entries, split_chunks, split_statistics
+from .cache import CacheEntry, iter_row_chunks
+from .statistics import ColumnStatistics
+from ..loggings import logger
+
+Batch = Tuple[np.ndarray, np.ndarray]
+DEFAULT_BATCH_SIZE = 1024
+
+
+def _rebatch(pieces: Iterable[Batch], batch_size: int, drop_last: bool = False) -> Iterator[Batch]:
+    """
+    Regroup a stream of (X, y) pieces of any size into batches of exactly *batch_size* rows
+    (except for the last one, unless *drop_last* is true).
+    """
+    pending, num_pending = [], 0
+
+    for X, y in pieces:
+        pending.append((X, y))
+        num_pending += len(X)
+
+        if num_pending >= batch_size:
+            X = np.concatenate([X for X, _ in pending])
+            y = np.concatenate([y for _, y in pending])
+            full_rows = (num_pending // batch_size) * batch_size
+            for start in range(0, full_rows, batch_size):
+                yield X[start:start + batch_size], y[start:start + batch_size]
+            pending = [(X[full_rows:], y[full_rows:])] if full_rows < num_pending else []
+            num_pending -= full_rows
+
+    if num_pending and not drop_last:
+        yield np.concatenate([X for X, _ in pending]), np.concatenate([y for _, y in pending])
+
+
+class StreamingDataset:
+    """
+    Picklable handle to a dataset that is read in batches.
+
+    The validation split is drawn per row from a seeded generator, so every pass
+    over the files selects exactly the same rows without storing any index.
+
+    With the cache enabled, *cached_arrays* are the paths of the cached arrays of the files,
+    which every pass reads directly instead of looking up the cache entries again.
+    """
+
+    def __init__(self, files: List[str], data: Data, scaler, num_train_rows: int, num_validation_rows: int,
+                 cached_arrays: Optional[List[str]] = None):
+        self.files = files
+        self.cached_arrays = cached_arrays
+        self.data = data
+        self.scaler = scaler
+        self.num_train_rows = num_train_rows
+        self.num_validation_rows = num_validation_rows
+        self.labels_dtype = label_dtype(len(files), data)
+
+    @property
+    def num_classes(self) -> int:
+        return len(self.files)
+
+    @property
+    def batch_size(self) -> int:
+        return self.data.batch_size or DEFAULT_BATCH_SIZE
+
+    def steps_per_epoch(self, batch_size: Optional[int] = None) -> int:
+        batch_size = batch_size or self.batch_size
+        return -(-self.num_train_rows // batch_size)
+
+    def iter_split_chunks(self, file_index: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yield the raw (unscaled) row blocks of a file together with their validation mask.
+        """
+        cached_array = self.cached_arrays[file_index] if self.cached_arrays else None
+        if cached_array and os.path.exists(cached_array):
+            chunks = iter_row_chunks(np.load(cached_array, mmap_mode='r'))
+        else:
+            # Evicted, or a node that doesn't share the cache of the driver
+            chunks = iter_file_chunks(self.files[file_index], self.data)
+        return split_chunks(chunks, file_index)
+
+    def _iter_partition(self, file_index: int, validation: bool) -> Iterator[Batch]:
+        for chunk, is_validation in self.iter_split_chunks(file_index):
+            rows = chunk[is_validation if validation else ~is_validation]
+            if len(rows):
+                X = self.scaler.transform(rows).astype(self.data.dtype.value, copy=False)
+                yield X, np.full(len(X), file_index, dtype=self.labels_dtype)
+
+    def train_batches(self,
+                      batch_size: Optional[int] = None,
+                      shuffle: bool = True,
+                      seed: Optional[int] = None) -> Iterator[Batch]:
+        """
+        Iterate over the training set in batches of *batch_size* rows.
+
+        Files are read round-robin, one batch from each of them at a time, so every batch mixes
+        all the classes. When *shuffle* is true, rows are shuffled within each of those windows.
+        """
+        batch_size = batch_size or self.batch_size
+        rng = np.random.default_rng(seed)
+        readers = [_rebatch(self._iter_partition(i, validation=False), batch_size) for i in range(len(self.files))]
+
+        def windows():
+            active = list(readers)
+            while active:
+                window = []
+                for reader in list(active):
+                    batch = next(reader, None)
+                    if batch is None:
+                        active.remove(reader)
+                    else:
+                        window.append(batch)
+                if not window:
+                    break
+                X = np.concatenate([X for X, _ in window])
+                y = np.concatenate([y for _, y in window])
+                if shuffle:
+                    permutation = rng.permutation(len(X))
+                    X, y = X[permutation], y[permutation]
+                yield X, y
+
+        yield from _rebatch(windows(), batch_size)
+
+    def validation_batches(self, batch_size: Optional[int] = None) -> Iterator[Batch]:
+        """
+        Iterate over the validation set in batches of *batch_size* rows, file after file.
+        """
+        batch_size = batch_size or self.batch_size
+        pieces = (piece for i in range(len(self.files)) for piece in self._iter_partition(i, validation=True))
+        yield from _rebatch(pieces, batch_size)
+
+
+class StreamingDataLoader(DataLoader):
+    """
+    Data loader for datasets that do not fit in memory.
+
+    load_data fits the scaler incrementally (partial_fit) in a single pass over the training
+    rows and returns a :class:`StreamingDataset`. Subclasses can change the scaler with the
+    scaler_class attribute, eg. sklearn.preprocessing.MinMaxScaler.
+
+    With the cache enabled, StandardScaler and MinMaxScaler are built from the statistics
+    sidecars of the cache entries instead, so warm loads don't read the data at all.
+    """
+    scaler_class = StandardScaler
+
+    @classmethod
+    def load_data(cls) -> StreamingDataset:
+        files = find_data_files(cls.data)
+        entries = stream_entries(files, cls.data) if cls.data.cache else None
+
+        if entries and issubclass(cls.scaler_class, (StandardScaler, MinMaxScaler)):
+            dataset = cls._from_statistics(files, entries)
+        else:
+            dataset = cls._from_single_pass(files, entries)
+
+        logger.info(f'Streaming dataset with {dataset.num_train_rows} train rows and '
+                    f'{dataset.num_validation_rows} validation rows from {len(files)} files')
+        return dataset
+
+    @classmethod
+    def _from_statistics(cls, files: List[str], entries: List[CacheEntry]) -> StreamingDataset:
+        splits = [split_statistics(entry, i) for i, entry in enumerate(entries)]
+        train = ColumnStatistics.merge_all(train for train, _ in splits)
+        return StreamingDataset(files, cls.data, train.to_scaler(cls.scaler_class),
+                                num_train_rows=train.count,
+                                num_validation_rows=sum(validation.count for _, validation in splits),
+                                cached_arrays=[entry.array_path for entry in entries])
+
+    @classmethod
+    def _from_single_pass(cls, files: List[str], entries: Optional[List[CacheEntry]] = None) -> StreamingDataset:
+        dataset = StreamingDataset(files, cls.data, cls.scaler_class(), num_train_rows=0, num_validation_rows=0,
+                                   cached_arrays=entries and [entry.array_path for entry in entries])
+
+        for i in range(len(files)):
+            for chunk, is_validation in dataset.iter_split_chunks(i):
+                train_rows = chunk[~is_validation]
+                if len(train_rows):
+                    dataset.scaler.partial_fit(train_rows)
+                dataset.num_train_rows += len(train_rows)
+                dataset.num_validation_rows += len(chunk) - len(train_rows)
+
+        return dataset
@@ -0,0 +1,139 @@
+"""
+Datasets kept in the Ray object store across jobs.
+
+Every job initializes Ray, loads its data and shuts Ray down, so consecutive groups on the
+same dataset load it again. When the data section of a group sets ``persist: true`` and Ray
+is connected to a long-lived cluster (ray_config.address), the data is loaded by a task of a
+named, detached actor, which owns it. Later groups with the same data loader, data configuration
+and data files get the resident copy back instead of loading it.
+
+An object is lost with the process that owns it, and a driver can't hand its own objects over to
+another process without copying them. The holder runs the loader instead, so the dataset is
+stored in the object store only once.
+"""
+import os
+import pickle
+from collections import OrderedDict
+from typing import *
+
+import numpy as np
+import ray
+
+from .config.models import Data
+from .loggings import logger
+
+HOLDER_NAME = 'dataset_holder'
+HOLDER_NAMESPACE = 'snapper_ml'
+# Share of the object store used by the holder when no budget is given
+DEFAULT_BUDGET_FRACTION = 0.5
+
+
+def dataset_fingerprint(loader_key: str, data: Data) -> str:
+    """
+    Identify the result of a data loader by the loader itself, the data configuration
+    and the path, size and modification time of the matched data files.
+    """
+    from .data import find_data_files
+    from .data.manifest import data_fingerprint
+
+    stats = [(os.path.abspath(path), os.stat(path)) for path in find_data_files(data)]
+    files = [(path, stat.st_size, stat.st_mtime_ns) for path, stat in stats]
+    return data_fingerprint(data, loader=loader_key, files=files)
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Size in bytes of a loaded dataset: the buffers of numpy arrays (also inside
+    tuples, lists and dicts) or the pickled size of any other object.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+@ray.remote(num_cpus=0)
+def load_dataset(load: Callable[[], Any]) -> Tuple[Any, int]:
+    value = load()
+    return value, estimate_size(value)
+
+
+@ray.remote(num_cpus=0)
+class DatasetHolder:
+    """
+    Detached actor that owns the datasets, so they survive the driver that loaded them.
+
+    Least recently used datasets are evicted when the stored bytes exceed *max_bytes*.
+    ObjectRefs are always wrapped in a list, so Ray doesn't resolve them on return.
+    The holder must own the stored datasets, see :meth:`load`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: 'OrderedDict[str, Tuple[ray.ObjectRef, int]]' = OrderedDict()
+
+    def get(self, fingerprint: str) -> Optional[List[ray.ObjectRef]]:
+        if fingerprint not in self.entries:
+            return None
+        self.entries.move_to_end(fingerprint)
+        return [self.entries[fingerprint][0]]
+
+    def load(self, fingerprint: str, load: Callable[[], Any], runtime_env: Optional[dict] = None) -> List[ray.ObjectRef]:
+        """
+        Load a dataset in a task of this actor, which owns its result, and store it.
+
+        :param load: Function that returns the dataset
+        :param runtime_env: Runtime environment of the task, the one of the job that needs the dataset
+        """
+        object_id, nbytes = load_dataset.options(num_returns=2, runtime_env=runtime_env).remote(load)
+        return self.put(fingerprint, [object_id], ray.get(nbytes))
+
+    def put(self, fingerprint: str, object_ids: List[ray.ObjectRef], nbytes: int) -> List[ray.ObjectRef]:
+        """
+        Store a dataset without copying it.
+
+        :param nbytes: Size of the dataset (see :func:`estimate_size`)
+        """
+        if nbytes > self.max_bytes:
+            logger.warning(f'Dataset of {nbytes} bytes exceeds the holder budget of {self.max_bytes} bytes')
+            return object_ids
+
+        self.entries[fingerprint] = (object_ids[0], nbytes)
+        self.entries.move_to_end(fingerprint)
+
+        while self.stored_bytes() > self.max_bytes:
+            evicted, _ = self.entries.popitem(last=False)
+            logger.info(f'Evicted dataset {evicted} from the dataset holder')
+
+        return [self.entries[fingerprint][0]]
+
+    def stored_bytes(self) -> int:
+        return sum(nbytes for _, nbytes in self.entries.values())
+
+    def list(self) -> List[Tuple[str, int]]:
+        return [(fingerprint, nbytes) for fingerprint, (_, nbytes) in self.entries.items()]
+
+    def evict(self, fingerprint: Optional[str] = None):
+        if fingerprint is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(fingerprint, None)
+
+
+def get_dataset_holder(max_bytes: Optional[int] = None):
+    """
+    Get the dataset holder of the cluster Ray is connected to, creating it if needed.
+
+    :param max_bytes: Budget of the holder when it is created. Defaults to half of the object store
+    """
+    if max_bytes is None:
+        object_store_memory = ray.cluster_resources().get('object_store_memory', 0)
+        max_bytes = int(object_store_memory * DEFAULT_BUDGET_FRACTION)
+
+    return DatasetHolder.options(name=HOLDER_NAME,
+                                 namespace=HOLDER_NAMESPACE,
+                                 lifetime='detached',
+                                 get_if_exists=True).remote(max_bytes)
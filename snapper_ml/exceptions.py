@@ -16,3 +16,8 @@ class DataNotLoaded(Exception):
 class TrialNotAvailable(Exception):
     def __str__(self):
         return 'optuna.Trial instance is not available for non-group jobs.'
+
+
+class TrialTimeout(Exception):
+    def __str__(self):
+        return 'Trial interrupted because it exceeded the time limit (timeout_per_trial)'
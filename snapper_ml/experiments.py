@@ -1,25 +1,123 @@
 from typing import *
+from collections import defaultdict
+from dataclasses import dataclass, field
 from functools import wraps, partial
+from itertools import count
 from inspect import isgeneratorfunction, getfile
+import os
 import sys
 from math import ceil
 from datetime import timedelta
 
 import mlflow
 from mlflow.entities import RunStatus
+from mlflow.exceptions import MlflowException
+from mlflow.tracking import MlflowClient
 import ray
 import traceback
 from pytictoc import TicToc
 import optuna
+from optuna.trial import TrialState
 from .callbacks.core import Callback, CallbacksHandler
 from .loggings import logger, setup_logging
 from .config import parse_config, get_validation_model
 from .config.models import GroupConfig, ExperimentConfig, JobTypes, \
-    JobConfig, Metric, RayConfig, Settings, Data
+    JobConfig, Metric, RayConfig, Settings, Data, StudyMode
 from .mlflow import create_mlflow_experiment, log_experiment_results, \
-    setup_autologging, AutologgingBackendParam, log_text_file
-from .optuna import create_optuna_study, optimize_optuna_study, sample_params_from_distributions
-from .exceptions import NoMetricSpecified, ExperimentError, DataNotLoaded, TrialNotAvailable
+    setup_autologging, AutologgingBackendParam, log_text_file, collect_system_info, clear_sessions
+from .scheduler import TrialScheduler, ConcurrencyController
+from .dataset_holder import dataset_fingerprint, get_dataset_holder
+from .optuna import create_optuna_study, optimize_optuna_study, resume_optuna_study, close_optuna_study, \
+    sample_params_from_distributions, param_space_distributions, find_duplicate_trial, \
+    retry_trial, TIMED_OUT_ATTR, LEASE_ATTR, DUPLICATE_OF_ATTR, RUNG_ATTR, PEAK_MEMORY_ATTR
+from .optuna.asha import SuccessiveHalving
+from . import checkpoint
+from .exceptions import NoMetricSpecified, ExperimentError, DataNotLoaded, TrialNotAvailable, TrialTimeout
+from .utils import TimeLimit, peak_memory, current_memory
+from .threads import thread_env_vars, limit_threads, pin_to_cpus
+
+# Memory reserved by the workers with memory: auto, relative to the peak memory of the trials
+AUTO_MEMORY_MARGIN = 1.2
+
+
+class SharedDataRegistry:
+    """
+    Per-process registry with the results of DataLoader.load_data, keyed by data loader class.
+
+    An entry holds either the loaded data or the ObjectRef of the copy shared through the
+    Ray object store, which is only fetched (zero-copy for numpy arrays) the first time it is used.
+    load_counts keeps how many times every entry has been actually loaded in this process.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._loading: Set[str] = set()
+        self.load_counts: Dict[str, int] = defaultdict(int)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._values
+
+    def register_loader(self, key: str, loader: Callable[[], Any]):
+        self._loaders[key] = loader
+        self._values.pop(key, None)
+
+    def update(self, values: Dict[str, Any]):
+        self._values.update(values)
+
+    def discard(self, key: str):
+        self._values.pop(key, None)
+
+    def get(self, key: str, loader: Optional[Callable[[], Any]] = None) -> Any:
+        loader = loader or self._loaders.get(key)
+
+        if key in self._loading:
+            # load_data of a subclass calling the load_data of its parent class
+            return loader()
+
+        if key not in self._values:
+            if loader is None:
+                raise DataNotLoaded()
+            self._loading.add(key)
+            try:
+                self._values[key] = loader()
+            finally:
+                self._loading.discard(key)
+            self.load_counts[key] += 1
+
+        value = self._values[key]
+        if isinstance(value, ray.ObjectRef):
+            value = self._values[key] = ray.get(value)
+        return value
+
+    def share(self, key: str) -> ray.ObjectRef:
+        """
+        Store the entry in the Ray object store, loading it first if needed.
+        The local copy is replaced by the reference, so the data is held only once.
+        """
+        value = self._values.get(key)
+        if not isinstance(value, ray.ObjectRef):
+            value = self._values[key] = ray.put(self.get(key))
+        return value
+
+    def clear(self):
+        self._values.clear()
+        self._loaders.clear()
+        self.load_counts.clear()
+
+
+data_registry = SharedDataRegistry()
+
+
+def _memoize_load_data(load_data: Union[classmethod, staticmethod]) -> classmethod:
+    func = load_data.__func__
+    is_static = isinstance(load_data, staticmethod)
+
+    @wraps(func)
+    def wrapper(cls):
+        return data_registry.get(cls.key(), loader=func if is_static else partial(func, cls))
+
+    return classmethod(wrapper)
 
 
 class DataLoader(object):
@@ -37,19 +135,57 @@ class DataLoader(object):
     function will be only called once by the master process and then its result will be shared among
     the rest workers. In this way, we can avoid expensive computation being duplicated for each worker.
 
+    The load_data method of every subclass is memoized in the process-wide data_registry,
+    so calling it several times (or from several trials of the same worker) loads the data once.
+
     The shared data will be stored in the Plasma Object Store of ray, so you should take into account
     its limitations: https://docs.ray.io/en/latest/serialization.html
     """
     data: Data
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        load_data = cls.__dict__.get('load_data')
+        if isinstance(load_data, (classmethod, staticmethod)):
+            cls.load_data = _memoize_load_data(load_data)
+
+    @classmethod
+    def key(cls) -> str:
+        return f'{cls.__module__}.{cls.__qualname__}'
+
     @classmethod
     def set_data(cls, data: Data):
         # Ensure that the dataset is set on the base class
         cls.data = data
+        # Data loaded with a previous configuration is no longer valid
+        data_registry.discard(cls.key())
 
     @classmethod
     def load_data(cls):
-        raise DataNotLoaded()
+        return data_registry.get(cls.key())
+
+
+def _register_data_loader(data_loader_func: Callable[[], Any], data: Optional[Data]) -> str:
+    """
+    Prepare a data loader class, or a plain function, to be loaded through the data registry.
+    DataLoader.load_data also returns the data of the registered loader.
+
+    :return: The key of the data loader in the data registry
+    """
+    DataLoader.set_data(data)
+
+    if isinstance(data_loader_func, type) and issubclass(data_loader_func, DataLoader):
+        key = data_loader_func.key()
+        data_loader_func.set_data(data)
+        data_registry.register_loader(key, data_loader_func.load_data)
+        data_registry.register_loader(DataLoader.key(), partial(data_registry.get, key))
+        return key
+
+    # Plain functions are keyed like classes, so different loaders never share a persistent dataset
+    key = f'{data_loader_func.__module__}.{data_loader_func.__qualname__}'
+    data_registry.register_loader(key, data_loader_func)
+    data_registry.register_loader(DataLoader.key(), partial(data_registry.get, key))
+    return key
 
 
 class Trial(object):
@@ -120,15 +256,102 @@ def _parse_experiment_arguments() -> JobConfig:
     return parse_config(sys.argv[1], get_validation_model)
 
 
-def _calculate_concurrent_workers(config: GroupConfig) -> int:
+def _workers_fitting(config: GroupConfig,
+                     available_cpus: float,
+                     available_gpus: float,
+                     available_memory: float = 0.0,
+                     memory: Optional[int] = None) -> float:
     cpu = config.resources_per_worker.cpu
     gpu = config.resources_per_worker.gpu
+    concurrent_workers_by_cpu = available_cpus / cpu
+    concurrent_workers_by_gpu = available_gpus / gpu if gpu else float('inf')
+    concurrent_workers_by_memory = available_memory / memory if memory else float('inf')
+    return min(concurrent_workers_by_cpu, concurrent_workers_by_gpu, concurrent_workers_by_memory)
+
+
+def _calculate_concurrent_workers(config: GroupConfig, memory: Optional[int] = None) -> int:
+    """
+    :param memory: Bytes of memory reserved by every worker, if any
+    """
     available_resources = ray.available_resources()
     available_cpus = (config.ray_config and config.ray_config.num_cpus) or available_resources.get('CPU', 1)
     available_gpus = (config.ray_config and config.ray_config.num_gpus) or available_resources.get('GPU', 0)
-    concurrent_workers_by_cpu = available_cpus / cpu
-    concurrent_workers_by_gpu = available_gpus / gpu if gpu else float('inf')
-    return int(min([concurrent_workers_by_cpu, concurrent_workers_by_gpu, config.num_trials]))
+    available_memory = available_resources.get('memory', 0)
+    workers = _workers_fitting(config, available_cpus, available_gpus, available_memory, memory)
+    if workers < 1:
+        resources = [('CPUs', config.resources_per_worker.cpu, available_cpus),
+                     ('GPUs', config.resources_per_worker.gpu, available_gpus),
+                     ('bytes of memory', memory, available_memory)]
+        missing = [f'{requested:.12g} {name} requested, {available:.12g} available'
+                   for name, requested, available in resources if requested and requested > available]
+        raise ValueError(f'A worker of group {config.name} does not fit in the cluster '
+                         f'(resources_per_worker): {"; ".join(missing)}')
+    return int(min(workers, config.num_trials))
+
+
+def _configured_max_workers(config: GroupConfig) -> Optional[int]:
+    """
+    Workers that fit in the CPUs and GPUs given in ray_config, or None if they are not given.
+    They cap the group also when the cluster is larger.
+    """
+    num_cpus = config.ray_config and config.ray_config.num_cpus
+    num_gpus = config.ray_config and config.ray_config.num_gpus
+    workers = _workers_fitting(config, num_cpus or float('inf'), num_gpus or float('inf'))
+    return int(workers) if workers != float('inf') else None
+
+
+def _observed_peak_memory(study: optuna.Study) -> Optional[int]:
+    """
+    Memory to reserve for a worker from the peak memory of the trials of the study (plus a margin),
+    or None if no trial reported it yet.
+    """
+    peaks = [trial.user_attrs[PEAK_MEMORY_ATTR] for trial in study.get_trials(deepcopy=False)
+             if PEAK_MEMORY_ATTR in trial.user_attrs]
+    return int(max(peaks) * AUTO_MEMORY_MARGIN) if peaks else None
+
+
+def _concurrency_controller(config: GroupConfig,
+                            workers: List[Any],
+                            starting: List[ray.ObjectRef],
+                            worker_memory: Callable[[], Optional[int]],
+                            unreserved_workers: Set[Any]) -> Optional[ConcurrencyController]:
+    """
+    Controller of the number of workers of a group, from the concurrency field of its config.
+
+    :param workers: Workers of the group, which the scheduler keeps updated
+    :param starting: ObjectRefs that are ready once each new worker is placed in the cluster
+    :param worker_memory: Function returning the memory reserved by new workers, if any
+    :param unreserved_workers: Workers started before the memory of memory: auto was known
+    """
+    concurrency = config.concurrency
+    if not (concurrency.elastic or concurrency.auto_tune):
+        return None
+
+    def max_workers() -> int:
+        # Workers still waiting for resources are not in available_resources yet
+        if starting:
+            _, starting[:] = ray.wait(starting, num_returns=len(starting), timeout=0)
+        if starting:
+            return len(workers)
+
+        memory = worker_memory()
+        if config.resources_per_worker.memory == 'auto' and memory is None:
+            # The first trials are still running
+            return len(workers)
+
+        available = ray.available_resources()
+        available_memory = available.get('memory', 0)
+        if memory:
+            available_memory -= memory * len(unreserved_workers.intersection(workers))
+        fitting = _workers_fitting(config, available.get('CPU', 0), available.get('GPU', 0), available_memory, memory)
+        configured = _configured_max_workers(config)
+        return min(len(workers) + int(fitting), configured if configured is not None else float('inf'))
+
+    return ConcurrencyController(max_workers if concurrency.elastic else lambda: len(workers),
+                                 elastic=concurrency.elastic,
+                                 auto_tune=concurrency.auto_tune,
+                                 check_interval=concurrency.check_interval,
+                                 trials_per_level=concurrency.trials_per_level)
 
 
 def _extract_metrics_and_artifacts(result):
@@ -138,6 +361,343 @@ def _extract_metrics_and_artifacts(result):
     return metrics, artifacts
 
 
+def _fail_stale_mlflow_runs(trials: List[optuna.trial.FrozenTrial]):
+    client = MlflowClient()
+    for trial in trials:
+        run_id = trial.user_attrs.get('mlflow_run_id')
+        if run_id:
+            try:
+                client.set_terminated(run_id, status=RunStatus.to_string(RunStatus.FAILED))
+            except MlflowException:
+                logger.warning(f'Could not mark the MLflow run {run_id} of trial {trial.number} as failed')
+
+
+def _fail_running_mlflow_runs(experiment_name: str, trial_numbers: List[int]) -> List[int]:
+    """
+    Mark as failed the running MLflow runs of the trials.
+
+    :return: The numbers of the trials that had a running MLflow run
+    """
+    client = MlflowClient()
+    experiment = client.get_experiment_by_name(experiment_name)
+    if not experiment:
+        return []
+    running = []
+    for number in trial_numbers:
+        runs = client.search_runs([experiment.experiment_id],
+                                  filter_string=f"tags.`mlflow.runName` = 'Trial {number}' "
+                                                f"and attributes.status = 'RUNNING'")
+        for run in runs:
+            client.set_terminated(run.info.run_id, status=RunStatus.to_string(RunStatus.FAILED))
+        if runs:
+            running.append(number)
+    return running
+
+
+def _load_data(data_loader_func: Callable[[], Any], data: Optional[Data]) -> Any:
+    # Data of a loader in a new process, e.g. a task of the dataset holder
+    return data_registry.get(_register_data_loader(data_loader_func, data))
+
+
+def _share_persistent_data(key: str,
+                           data_loader_func: Callable[[], Any],
+                           data: Data,
+                           settings: Settings) -> ray.ObjectRef:
+    """
+    Get the data of a loader from the dataset holder of the cluster, or make the holder load it.
+    """
+    fingerprint = dataset_fingerprint(key, data)
+    holder = get_dataset_holder(settings.DATASET_HOLDER_MAX_BYTES)
+    object_ids = ray.get(holder.get.remote(fingerprint))
+
+    if object_ids:
+        logger.info(f'Using the dataset {fingerprint} already loaded in the Ray object store')
+        return object_ids[0]
+
+    # Loaded by a task of the holder, which owns the data, so it survives this driver without a copy
+    runtime_env = dict(ray.get_runtime_context().runtime_env)
+    object_ids = ray.get(holder.load.remote(fingerprint, partial(_load_data, data_loader_func, data), runtime_env))
+    return object_ids[0]
+
+
+@dataclass
+class TrialResult:
+    number: int
+    state: TrialState
+    value: Optional[float] = None
+    user_attrs: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    # Values of the steps run by the worker, for trials whose steps are reported by the driver
+    intermediate_values: Dict[int, float] = field(default_factory=dict)
+    # Resident memory of the worker process after the trial, used to recycle workers
+    worker_memory: Optional[int] = None
+
+
+def _worker_memory(lease_result: Any) -> Optional[int]:
+    """
+    Resident memory reported by a worker at the end of a lease: the result of GroupWorker.run_trials,
+    or the last TrialResult of the lease.
+    """
+    if isinstance(lease_result, list):
+        lease_result = lease_result[-1] if lease_result else None
+    if isinstance(lease_result, TrialResult):
+        return lease_result.worker_memory
+    return lease_result
+
+
+@ray.remote(num_cpus=0)
+def _join_results(*results: List[TrialResult]) -> List[TrialResult]:
+    # Result of a lease whose trials are separate tasks of its worker
+    return [result for trial_results in results for result in trial_results]
+
+
+@dataclass
+class TrialSegment:
+    """
+    Steps of an ASHA trial run by a worker, from *start_step* until *stop_step* (excluded).
+    Unless it is the *final* segment, the trial is paused at *stop_step*, storing its checkpoint.
+    Resumed trials continue the MLflow run *run_id*.
+    """
+    start_step: int
+    stop_step: int
+    final: bool
+    run_id: Optional[str] = None
+    values: Dict[int, float] = field(default_factory=dict)
+    paused: bool = False
+
+
+@dataclass
+class StudyCallbacks:
+    """
+    How the driver runs the trials of the study of a group with its workers (see TrialScheduler).
+
+    fail_timed_out_trials fails the trials of a worker that was killed because of a timeout, and
+    returns how many trials of its lease never started, which have to be dispatched again.
+    recover_lost_trials fails the unfinished trials of a worker that died, enqueues their parameters
+    to run them again, and returns how many new trials have to be dispatched for them.
+    """
+    submit: Callable[[Any, int], ray.ObjectRef]
+    fail_timed_out_trials: Callable[[Any], int]
+    recover_lost_trials: Callable[[Any], int]
+    on_result: Optional[Callable[[Any], None]] = None
+    promote: Optional[Callable[[Any], Optional[ray.ObjectRef]]] = None
+    finish: Optional[Callable[[], None]] = None
+
+
+def _workers_study_callbacks(study: optuna.Study, config: GroupConfig) -> StudyCallbacks:
+    """
+    Every worker runs its own optimization loop on the study.
+    """
+    lease_ids = count()
+    leases: Dict[Any, Tuple[int, int]] = {}
+
+    def submit(worker, num_trials: int) -> ray.ObjectRef:
+        leases[worker] = (next(lease_ids), num_trials)
+        return worker.run_trials.remote(study, num_trials, leases[worker][0])
+
+    def lease_trials(worker) -> Tuple[List[optuna.trial.FrozenTrial], int]:
+        # Trials started by the current lease of the worker, and the number of trials of the lease
+        lease_id, num_trials = leases.pop(worker)
+        trials = [trial for trial in study.get_trials(deepcopy=False)
+                  if trial.system_attrs.get(LEASE_ATTR) == lease_id]
+        return trials, num_trials
+
+    def fail_timed_out_trials(worker) -> int:
+        trials, num_trials = lease_trials(worker)
+        timed_out = [trial for trial in trials if trial.state == TrialState.RUNNING]
+        for trial in timed_out:
+            study._storage.set_trial_user_attr(trial._trial_id, TIMED_OUT_ATTR, True)
+            study._storage.set_trial_state_values(trial._trial_id, state=TrialState.FAIL)
+        _fail_stale_mlflow_runs(timed_out)
+        return num_trials - len(trials)
+
+    def recover_lost_trials(worker) -> int:
+        trials, num_trials = lease_trials(worker)
+        lost = [trial for trial in trials if trial.state == TrialState.RUNNING]
+        for trial in lost:
+            study._storage.set_trial_state_values(trial._trial_id, state=TrialState.FAIL)
+            retry_trial(study, trial)
+        _fail_stale_mlflow_runs(lost)
+        # Trials of the lease that didn't start are dispatched again too
+        return num_trials - (len(trials) - len(lost))
+
+    return StudyCallbacks(submit, fail_timed_out_trials, recover_lost_trials)
+
+
+def _driver_study_callbacks(study: optuna.Study, config: GroupConfig) -> StudyCallbacks:
+    """
+    The driver owns the study: it asks a batch of trials for every lease and tells their results,
+    so workers never access the Optuna storage.
+
+    Every trial of a lease is a separate task of its worker, which runs them in order, so the
+    results of the trials that finished are kept when the rest of the lease is lost.
+    """
+    distributions = param_space_distributions(config.param_space)
+    running_trials: Dict[int, optuna.Trial] = {}
+    # Number and result of every trial of the lease of each worker
+    leased_trials: Dict[Any, List[Tuple[int, ray.ObjectRef]]] = {}
+
+    def submit(worker, num_trials: int) -> ray.ObjectRef:
+        trials = []
+        for _ in range(num_trials):
+            trial = study.ask(distributions)
+            duplicate = find_duplicate_trial(study, trial.params)
+            if duplicate:
+                # Not worth a worker: the same parameters always get the same value
+                logger.info(f'Trial {trial.number} repeats the parameters of trial {duplicate.number}')
+                trial.set_user_attr(DUPLICATE_OF_ATTR, duplicate.number)
+                study.tell(trial, duplicate.value)
+            else:
+                trials.append(trial)
+
+        running_trials.update({trial.number: trial for trial in trials})
+        # The parameters of the lease are stored before it runs, to retry its trials if the driver dies
+        study._storage.flush()
+        leased_trials[worker] = [(trial.number, worker.evaluate_trials.remote([(trial.number, trial.params)]))
+                                 for trial in trials]
+        return _join_results.remote(*[object_id for _, object_id in leased_trials[worker]])
+
+    def on_result(results: List[TrialResult]):
+        for result in results:
+            trial = running_trials.pop(result.number)
+            for key, value in result.user_attrs.items():
+                trial.set_user_attr(key, value)
+            study.tell(trial, result.value, state=result.state)
+            if result.error:
+                raise ExperimentError(f'Trial {result.number} failed: {result.error}')
+
+    def unfinished_trials(worker) -> List[int]:
+        # Tells the trials of the lease of a stopped worker that finished, and returns the rest
+        lease = leased_trials.pop(worker, [])
+        ready, _ = ray.wait([object_id for _, object_id in lease], num_returns=len(lease), timeout=0)
+        finished = []
+        for object_id in ready:
+            try:
+                finished.extend(ray.get(object_id))
+            except ray.exceptions.RayError:
+                # Interrupted when the worker stopped
+                pass
+        on_result(finished)
+        return [number for number, _ in lease if number in running_trials]
+
+    def fail_timed_out_trials(worker) -> int:
+        # The trial with a running MLflow run timed out. The trials of the lease that never started
+        # are run again
+        numbers = unfinished_trials(worker)
+        timed_out = _fail_running_mlflow_runs(config.name, numbers)
+        for number in numbers:
+            trial = running_trials.pop(number)
+            if number in timed_out:
+                trial.set_user_attr(TIMED_OUT_ATTR, True)
+            study.tell(trial, state=TrialState.FAIL)
+            if number not in timed_out:
+                retry_trial(study, trial)
+        return len(numbers) - len(timed_out)
+
+    def recover_lost_trials(worker) -> int:
+        # Duplicates and finished trials of the lease are told, the rest of its trials are lost
+        numbers = unfinished_trials(worker)
+        for number in numbers:
+            trial = running_trials.pop(number)
+            study.tell(trial, state=TrialState.FAIL)
+            retry_trial(study, trial)
+        _fail_running_mlflow_runs(config.name, numbers)
+        return len(numbers)
+
+    return StudyCallbacks(submit, fail_timed_out_trials, recover_lost_trials, on_result=on_result)
+
+
+def _asha_study_callbacks(study: optuna.Study, config: GroupConfig) -> StudyCallbacks:
+    """
+    The driver owns the study, like in driver mode, and runs ASHA: trials are paused at every rung,
+    and the promoted ones are resumed from their checkpoint by any free worker.
+    """
+    asha = SuccessiveHalving(config.asha.min_resource, config.asha.reduction_factor,
+                             config.asha.max_resource, direction=config.metric.direction)
+    distributions = param_space_distributions(config.param_space)
+    # Trials not finished yet, either running or paused, and the rung they run or reached
+    running_trials: Dict[int, optuna.Trial] = {}
+    rungs: Dict[int, int] = {}
+    leased_trials: Dict[Any, int] = {}
+
+    def run_segment(worker, trial: optuna.Trial, rung: int) -> ray.ObjectRef:
+        rungs[trial.number] = rung
+        leased_trials[worker] = trial.number
+        segment = TrialSegment(start_step=asha.start_step(rung),
+                               stop_step=asha.rungs[rung],
+                               final=rung == asha.max_rung,
+                               run_id=trial.user_attrs.get('mlflow_run_id') if rung else None)
+        return worker.evaluate_segment.remote(trial.number, trial.params, segment)
+
+    def submit(worker, num_trials: int) -> ray.ObjectRef:
+        # Leases have a single trial (see _run_group)
+        trial = study.ask(distributions)
+        running_trials[trial.number] = trial
+        study._storage.flush()
+        return run_segment(worker, trial, 0)
+
+    def promote(worker) -> Optional[ray.ObjectRef]:
+        promotion = asha.next_promotion()
+        if promotion is None:
+            return None
+        number, rung = promotion
+        logger.info(f'Trial {number} promoted to rung {rung} ({asha.rungs[rung]} steps)')
+        return run_segment(worker, running_trials[number], rung)
+
+    def on_result(result: TrialResult):
+        trial = running_trials[result.number]
+        for step, value in result.intermediate_values.items():
+            trial.report(value, step)
+        for key, value in result.user_attrs.items():
+            trial.set_user_attr(key, value)
+
+        if result.state == TrialState.RUNNING:
+            # Paused at the end of its rung
+            trial.set_user_attr(RUNG_ATTR, rungs[result.number])
+            asha.report(result.number, rungs[result.number], result.value)
+            return
+
+        if result.state == TrialState.COMPLETE:
+            trial.set_user_attr(RUNG_ATTR, rungs[result.number])
+        del running_trials[result.number]
+        study.tell(trial, result.value, state=result.state)
+        if result.error:
+            raise ExperimentError(f'Trial {result.number} failed: {result.error}')
+
+    def fail_timed_out_trials(worker) -> int:
+        number = leased_trials.pop(worker, None)
+        if number in running_trials:
+            trial = running_trials.pop(number)
+            trial.set_user_attr(TIMED_OUT_ATTR, True)
+            study.tell(trial, state=TrialState.FAIL)
+            _fail_running_mlflow_runs(config.name, [number])
+        return 0
+
+    def recover_lost_trials(worker) -> int:
+        number = leased_trials.pop(worker, None)
+        if number not in running_trials:
+            return 0
+        _fail_running_mlflow_runs(config.name, [number])
+        rung = rungs[number]
+        if rung:
+            # Promoted again, resuming from the checkpoint of its previous rung
+            asha.retry_promotion(number, rung)
+            rungs[number] = rung - 1
+            return 0
+        trial = running_trials.pop(number)
+        study.tell(trial, state=TrialState.FAIL)
+        retry_trial(study, trial)
+        return 1
+
+    def prune_paused_trials():
+        # Not promoted when the group finished. Their value is the one of their last rung
+        for number in asha.paused_trials():
+            study.tell(running_trials.pop(number), state=TrialState.PRUNED)
+
+    return StudyCallbacks(submit, fail_timed_out_trials, recover_lost_trials, on_result=on_result,
+                          promote=promote, finish=prune_paused_trials)
+
+
 def _run_group(func: Callable,
                config: GroupConfig,
                data_loader_func: Optional[Callable[[], Any]],
@@ -149,39 +709,150 @@ def _run_group(func: Callable,
     if not optimize_metric:
         raise NoMetricSpecified()
 
-    concurrent_workers = _calculate_concurrent_workers(config)
-    data_object_id = None
-    futures = []
+    if config.asha and not isgeneratorfunction(func):
+        raise ExperimentError('ASHA pauses the trials between steps, so the main function must yield '
+                              'the results of every step')
+
+    shared_data = None
 
     callbacks_handler.on_job_start()
 
     if data_loader_func:
-        data = data_loader_func()
-        data_object_id = ray.put(data)
-
-    remote_func = ray.remote(num_cpus=config.resources_per_worker.cpu,
-                             num_gpus=config.resources_per_worker.gpu)(_run_group_remote)
+        # Load once in the driver. Workers receive the references, not the data
+        key = _register_data_loader(data_loader_func, config.data)
+        persist = config.data and config.data.persist
+        if persist and not (config.ray_config and config.ray_config.address):
+            logger.warning('persist requires a long-lived Ray cluster (ray_config.address). '
+                           'The data is only kept during this group')
+            persist = False
+        if persist:
+            object_id = _share_persistent_data(key, data_loader_func, config.data, settings)
+        else:
+            object_id = data_registry.share(key)
+        shared_data = {key: object_id, DataLoader.key(): object_id}
+        data_registry.update(shared_data)
 
     study = create_optuna_study(config, settings)
+    num_finished, stale_trials = resume_optuna_study(study)
+    _fail_stale_mlflow_runs(stale_trials)
+    num_trials = config.num_trials - num_finished
 
-    for i in range(concurrent_workers):
-        num_trials = config.num_trials // concurrent_workers
+    if num_finished:
+        logger.info(f'Resuming group {config.name}: {num_finished} trials already finished, '
+                    f'{len(stale_trials)} interrupted')
 
-        if i == 0:
-            num_trials += config.num_trials % concurrent_workers
+    if num_trials <= 0:
+        logger.info(f'All {config.num_trials} trials of group {config.name} already finished')
+        callbacks_handler.on_job_end(exception=None)
+        return []
 
-        new_group_config = config.model_copy(update={'num_trials': num_trials})
-        object_id = remote_func.remote(func=func,
-                                       study=study,
-                                       optimize_metric=optimize_metric,
-                                       group_config=new_group_config,
-                                       data=data_object_id,
-                                       callbacks_handler=callbacks_handler,
-                                       **kwargs)
-        futures.append(object_id)
+    def worker_memory() -> Optional[int]:
+        memory = config.resources_per_worker.memory
+        return _observed_peak_memory(study) if memory == 'auto' else memory
+
+    if config.resources_per_worker.memory == 'auto' and worker_memory() is None:
+        # More workers are started once the first trial reports its peak memory
+        logger.info('Running a single worker until the peak memory of the trials is known')
+        concurrent_workers = 1
+    else:
+        concurrent_workers = min(_calculate_concurrent_workers(config, worker_memory()), num_trials)
+
+    num_threads = config.resources_per_worker.num_threads
+    # Set before the worker process imports any library
+    runtime_env = {'env_vars': thread_env_vars(num_threads)} if num_threads else None
+    worker_class = ray.remote(num_cpus=config.resources_per_worker.cpu,
+                              num_gpus=config.resources_per_worker.gpu,
+                              runtime_env=runtime_env)(GroupWorker)
+
+    starting_workers = []
+    unreserved_workers = set()
+
+    def create_worker():
+        memory = worker_memory()
+        worker = worker_class.options(**({'memory': memory} if memory else {})).remote(
+            func=func,
+            group_config=config,
+            shared_data=shared_data,
+            callbacks_handler=callbacks_handler,
+            **kwargs)
+        if not memory:
+            unreserved_workers.add(worker)
+        starting_workers.append(worker.__ray_ready__.remote())
+        return worker
+
+    workers = [create_worker() for _ in range(concurrent_workers)]
+
+    def add_worker():
+        workers.append(create_worker())
+        logger.info(f'Running {len(workers)} workers')
+        return workers[-1]
+
+    def remove_worker(worker):
+        ray.kill(worker)
+        workers.remove(worker)
+        logger.info(f'Running {len(workers)} workers')
+
+    if config.asha:
+        callbacks = _asha_study_callbacks(study, config)
+    elif config.study_mode == StudyMode.DRIVER:
+        callbacks = _driver_study_callbacks(study, config)
+    else:
+        callbacks = _workers_study_callbacks(study, config)
+
+    def replace_worker(worker):
+        ray.kill(worker)
+        workers.remove(worker)
+        workers.append(create_worker())
+        return workers[-1]
+
+    def replace_timed_out_worker(worker, num_trials: int):
+        # The trial is stuck where it can't be interrupted, so its process is killed. First, so no
+        # trial of the lease finishes while they are failed
+        new_worker = replace_worker(worker)
+        return new_worker, callbacks.fail_timed_out_trials(worker)
+
+    def replace_lost_worker(worker, num_trials: int):
+        num_lost = callbacks.recover_lost_trials(worker)
+        return replace_worker(worker), num_lost
+
+    trials_per_worker = defaultdict(int)
+
+    def recycle_worker(worker, num_trials: int, lease_result: Any):
+        # Leases of promoted ASHA trials run one trial too
+        trials_per_worker[worker] += max(num_trials, 1)
+        reason = None
+        if config.max_trials_per_worker and trials_per_worker[worker] >= config.max_trials_per_worker:
+            reason = f'it ran {trials_per_worker[worker]} trials'
+        elif config.max_worker_memory:
+            memory = _worker_memory(lease_result)
+            if memory and memory >= config.max_worker_memory:
+                reason = f'it uses {memory / 2 ** 20:.0f} MiB of memory'
+        if not reason:
+            return worker
+        logger.info(f'Replacing a worker with a new process because {reason}')
+        del trials_per_worker[worker]
+        return replace_worker(worker)
+
+    scheduler = TrialScheduler(workers,
+                               submit=callbacks.submit,
+                               num_trials=num_trials,
+                               # ASHA runs a segment of a single trial at a time
+                               trials_per_lease=1 if config.asha else config.trials_per_lease,
+                               trial_timeout=config.timeout_per_trial,
+                               on_timeout=replace_timed_out_worker,
+                               promote=callbacks.promote,
+                               concurrency=_concurrency_controller(config, workers, starting_workers,
+                                                                   worker_memory, unreserved_workers),
+                               add_worker=add_worker,
+                               remove_worker=remove_worker,
+                               on_worker_lost=replace_lost_worker,
+                               max_retries=config.max_retries,
+                               recycle=recycle_worker)
 
     try:
-        result = ray.get(futures)
+        result = scheduler.run(callbacks.on_result)
+        if callbacks.finish:
+            callbacks.finish()
     except Exception as e:
         # Log the exception with detailed information
         callbacks_handler.on_job_end(exception=e)
@@ -190,30 +861,156 @@ def _run_group(func: Callable,
     else:
         callbacks_handler.on_job_end(exception=None)
         return result
+    finally:
+        for worker in workers:
+            ray.kill(worker)
+        close_optuna_study(study)
+
 
+class GroupWorker:
+    """
+    Long-lived worker (a Ray actor) that runs leases of trials of a group.
+
+    Process-level setup (logging, MLflow experiment, shared data and autologging backends) is done
+    once, when the worker starts, so every trial only does its own work.
+    """
+
+    def __init__(self,
+                 func: Callable,
+                 group_config: GroupConfig,
+                 shared_data: Optional[Dict[str, ray.ObjectRef]],
+                 autologging_backends: AutologgingBackendParam,
+                 callbacks_handler: CallbacksHandler,
+                 log_seeds: bool,
+                 delete_if_failed: bool,
+                 log_system_info: bool,
+                 tracking_uri: Optional[str] = None):
+        self.func = func
+        self.group_config = group_config
+        self.autologging_backends = autologging_backends
+        self.callbacks_handler = callbacks_handler
+        self.log_seeds = log_seeds
+        self.delete_if_failed = delete_if_failed
+        self.log_system_info = log_system_info
+        self.is_generator = isgeneratorfunction(func)
+        self.segment: Optional[TrialSegment] = None
+        self.lease_id: Optional[int] = None
+
+        setup_logging(experiment_name=group_config.name)
+        num_threads = group_config.resources_per_worker.num_threads
+        if num_threads:
+            limit_threads(num_threads)
+            if group_config.resources_per_worker.pin_cpus:
+                pin_to_cpus(num_threads)
+
+        if tracking_uri:
+            mlflow.set_tracking_uri(tracking_uri)
+        mlflow.set_experiment(group_config.name)
+
+        if shared_data:
+            DataLoader.set_data(group_config.data)
+            data_registry.update(shared_data)
+
+        if log_system_info:
+            collect_system_info()
+
+    def run_trials(self, study: optuna.Study, num_trials: int, lease_id: Optional[int] = None) -> Optional[int]:
+        """
+        Run trials of the study, sampled and stored by the worker itself.
+
+        :return: The resident memory of the worker after the lease
+        """
+        self.lease_id = lease_id
+        lease_config = self.group_config.model_copy(update={'num_trials': num_trials})
+        optimize_optuna_study(study, objective=self.objective, group_config=lease_config)
+        return current_memory()
+
+    def evaluate_trials(self, trials: List[Tuple[int, Dict[str, Any]]]) -> List[TrialResult]:
+        """
+        Evaluate trials whose parameters were sampled by the driver. A failed trial ends the lease.
+        """
+        results = []
+
+        for number, params in trials:
+            trial = optuna.trial.FixedTrial(params, number)
+            try:
+                result = TrialResult(number, TrialState.COMPLETE, value=self.objective(trial))
+            except optuna.exceptions.TrialPruned:
+                result = TrialResult(number, TrialState.PRUNED)
+            except TrialTimeout:
+                result = TrialResult(number, TrialState.FAIL)
+            except Exception as e:
+                result = TrialResult(number, TrialState.FAIL, error=repr(e))
+            result.user_attrs = trial.user_attrs
+            result.worker_memory = current_memory()
+            results.append(result)
+            if result.error:
+                break
+
+        return results
+
+    def evaluate_segment(self, number: int, params: Dict[str, Any], segment: TrialSegment) -> TrialResult:
+        """
+        Run the steps of a segment of an ASHA trial, resuming it from its checkpoint if it was paused.
+        The result of a paused trial has the RUNNING state.
+        """
+        trial = optuna.trial.FixedTrial(params, number)
+        self.segment = segment
+        try:
+            value = self.objective(trial)
+            result = TrialResult(number, TrialState.RUNNING if segment.paused else TrialState.COMPLETE, value=value)
+        except TrialTimeout:
+            result = TrialResult(number, TrialState.FAIL)
+        except Exception as e:
+            result = TrialResult(number, TrialState.FAIL, error=repr(e))
+        finally:
+            self.segment = None
+        result.user_attrs = trial.user_attrs
+        result.intermediate_values = segment.values
+        result.worker_memory = current_memory()
+        return result
+
+    def objective(self, trial: optuna.Trial):
+        """
+        Run a trial. Trials that exceed timeout_per_trial are interrupted with TrialTimeout, and
+        trials with the parameters of a complete trial get its value without running again.
+        """
+        if isinstance(trial, optuna.Trial):
+            if self.lease_id is not None:
+                trial.storage.set_trial_system_attr(trial._trial_id, LEASE_ATTR, self.lease_id)
+
+            # Sampled before running the trial (the trial then gets the same values) to skip duplicates
+            sample_params_from_distributions(trial, self.group_config.param_space)
+            duplicate = find_duplicate_trial(trial.study, trial.params)
+            if duplicate:
+                logger.info(f'Trial {trial.number} repeats the parameters of trial {duplicate.number}')
+                trial.set_user_attr(DUPLICATE_OF_ATTR, duplicate.number)
+                return duplicate.value
+
+        try:
+            with TimeLimit(self.group_config.timeout_per_trial, TrialTimeout):
+                return self._run_trial(trial)
+        except TrialTimeout:
+            logger.warning(f'Trial {trial.number} interrupted after {self.group_config.timeout_per_trial} seconds')
+            trial.set_user_attr(TIMED_OUT_ATTR, True)
+            raise
+        finally:
+            clear_sessions(self.autologging_backends)
+            if self.group_config.resources_per_worker.memory == 'auto':
+                # Sizes the workers of memory: auto
+                memory = peak_memory()
+                if memory:
+                    trial.set_user_attr(PEAK_MEMORY_ATTR, memory)
+
+    def _run_trial(self, trial: optuna.Trial):
+        func, group_config, callbacks_handler = self.func, self.group_config, self.callbacks_handler
+        optimize_metric = group_config.metric
+        segment = self.segment
 
-def _run_group_remote(func: Callable,
-                      study: optuna.Study,
-                      optimize_metric: Optional[Metric],
-                      group_config: GroupConfig,
-                      data: Optional[Any],
-                      autologging_backends: AutologgingBackendParam,
-                      callbacks_handler: CallbacksHandler,
-                      log_seeds: bool,
-                      delete_if_failed: bool,
-                      log_system_info: bool):
-    is_generator = isgeneratorfunction(func)
-    setup_logging(experiment_name=group_config.name)
-    mlflow.set_experiment(group_config.name)
-
-    if data:
-        DataLoader.load_data = lambda: data
-        DataLoader.set_data(group_config.data)
-
-    def objective(trial: optuna.Trial):
         with MlflowRunWithErrorHandling(callbacks_handler=callbacks_handler,
-                                        delete_if_failed=delete_if_failed,
+                                        delete_if_failed=self.delete_if_failed,
                                         trial=trial,
+                                        run_id=segment and segment.run_id,
                                         run_name=f'Trial {trial.number}') as (run, finish_param):
             # Connect mlflow runs with optuna trials
             run_id = run.info.run_id
@@ -222,8 +1019,13 @@ def _run_group_remote(func: Callable,
 
             logger.info(f'======== Starting Trial {trial.number} =========')
 
-            setup_autologging(func, autologging_backends, log_seeds, log_system_info)
+            # Backends are only patched the first time. Seeds and system info are logged in every run
+            setup_autologging(func, self.autologging_backends, self.log_seeds, self.log_system_info)
             Trial.get_current = lambda: trial
+            if segment and segment.run_id:
+                checkpoint.restore(segment.run_id)
+            else:
+                checkpoint.reset()
 
             # Fix default_worker.py name in Mlflow server
             mlflow.set_tag('mlflow.source.name', getfile(func))
@@ -239,12 +1041,21 @@ def _run_group_remote(func: Callable,
                 raise ExperimentError(
                     'Group main functions should always return a metric and/or an artifacts dictionary')
 
-            if is_generator:
-                for i, result in enumerate(results):
+            if self.is_generator:
+                for i, result in enumerate(results, start=segment.start_step if segment else 0):
                     metrics, artifacts = _extract_metrics_and_artifacts(result)
                     trial.report(metrics[optimize_metric.name], i)
                     log_experiment_results(all_params, metrics, artifacts)
                     callbacks_handler.on_info_logged(metrics=metrics, artifacts=artifacts)
+                    if segment:
+                        segment.values[i] = metrics[optimize_metric.name]
+                        if i + 1 >= segment.stop_step:
+                            segment.paused = not segment.final
+                            if segment.paused and not checkpoint.store():
+                                logger.warning(f'Trial {trial.number} did not save a checkpoint: '
+                                               f'if it is promoted, it starts again from the first step')
+                            results.close()
+                            break
                     if trial.should_prune():
                         raise optuna.exceptions.TrialPruned()
             else:
@@ -255,11 +1066,12 @@ def _run_group_remote(func: Callable,
             metric = metrics[optimize_metric.name]
             finish_param['metric'] = metric
 
-            logger.info(f'======== Finished Trial {trial.number} =========')
+            if segment and segment.paused:
+                logger.info(f'======== Paused Trial {trial.number} at step {segment.stop_step} =========')
+            else:
+                logger.info(f'======== Finished Trial {trial.number} =========')
             return metric
 
-    optimize_optuna_study(study, objective=objective, group_config=group_config)
-
 
 def _run_experiment(func: Callable,
                     config: ExperimentConfig,
@@ -268,7 +1080,10 @@ def _run_experiment(func: Callable,
                     data_loader_func: Optional[Callable[[], Any]],
                     log_seeds: bool,
                     log_system_info: bool,
-                    delete_if_failed: bool):
+                    delete_if_failed: bool,
+                    tracking_uri: Optional[str] = None):
+    if tracking_uri:
+        mlflow.set_tracking_uri(tracking_uri)
     mlflow.set_experiment(config.name)
 
     with MlflowRunWithErrorHandling(callbacks_handler, delete_if_failed=delete_if_failed):
@@ -276,8 +1091,7 @@ def _run_experiment(func: Callable,
         mlflow.set_tag('mlflow.source.name', getfile(func))
 
         if data_loader_func:
-            DataLoader.load_data = data_loader_func
-            DataLoader.set_data(config.data)
+            _register_data_loader(data_loader_func, config.data)
 
         results = _run_job(func, config)
         if not results:
@@ -309,8 +1123,13 @@ def _job_runner(remote_func: Callable, ray_config: Optional[RayConfig], *args, *
 
 def _validate_project_settings(config: JobConfig, settings: Settings):
     settings = settings or Settings()
-    if config.kind == JobTypes.GROUP and not settings.OPTUNA_STORAGE_URI:
-        raise Exception('OPTUNA_STORAGE_URI not specified. Please, create or update your .env file.')
+    storages = ['MLFLOW_TRACKING_URI']
+    if config.kind == JobTypes.GROUP:
+        storages.append('OPTUNA_STORAGE_URI')
+    local_uris = [getattr(settings, storage) for storage in storages if settings.is_local(storage)]
+    if local_uris:
+        os.makedirs(os.path.abspath(settings.LOCAL_STORAGE_DIR), exist_ok=True)
+        logger.info(f'Running in local mode: {", ".join(local_uris)}')
     return settings
 
 
@@ -407,7 +1226,8 @@ def job(func: Optional[Callable] = None, *,
                            callbacks_handler=callbacks_handler,
                            delete_if_failed=delete_if_failed,
                            data_loader_func=data_loader_func,
-                           log_system_info=log_system_info)
+                           log_system_info=log_system_info,
+                           tracking_uri=safe_project_settings.MLFLOW_TRACKING_URI)
 
         if config.kind == JobTypes.GROUP:
             _run_group(settings=safe_project_settings, **call_params)
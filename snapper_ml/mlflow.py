@@ -1,10 +1,12 @@
 from enum import Enum
+import gc
 import random
 import os
 import sys
 import tempfile
 import shutil
-from typing import Optional, Union, List, Callable, Any
+from typing import Optional, Union, List, Callable, Any, Dict, Set
+from functools import lru_cache
 from pathlib import Path
 import gorilla
 import mlflow
@@ -26,6 +28,9 @@ class AutologgingBackend(Enum):
 
 AutologgingBackendParam = Union[List[AutologgingBackend], AutologgingBackend, None]
 
+# Backends whose autologging is already enabled in this process
+_autologged_backends: Set[AutologgingBackend] = set()
+
 
 def create_mlflow_experiment(experiment_name: str, settings: Settings):
     """
@@ -85,25 +90,45 @@ def _get_seed_initializer_patch(target: Callable, module: Any, module_name: str,
     return gorilla.Patch(module, function_name, seed, settings)
 
 
-def _log_system_info():
-    mlflow.set_tag('Python', sys.version)
-    cpu_info = get_cpu_info().get('brand')
-
-    if cpu_info:
-        mlflow.set_tag('CPU', cpu_info)
+@lru_cache(maxsize=None)
+def _get_system_info() -> Dict[str, Optional[str]]:
+    # Collected once per process: pip freeze alone takes longer than many trials
+    info = {'Python': sys.version, 'CPU': get_cpu_info().get('brand'), 'gpu': None, 'requirements': None}
 
     try:
-        nvidia_info = EasyProcess('nvidia-smi').call().stdout
-        mlflow.set_tag('gpu', nvidia_info)
+        info['gpu'] = EasyProcess('nvidia-smi').call().stdout
     except EasyProcessError:
         pass
 
     try:
-        pip_packages = EasyProcess('pip3 freeze').call().stdout
-        log_text_file('requirements.txt', pip_packages)
+        info['requirements'] = EasyProcess('pip3 freeze').call().stdout
     except EasyProcessError:
         pass
 
+    return info
+
+
+def collect_system_info():
+    """
+    Collect the system information logged with every run ahead of time, so the first run
+    (and its timeout_per_trial) doesn't pay for it.
+    """
+    _get_system_info()
+
+
+def _log_system_info():
+    info = _get_system_info()
+    mlflow.set_tag('Python', info['Python'])
+
+    if info['CPU']:
+        mlflow.set_tag('CPU', info['CPU'])
+
+    if info['gpu'] is not None:
+        mlflow.set_tag('gpu', info['gpu'])
+
+    if info['requirements'] is not None:
+        log_text_file('requirements.txt', info['requirements'])
+
 
 def log_text_file(filename: str, content: str):
     tempdir = tempfile.mkdtemp()
@@ -116,6 +141,13 @@ def log_text_file(filename: str, content: str):
         shutil.rmtree(tempdir)
 
 
+def _autolog_once(backend: AutologgingBackend, autolog: Callable[[], Any]):
+    # Autologging patches the framework for the whole process, so it is enabled only once
+    if backend not in _autologged_backends:
+        autolog()
+        _autologged_backends.add(backend)
+
+
 def _setup_autologging(target: Callable, backend: AutologgingBackend, log_seeds: bool):
     patch = None
 
@@ -123,28 +155,28 @@ def _setup_autologging(target: Callable, backend: AutologgingBackend, log_seeds:
         import mlflow.tensorflow as tf
         import tensorflow
         patch = log_seeds and _get_seed_initializer_patch(target, tensorflow.random, 'Tensorflow', 'set_seed')
-        mlflow.tensorflow.autolog()
+        _autolog_once(backend, mlflow.tensorflow.autolog)
         logger.info("Enabled autologging for Tensorflow")
     elif backend == AutologgingBackend.KERAS:
         import mlflow.keras
         import tensorflow
         patch = log_seeds and _get_seed_initializer_patch(target, tensorflow.random, 'Tensorflow', 'set_seed')
-        mlflow.keras.autolog()
+        _autolog_once(backend, mlflow.keras.autolog)
         logger.info("Enabled autologging for Keras")
     elif backend == AutologgingBackend.FASTAI:
         import mlflow.fastai
         import torch
-        mlflow.fastai.autolog()
+        _autolog_once(backend, mlflow.fastai.autolog)
         patch = log_seeds and _get_seed_initializer_patch(target, torch.random, 'Pytorch', 'manual_seed')
         logger.info("Enabled autologging for Fastai")
     elif backend == AutologgingBackend.XGBOOST:
         import mlflow.xgboost
-        mlflow.xgboost.autolog()
+        _autolog_once(backend, mlflow.xgboost.autolog)
         patch = log_seeds and _get_seed_initializer_patch(target, torch.random, 'Pytorch', 'manual_seed')
         logger.info("Enabled autologging for Xgboost")
     elif backend == AutologgingBackend.LIGHTGBM:
         import mlflow.lightgbm
-        mlflow.lightgbm.autolog()
+        _autolog_once(backend, mlflow.lightgbm.autolog)
         patch = log_seeds and _get_seed_initializer_patch(target, torch.random, 'Pytorch', 'manual_seed')
         logger.info("Enabled autologging for LightGBM")
     elif backend:
@@ -154,6 +186,23 @@ def _setup_autologging(target: Callable, backend: AutologgingBackend, log_seeds:
         gorilla.apply(patch)
 
 
+def clear_sessions(backend: AutologgingBackendParam):
+    """
+    Free the memory that the frameworks of the autologging backends keep between the trials of a
+    process (the graphs and sessions of Keras and TensorFlow, the CUDA cache of PyTorch).
+    """
+    backends = backend if isinstance(backend, list) else [backend] if backend else []
+    for b in backends:
+        if b in (AutologgingBackend.TENSORFLOW, AutologgingBackend.KERAS):
+            import tensorflow
+            tensorflow.keras.backend.clear_session()
+        elif b == AutologgingBackend.FASTAI:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+    gc.collect()
+
+
 def setup_autologging(target: Callable,
                       backend: AutologgingBackendParam,
                       log_seeds: bool,
@@ -1,6 +1,9 @@
 import optuna
+from optuna.trial import FrozenTrial, TrialState
 from typing import *
 from .types import ParamDistribution
+from ..exceptions import TrialTimeout
+from .storages import WriteBehindStorage, get_process_storage, get_storage
 
 if TYPE_CHECKING:
     from ..config.models import GroupConfig, Settings
@@ -17,8 +20,31 @@ SAMPLERS = {
     'tpe': optuna.samplers.TPESampler,
 }
 
+# Sampler options for groups, whose workers sample new trials while others are still running
+SAMPLER_KWARGS = {
+    # Running trials are taken as the worst value, so concurrent workers explore different regions
+    'tpe': {'constant_liar': True},
+}
+DEFAULT_SAMPLER = 'tpe'
+
+# Trials that count towards the number of trials of a group
+FINISHED_STATES = (TrialState.COMPLETE, TrialState.PRUNED)
+# User attribute of the trials enqueued again, with the number of the trial they repeat
+RETRY_OF_ATTR = 'retry_of'
+# User attribute of the trials interrupted because they exceeded timeout_per_trial
+TIMED_OUT_ATTR = 'timed_out'
+# System attribute with the ID of the lease that ran the trial
+LEASE_ATTR = 'lease'
+# User attribute of the trials that reused the value of a complete trial with the same parameters
+DUPLICATE_OF_ATTR = 'duplicate_of'
+# User attribute with the last ASHA rung reached by the trial
+RUNG_ATTR = 'asha_rung'
+# User attribute with the peak resident memory (bytes) of the worker process after the trial. It is
+# the peak of the whole life of the process, not only of the trial: the memory a worker has to reserve
+PEAK_MEMORY_ATTR = 'peak_memory'
+
 
-def _delete_optuna_study(study_name, storage: str):
+def _delete_optuna_study(study_name, storage: optuna.storages.BaseStorage):
     try:
         optuna.delete_study(study_name=study_name, storage=storage)
     except Exception:
@@ -30,27 +56,118 @@ def optimize_optuna_study(study: optuna.Study,
                           group_config: 'GroupConfig') -> optuna.Study:
     optuna.logging.enable_propagation()
     optuna.logging.disable_default_handler()
-    study.optimize(objective,
-                   n_trials=group_config.num_trials,
-                   timeout=group_config.timeout_per_trial)
+    # Trials that exceed timeout_per_trial fail, but the optimization goes on
+    try:
+        study.optimize(objective,
+                       n_trials=group_config.num_trials,
+                       catch=(TrialTimeout,))
+    finally:
+        # Every lease receives its own copy of the storage
+        close_optuna_study(study)
     return study
 
 
+def close_optuna_study(study: optuna.Study):
+    """
+    Stop the periodic flushes of the storage of the study, if any, and write the buffered trial writes.
+    """
+    if isinstance(study._storage, WriteBehindStorage):
+        study._storage.close()
+
+
+def create_optuna_storage(group_config: 'GroupConfig', settings: 'Settings') -> optuna.storages.BaseStorage:
+    storage_config = group_config.optuna_storage
+    if storage_config.history_cache:
+        storage = get_process_storage(settings.OPTUNA_STORAGE_URI)
+    else:
+        storage = get_storage(settings.OPTUNA_STORAGE_URI)
+    if storage_config.write_behind:
+        storage = WriteBehindStorage(storage, flush_interval=storage_config.flush_interval)
+    elif group_config.study_mode.value == 'driver':
+        # The driver is the only client: it writes the parameters of each trial in a single
+        # transaction when it dispatches the lease (see flush), and its results when it tells them
+        storage = WriteBehindStorage(storage, flush_interval=None)
+    return storage
+
+
 def create_optuna_study(group_config: 'GroupConfig', settings: 'Settings') -> optuna.Study:
     optuna.logging.enable_propagation()
     optuna.logging.disable_default_handler()
     pruner = group_config.pruner and PRUNERS.get(group_config.pruner.value)()
-    sampler = group_config.sampler and SAMPLERS.get(group_config.sampler.value)()
-    _delete_optuna_study(study_name=group_config.name, storage=settings.OPTUNA_STORAGE_URI)
+    sampler_name = group_config.sampler.value if group_config.sampler else DEFAULT_SAMPLER
+    sampler = SAMPLERS[sampler_name](**SAMPLER_KWARGS.get(sampler_name, {}))
+    storage = create_optuna_storage(group_config, settings)
+    if group_config.fresh_start:
+        _delete_optuna_study(study_name=group_config.name, storage=storage)
     study = optuna.create_study(study_name=group_config.name,
                                 sampler=sampler,
-                                storage=settings.OPTUNA_STORAGE_URI,
+                                storage=storage,
                                 direction=group_config.metric.direction.value,
                                 load_if_exists=True,
                                 pruner=pruner)
     return study
 
 
+def resume_optuna_study(study: optuna.Study) -> Tuple[int, List[FrozenTrial]]:
+    """
+    Prepare a study created by a previous launch of the group to be resumed.
+
+    Trials left running by the previous launch are marked as failed, and their parameters are
+    enqueued again, only once, so they are evaluated before sampling new ones. Trials that failed
+    during the previous launch are not: their objective raised or they timed out, and the ones lost
+    with their worker were already enqueued again then.
+
+    :return: The number of finished (complete or pruned) trials and the stale trials marked as failed
+    """
+    stale_trials = study.get_trials(deepcopy=False, states=(TrialState.RUNNING,))
+    trials = study.get_trials(deepcopy=False)
+    retried = {trial.user_attrs[RETRY_OF_ATTR] for trial in trials if RETRY_OF_ATTR in trial.user_attrs}
+
+    for trial in stale_trials:
+        study._storage.set_trial_state_values(trial._trial_id, state=TrialState.FAIL)
+        if not {RETRY_OF_ATTR, TIMED_OUT_ATTR} & trial.user_attrs.keys() and trial.number not in retried:
+            retry_trial(study, trial)
+
+    num_finished = sum(trial.state in FINISHED_STATES for trial in trials)
+    return num_finished, stale_trials
+
+
+def retry_trial(study: optuna.Study, trial: Union[optuna.Trial, FrozenTrial]):
+    """
+    Enqueue the parameters of a failed trial, so they are evaluated again before sampling new ones.
+    Trials that failed before sampling any parameter are not enqueued.
+    """
+    if trial.params:
+        study.enqueue_trial(trial.params, user_attrs={RETRY_OF_ATTR: trial.number})
+
+
+def find_duplicate_trial(study: optuna.Study, params: Dict[str, Any]) -> Optional[FrozenTrial]:
+    """
+    First complete trial of the study with exactly the same parameters, if any.
+    """
+    for trial in study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)):
+        if trial.params == params:
+            return trial
+    return None
+
+
+def param_space_distributions(param_space: Dict[str, Union[ParamDistribution, List[ParamDistribution]]]) \
+        -> Dict[str, optuna.distributions.BaseDistribution]:
+    """
+    Optuna distributions of a param space, named like in :func:`sample_params_from_distributions`,
+    to sample every parameter at once with study.ask.
+    """
+    distributions = {}
+
+    for k, distribution in param_space.items():
+        if isinstance(distribution, list):
+            distributions.update({f'{k}_{i}': d.distribution for i, d in enumerate(distribution)})
+        else:
+            distributions[k] = distribution.distribution
+
+    return distributions
+
+
 def sample_params_from_distributions(trial: optuna.Trial,
                                      distributions: Dict[str, Union[ParamDistribution, List[ParamDistribution]]]):
     params = {}
@@ -0,0 +1,94 @@
+"""
+Asynchronous successive halving (ASHA) with promotions.
+
+The pruners of Optuna can only stop a trial: when a trial reaches a rung, it either keeps running
+or it is killed. Here trials are paused at every rung instead. A paused trial is promoted to the
+next rung as soon as it is among the best 1 / *reduction_factor* trials that reached its rung, and
+then it resumes from its checkpoint, on any free worker. Trials that are never promoted are pruned
+when the group finishes.
+
+Resources are steps of a generator main function (one per yielded result): trials pause after
+``min_resource * reduction_factor ** k`` steps, and complete after *max_resource* steps.
+"""
+from typing import *
+
+from ..config.models import OptimizationDirection
+
+
+class SuccessiveHalving:
+    """
+    Rungs of the trials and promotion decisions of ASHA. It only tracks trial numbers and values,
+    running the trials is up to the caller.
+
+    :param min_resource: Steps of the first rung
+    :param reduction_factor: Only the best 1 / reduction_factor trials of a rung are promoted
+    :param max_resource: Steps of a complete trial
+    :param direction: Direction of the optimization metric
+    """
+
+    def __init__(self,
+                 min_resource: int,
+                 reduction_factor: int,
+                 max_resource: int,
+                 direction: OptimizationDirection = OptimizationDirection.MINIMIZE):
+        if min_resource > max_resource:
+            raise ValueError('min_resource cannot be greater than max_resource')
+        self.reduction_factor = reduction_factor
+        self.direction = direction
+        self.rungs: List[int] = []
+        resource = min_resource
+        while resource < max_resource:
+            self.rungs.append(resource)
+            resource *= reduction_factor
+        self.rungs.append(max_resource)
+        # Value of every trial that reached each rung, and trials already promoted from it
+        self.values: List[Dict[int, float]] = [{} for _ in self.rungs]
+        self.promoted: List[Set[int]] = [set() for _ in self.rungs]
+
+    @property
+    def max_rung(self) -> int:
+        return len(self.rungs) - 1
+
+    def start_step(self, rung: int) -> int:
+        """
+        First step run by a trial to reach the rung: the steps of the previous rung.
+        """
+        return self.rungs[rung - 1] if rung else 0
+
+    def report(self, number: int, rung: int, value: float):
+        """
+        Record that a trial paused at a rung with the given value.
+        """
+        self.values[rung][number] = value
+
+    def next_promotion(self) -> Optional[Tuple[int, int]]:
+        """
+        Trial to promote now, starting from the highest rung, if any.
+
+        :return: The trial number and the rung it is promoted to
+        """
+        reverse = self.direction == OptimizationDirection.MAXIMIZE
+        for rung in reversed(range(self.max_rung)):
+            values = self.values[rung]
+            num_promotable = len(values) // self.reduction_factor
+            best = sorted(values, key=values.get, reverse=reverse)[:num_promotable]
+            for number in best:
+                if number not in self.promoted[rung]:
+                    self.promoted[rung].add(number)
+                    return number, rung + 1
+        return None
+
+    def retry_promotion(self, number: int, rung: int):
+        """
+        Make a trial promoted to *rung* promotable again, after its promotion was lost.
+        """
+        self.promoted[rung - 1].discard(number)
+
+    def paused_trials(self) -> Dict[int, int]:
+        """
+        Trials waiting at a rung below the last one, which were not promoted.
+
+        :return: The rung of every paused trial, by trial number
+        """
+        return {number: rung for rung in range(self.max_rung)
+                for number in self.values[rung] if number not in self.promoted[rung]}
@@ -0,0 +1,329 @@
+"""
+Optuna storages used by the groups.
+
+Besides the database URLs supported by Optuna, ``journal:///path/to/file`` stores the study in an
+append-only journal file (:class:`optuna.storages.JournalStorage`), which needs no database server.
+It is the storage of the local mode, and can be shared by the processes of a single machine.
+
+Trial history
+-------------
+Samplers and pruners read every trial of the study on each ask or prune decision. The relational
+storages keep the finished trials in memory and only fetch the trials changed since the last
+finished one (the watermark), but that cache lives in the storage object: each lease sent the
+study, with the whole cache, to a worker that built it again for every lease. A
+:class:`ProcessCachedStorage` is a single storage per URL and process. It is pickled as its URL,
+so the workers keep syncing the same cache incrementally for all their leases.
+
+Write-behind
+------------
+Every ``trial.suggest_*`` and ``trial.report`` call is a separate transaction in the relational
+storages, so trials with many parameters or intermediate values spend a noticeable part of their
+time waiting for the database, and put a lot of small writes on it when many workers share it.
+
+:class:`WriteBehindStorage` keeps those writes in memory and writes them in bulk (in a single
+transaction per trial for relational storages), every *flush_interval* seconds and always before
+the state of the trial changes. Writes that fail stay buffered, and the next flush raises the error
+again. Every unpickled copy has its own flusher thread, so it must be closed when it's no
+longer used (see :func:`snapper_ml.optuna.close_optuna_study`). Reads see the buffered writes, so the samplers and pruners behave the same.
+
+Durability: the state, values and attributes of the trials are written right away, as before.
+The parameters and intermediate values of a running trial that weren't flushed yet are lost
+if its process dies. A finished trial is always stored with all of its parameters and values.
+"""
+import os
+import copy
+import threading
+from collections import defaultdict
+from typing import *
+
+import optuna
+from optuna.distributions import BaseDistribution
+from optuna.exceptions import UpdateFinishedTrialError
+from optuna.storages import BaseStorage, JournalStorage, RDBStorage
+from optuna.storages.journal import JournalFileBackend
+from optuna.study import StudyDirection
+from optuna.study._frozen import FrozenStudy
+from optuna.trial import FrozenTrial, TrialState
+
+from ..loggings import logger
+
+JOURNAL_SCHEME = 'journal://'
+
+# Buffered write: ('param', name, internal value, distribution) or ('intermediate', step, value)
+Write = Tuple[Any, ...]
+
+# Storages of this process, by URL
+_process_storages: Dict[str, 'ProcessCachedStorage'] = {}
+_process_storages_lock = threading.Lock()
+
+
+def get_storage(storage: Union[str, BaseStorage]) -> BaseStorage:
+    """
+    Storage for a storage URL, including journal files (``journal:///path/to/file``).
+    """
+    if isinstance(storage, str) and storage.startswith(JOURNAL_SCHEME):
+        path = storage[len(JOURNAL_SCHEME):]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        return JournalStorage(JournalFileBackend(path))
+    return optuna.storages.get_storage(storage)
+
+
+def _rdb_backend(storage: BaseStorage) -> Optional[RDBStorage]:
+    while isinstance(storage, StorageWrapper):
+        storage = storage.storage
+    # get_storage wraps the relational storages in a _CachedStorage
+    storage = getattr(storage, '_backend', storage)
+    return storage if isinstance(storage, RDBStorage) else None
+
+
+class StorageWrapper(BaseStorage):
+    """
+    Storage that sends every call to the wrapped storage. Base class of the storages of this module.
+
+    :param storage: Storage, or URL of the storage, to wrap
+    """
+
+    def __init__(self, storage: Union[str, BaseStorage]):
+        self.storage = get_storage(storage)
+
+    def create_new_study(self, directions: Sequence[StudyDirection], study_name: Optional[str] = None) -> int:
+        return self.storage.create_new_study(directions, study_name)
+
+    def delete_study(self, study_id: int) -> None:
+        self.storage.delete_study(study_id)
+
+    def set_study_user_attr(self, study_id: int, key: str, value: Any) -> None:
+        self.storage.set_study_user_attr(study_id, key, value)
+
+    def set_study_system_attr(self, study_id: int, key: str, value: Any) -> None:
+        self.storage.set_study_system_attr(study_id, key, value)
+
+    def get_study_id_from_name(self, study_name: str) -> int:
+        return self.storage.get_study_id_from_name(study_name)
+
+    def get_study_name_from_id(self, study_id: int) -> str:
+        return self.storage.get_study_name_from_id(study_id)
+
+    def get_study_directions(self, study_id: int) -> List[StudyDirection]:
+        return self.storage.get_study_directions(study_id)
+
+    def get_study_user_attrs(self, study_id: int) -> Dict[str, Any]:
+        return self.storage.get_study_user_attrs(study_id)
+
+    def get_study_system_attrs(self, study_id: int) -> Dict[str, Any]:
+        return self.storage.get_study_system_attrs(study_id)
+
+    def get_all_studies(self) -> List[FrozenStudy]:
+        return self.storage.get_all_studies()
+
+    def create_new_trial(self, study_id: int, template_trial: Optional[FrozenTrial] = None) -> int:
+        return self.storage.create_new_trial(study_id, template_trial)
+
+    def get_trial_id_from_study_id_trial_number(self, study_id: int, trial_number: int) -> int:
+        return self.storage.get_trial_id_from_study_id_trial_number(study_id, trial_number)
+
+    def set_trial_param(self, trial_id: int, param_name: str, param_value_internal: float,
+                        distribution: BaseDistribution) -> None:
+        self.storage.set_trial_param(trial_id, param_name, param_value_internal, distribution)
+
+    def set_trial_intermediate_value(self, trial_id: int, step: int, intermediate_value: float) -> None:
+        self.storage.set_trial_intermediate_value(trial_id, step, intermediate_value)
+
+    def set_trial_state_values(self, trial_id: int, state: TrialState,
+                               values: Optional[Sequence[float]] = None) -> bool:
+        return self.storage.set_trial_state_values(trial_id, state, values)
+
+    def set_trial_user_attr(self, trial_id: int, key: str, value: Any) -> None:
+        self.storage.set_trial_user_attr(trial_id, key, value)
+
+    def set_trial_system_attr(self, trial_id: int, key: str, value: Any) -> None:
+        self.storage.set_trial_system_attr(trial_id, key, value)
+
+    def get_trial(self, trial_id: int) -> FrozenTrial:
+        return self.storage.get_trial(trial_id)
+
+    def get_all_trials(self, study_id: int, deepcopy: bool = True,
+                       states: Optional[Container[TrialState]] = None) -> List[FrozenTrial]:
+        return self.storage.get_all_trials(study_id, deepcopy=deepcopy, states=states)
+
+    def remove_session(self) -> None:
+        self.storage.remove_session()
+
+
+def get_process_storage(url: str) -> 'ProcessCachedStorage':
+    """
+    Storage of this process for a storage URL, created the first time it is needed.
+    """
+    with _process_storages_lock:
+        if url not in _process_storages:
+            _process_storages[url] = ProcessCachedStorage(url)
+        return _process_storages[url]
+
+
+class ProcessCachedStorage(StorageWrapper):
+    """
+    Storage shared by every study of this process with the same URL, so its cache of the
+    trial history survives the studies. Use :func:`get_process_storage` to get it.
+
+    :param url: URL of the storage
+    """
+
+    def __init__(self, url: str):
+        super().__init__(url)
+        self.url = url
+
+    def __reduce__(self):
+        # Only the URL is sent to other processes, which use their own storage for it
+        return get_process_storage, (self.url,)
+
+
+class WriteBehindStorage(StorageWrapper):
+    """
+    Storage that buffers the parameters and intermediate values of the trials and writes them in bulk.
+
+    :param storage: Storage, or URL of the storage, that receives the writes
+    :param flush_interval: Seconds between flushes of the buffered writes. If None, they are
+        only written when the trial finishes
+    """
+
+    def __init__(self, storage: Union[str, BaseStorage], flush_interval: Optional[float] = None):
+        super().__init__(storage)
+        self.flush_interval = flush_interval
+        self._init_buffer()
+
+    def _init_buffer(self):
+        self._lock = threading.RLock()
+        self._pending: Dict[int, List[Write]] = defaultdict(list)
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def __getstate__(self):
+        # Pickled to send the study to the workers, which start with an empty buffer
+        self.flush()
+        state = self.__dict__.copy()
+        for attr in ['_lock', '_pending', '_stop', '_flusher']:
+            del state[attr]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_buffer()
+
+    def _buffer(self, trial_id: int, write: Write):
+        with self._lock:
+            self._pending[trial_id].append(write)
+            if self.flush_interval and self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+                self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f'Could not flush the buffered trial writes: {e}')
+
+    def close(self):
+        """
+        Stop the periodic flushes and write everything that is still buffered.
+        """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def flush(self, trial_id: Optional[int] = None):
+        """
+        Write the buffered parameters and intermediate values to the storage.
+
+        :param trial_id: Write only the ones of this trial. All of them by default
+        """
+        with self._lock:
+            if trial_id is None:
+                trial_ids = list(self._pending)
+            elif trial_id in self._pending:
+                trial_ids = [trial_id]
+            else:
+                return
+
+            backend = _rdb_backend(self.storage)
+            error = None
+            for trial_id in trial_ids:
+                writes = self._pending.pop(trial_id)
+                try:
+                    if backend is not None:
+                        self._flush_rdb(backend, trial_id, writes)
+                    else:
+                        self._flush_each(trial_id, writes)
+                except UpdateFinishedTrialError as e:
+                    # Finished by another process, e.g. failed after a time out. They can't be stored
+                    logger.warning(f'Discarding {len(writes)} buffered writes of a finished trial: {e}')
+                except Exception as e:
+                    # Kept until they are written, so the next flush raises the error again. The
+                    # writes of the other trials are still flushed
+                    self._pending[trial_id] = writes
+                    error = error or e
+            if error is not None:
+                raise error
+
+    def _flush_each(self, trial_id: int, writes: List[Write]):
+        # Written ones are removed, so only the rest are kept if one fails
+        while writes:
+            kind, *args = writes[0]
+            if kind == 'param':
+                self.storage.set_trial_param(trial_id, *args)
+            else:
+                self.storage.set_trial_intermediate_value(trial_id, *args)
+            writes.pop(0)
+
+    def _flush_rdb(self, backend: RDBStorage, trial_id: int, writes: List[Write]):
+        # Private API of the Optuna versions pinned in pyproject.toml, which also checks that the
+        # distributions are compatible with the ones of the study. A trial is a single transaction
+        from optuna.storages._rdb.storage import _create_scoped_session
+
+        with _create_scoped_session(backend.scoped_session) as session:
+            for kind, *args in writes:
+                if kind == 'param':
+                    backend._set_trial_param_without_commit(session, trial_id, *args)
+                else:
+                    backend._set_trial_intermediate_value_without_commit(session, trial_id, *args)
+
+    def _with_pending(self, trial: FrozenTrial) -> FrozenTrial:
+        writes = self._pending.get(trial._trial_id)
+        if not writes:
+            return trial
+
+        trial = copy.deepcopy(trial)
+        params, distributions = dict(trial.params), dict(trial.distributions)
+        for kind, *args in writes:
+            if kind == 'param':
+                name, value, distribution = args
+                params[name] = distribution.to_external_repr(value)
+                distributions[name] = distribution
+            else:
+                step, value = args
+                trial.intermediate_values[step] = value
+        trial.params, trial.distributions = params, distributions
+        return trial
+
+    def set_trial_param(self, trial_id: int, param_name: str, param_value_internal: float,
+                        distribution: BaseDistribution) -> None:
+        self._buffer(trial_id, ('param', param_name, param_value_internal, distribution))
+
+    def set_trial_intermediate_value(self, trial_id: int, step: int, intermediate_value: float) -> None:
+        self._buffer(trial_id, ('intermediate', step, intermediate_value))
+
+    def set_trial_state_values(self, trial_id: int, state: TrialState,
+                               values: Optional[Sequence[float]] = None) -> bool:
+        self.flush(trial_id)
+        return self.storage.set_trial_state_values(trial_id, state, values)
+
+    def get_trial(self, trial_id: int) -> FrozenTrial:
+        with self._lock:
+            return self._with_pending(self.storage.get_trial(trial_id))
+
+    def get_all_trials(self, study_id: int, deepcopy: bool = True,
+                       states: Optional[Container[TrialState]] = None) -> List[FrozenTrial]:
+        with self._lock:
+            trials = self.storage.get_all_trials(study_id, deepcopy=deepcopy, states=states)
+            return [self._with_pending(trial) for trial in trials]
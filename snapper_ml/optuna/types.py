@@ -3,6 +3,7 @@ from pydantic import field_serializer
 from pydantic_core import CoreSchema, core_schema
 
 from optuna import Trial
+from optuna.distributions import BaseDistribution, CategoricalDistribution, FloatDistribution, IntDistribution
 import re
 import json
 
@@ -47,7 +48,7 @@ class Choice:
         if isinstance(value, ParamDistribution):
             raise ValueError(f'Value must be of the form choice([value1, value2, ...]) but "{value}" was received.')
         elif not isinstance(value, str):
-            raise TypeError('A string representation of choices is required')
+            raise ValueError('A string representation of choices is required')
 
         value = value.strip()
         regex = r'choice\(\s*(\[.*?\])\s*\)'
@@ -79,6 +80,10 @@ class Choice:
 
     def __call__(self, name, trial: Any):
         return trial.suggest_categorical(name, self.choices) 
+
+    @property
+    def distribution(self) -> BaseDistribution:
+        return CategoricalDistribution(self.choices)
     
 
 class Uniform:
@@ -103,7 +108,7 @@ class Uniform:
         if isinstance(value, ParamDistribution):
             raise ValueError(f'Value must be of the form uniform([low, high]) but "{value}" was received.')
         elif not isinstance(value, str):
-            raise TypeError('A string representation of uniform is required')
+            raise ValueError('A string representation of uniform is required')
 
         low, high = validate_numerical_method_str('uniform', value)
         return cls(low=low, high=high)
@@ -111,6 +116,10 @@ class Uniform:
     def __call__(self, name, trial: Trial):
         return trial.suggest_float(name, self.low, self.high)
 
+    @property
+    def distribution(self) -> BaseDistribution:
+        return FloatDistribution(self.low, self.high)
+
     def __str__(self):
         return f'uniform({self.low}, {self.high})'
 
@@ -140,7 +149,7 @@ class LogUniform:
         if isinstance(value, ParamDistribution):
             raise ValueError(f'Value must be of the form loguniform([low, high]) but "{value}" was received.')
         elif not isinstance(value, str):
-            raise TypeError('A string representation of loguniform is required')
+            raise ValueError('A string representation of loguniform is required')
 
         low, high = validate_numerical_method_str('loguniform', value)
         return cls(low=low, high=high)
@@ -148,6 +157,10 @@ class LogUniform:
     def __call__(self, name, trial: Trial):
         return trial.suggest_float(name, self.low, self.high, log=True)
 
+    @property
+    def distribution(self) -> BaseDistribution:
+        return FloatDistribution(self.low, self.high, log=True)
+
     def __str__(self):
         return f'loguniform({self.low}, {self.high})'
 
@@ -178,7 +191,7 @@ class Range:
         if isinstance(value, ParamDistribution):
             raise ValueError(f'Value must be of the form range([value1, value2, ...]) but "{value}" was received.')
         elif not isinstance(value, str):
-            raise TypeError('A string representation of range is required')
+            raise ValueError('A string representation of range is required')
 
         try:
             # Attempt to validate for three arguments (start, stop, step)
@@ -192,6 +205,10 @@ class Range:
     def __call__(self, name, trial: Trial):
         return trial.suggest_categorical(name, self.choices)
 
+    @property
+    def distribution(self) -> BaseDistribution:
+        return CategoricalDistribution(self.choices)
+
     def __str__(self):
         return f'range({self.start}, {self.stop}, {self.step})'
 
@@ -220,7 +237,7 @@ class RandomInt:
         if isinstance(value, ParamDistribution):
             raise ValueError(f'Value must be of the form randint([low, high]) but "{value}" was received.')
         elif not isinstance(value, str):
-            raise TypeError('A string representation of randint is required')
+            raise ValueError('A string representation of randint is required')
 
         low, high = validate_numerical_method_str('randint', value, num_arguments=2)
         return cls(low=int(low), high=int(high))
@@ -228,6 +245,10 @@ class RandomInt:
     def __call__(self, name, trial: Trial):
         return trial.suggest_int(name, self.low, self.high)
 
+    @property
+    def distribution(self) -> BaseDistribution:
+        return IntDistribution(self.low, self.high)
+
     def __str__(self):
         return f'randint({self.low}, {self.high})'
 
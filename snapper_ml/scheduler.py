@@ -0,0 +1,332 @@
+"""
+Dynamic scheduling of the trials of a group.
+
+Instead of splitting the trials of a group evenly among the workers up front, trials are handed
+out in small leases (one trial by default) as workers become free. A worker that samples cheap
+configurations simply asks for more work, so the duration of a group is no longer set by the
+worker that got the slowest trials.
+
+Leases are run by a fixed pool of workers (usually long-lived Ray actors): every finished lease
+returns its worker to the pool, and the next lease is handed to it right away.
+
+With a per-trial timeout, a lease that runs past the timeout of all its trials (plus a grace
+period) is stuck: its worker is handed to *on_timeout*, which replaces it with a new one. The trials
+of the lease that never started are dispatched again.
+
+A worker can also die while it runs a lease (killed for using too much memory, a crash of native
+code, the loss of its node). Instead of failing the group, its worker is handed to *on_worker_lost*,
+which replaces it, and the trials of the lease that didn't finish are dispatched again, up to
+*max_retries* lost leases. Exceptions raised by the trials themselves still fail the group.
+
+Workers that leak memory across trials are recycled: after every lease, *recycle* may replace
+the worker with a new process before it gets more work.
+
+With *promote* (ASHA), free workers first resume the paused trials that were promoted. Those
+leases continue trials that were already dispatched, so they don't count towards *num_trials*,
+and the scheduler runs until no new trials or promotions are left.
+
+The size of the pool can change during the run (see :class:`ConcurrencyController`): workers are
+added to follow the resources of the cluster, and idle workers are removed when the concurrency
+goes down, for example when running fewer trials at a time completes more trials per minute.
+"""
+import time
+from typing import *
+
+import ray
+from ray.exceptions import RayActorError, WorkerCrashedError, NodeDiedError, OutOfMemoryError, ObjectLostError
+
+from .loggings import logger
+
+# Errors of a lease caused by the death of its worker, not by its trials
+WORKER_FAILURES = (RayActorError, WorkerCrashedError, NodeDiedError, OutOfMemoryError, ObjectLostError)
+
+
+class ConcurrencyController:
+    """
+    Number of workers of a group during the run.
+
+    Elastic: the number of workers that fit in the cluster is checked every *check_interval* seconds,
+    so nodes that join the cluster get workers too.
+
+    Auto-tune: concurrent trials compete for memory bandwidth and caches, so more workers don't
+    always complete more trials. The throughput (completed trials per minute) is measured at the
+    largest concurrency, and then at lower ones while it improves. The best level is kept until the
+    cluster grows, which starts a new measurement. At every level, the first trial of each worker
+    is not measured, since it includes the warm-up of the worker.
+
+    :param max_workers: Function returning the number of workers that fit in the cluster, including
+        the ones already started
+    :param elastic: Follow the resources of the cluster. Otherwise, the first value of max_workers is kept
+    :param auto_tune: Look for the concurrency level with the highest throughput
+    :param check_interval: Seconds between checks of the resources of the cluster
+    :param trials_per_level: Trials measured at each concurrency level
+    """
+
+    def __init__(self,
+                 max_workers: Callable[[], int],
+                 elastic: bool = True,
+                 auto_tune: bool = False,
+                 check_interval: float = 30.0,
+                 trials_per_level: int = 5):
+        self.max_workers = max_workers
+        self.elastic = elastic
+        self.auto_tune = auto_tune
+        self.check_interval = check_interval
+        self.trials_per_level = trials_per_level
+        self.limit = max(1, max_workers())
+        self.next_check = time.monotonic() + check_interval
+        # Auto-tune state: level being measured, start of its measurement and throughput of every level
+        self.tuned_limit: Optional[int] = None
+        self.level = self.limit
+        self.level_start: Tuple[float, int] = (0.0, 0)
+        self.window_start: Optional[Tuple[float, int]] = None
+        self.throughputs: Dict[int, float] = {}
+        self.settled: Optional[int] = None
+
+    def next_check_in(self) -> Optional[float]:
+        """
+        Seconds until the next check of the cluster resources, or None if they are not checked.
+        """
+        if not self.elastic:
+            return None
+        return max(0.0, self.next_check - time.monotonic())
+
+    def target(self, num_completed: int) -> int:
+        """
+        Number of workers to run now.
+
+        :param num_completed: Trials completed so far
+        """
+        now = time.monotonic()
+        if self.elastic and now >= self.next_check:
+            self.next_check = now + self.check_interval
+            limit = max(1, self.max_workers())
+            if limit != self.limit:
+                logger.info(f'The cluster has resources for {limit} workers (it had for {self.limit})')
+            self.limit = limit
+
+        if not self.auto_tune:
+            return self.limit
+        return min(self._tune(num_completed, now), self.limit)
+
+    def _measure(self, level: int, num_completed: int, now: float):
+        self.level = level
+        self.level_start = (now, num_completed)
+        self.window_start = None
+
+    def _tune(self, num_completed: int, now: float) -> int:
+        if self.tuned_limit is None or self.limit > self.tuned_limit:
+            # Start measuring again from the largest concurrency
+            self.tuned_limit, self.throughputs, self.settled = self.limit, {}, None
+            self._measure(self.limit, num_completed, now)
+
+        if self.settled:
+            return self.settled
+
+        if self.window_start is None:
+            if num_completed - self.level_start[1] >= self.level:
+                self.window_start = (now, num_completed)
+        elif num_completed - self.window_start[1] >= self.trials_per_level:
+            start, start_completed = self.window_start
+            self.throughputs[self.level] = 60 * (num_completed - start_completed) / max(now - start, 1e-6)
+            logger.info(f'{self.level} workers complete {self.throughputs[self.level]:.1f} trials per minute')
+
+            best = max(self.throughputs, key=self.throughputs.get)
+            next_level = self.level - max(1, self.tuned_limit // 4)
+            if best != self.level or next_level < 1:
+                self.settled = best
+                logger.info(f'Running {best} workers, the concurrency with the highest throughput')
+            else:
+                self._measure(next_level, num_completed, now)
+
+        return self.settled or self.level
+
+
+class TrialScheduler:
+    """
+    Keep every worker busy with a lease of trials until *num_trials* trials are dispatched.
+
+    :param workers: Pool of workers. Each of them runs one lease at a time
+    :param submit: Function that makes a worker run the given number of trials, returning its ObjectRef
+    :param num_trials: Total number of trials to run
+    :param trials_per_lease: Number of trials of each lease
+    :param trial_timeout: Seconds each trial may run. If None, leases are never timed out
+    :param on_timeout: Function called with the worker and the number of trials of a timed-out lease.
+        It must stop the worker and return the worker that replaces it and the number of trials of
+        the lease that never started, which are dispatched again
+    :param grace_period: Seconds per trial added to the timeout of a lease, for the setup and
+        cleanup of every trial
+    :param promote: Function that makes a worker resume a promoted trial, returning its ObjectRef,
+        or None if there is no trial to promote
+    :param concurrency: Controller of the number of workers. If None, the pool keeps its size
+    :param add_worker: Function that starts a new worker, required with *concurrency*
+    :param remove_worker: Function that stops an idle worker, required with *concurrency*
+    :param on_worker_lost: Function called with the worker and the number of trials of a lease whose
+        worker died. It must return the worker that replaces it and the number of trials of the lease
+        that didn't finish, which are dispatched again. If None, a dead worker fails the run
+    :param max_retries: Leases lost by dead workers that are dispatched again. The next one fails the run
+    :param recycle: Function called with the worker, the number of trials and the result of every
+        finished lease, while there is more work to do. It returns the worker to use from then on: the same one or
+        a new one that replaces it
+    """
+
+    def __init__(self,
+                 workers: List[Any],
+                 submit: Callable[[Any, int], ray.ObjectRef],
+                 num_trials: int,
+                 trials_per_lease: int = 1,
+                 trial_timeout: Optional[float] = None,
+                 on_timeout: Optional[Callable[[Any, int], Tuple[Any, int]]] = None,
+                 grace_period: float = 10.0,
+                 promote: Optional[Callable[[Any], Optional[ray.ObjectRef]]] = None,
+                 concurrency: Optional[ConcurrencyController] = None,
+                 add_worker: Optional[Callable[[], Any]] = None,
+                 remove_worker: Optional[Callable[[Any], None]] = None,
+                 on_worker_lost: Optional[Callable[[Any, int], Tuple[Any, int]]] = None,
+                 max_retries: int = 0,
+                 recycle: Optional[Callable[[Any, int, Any], Any]] = None):
+        if not workers:
+            raise ValueError('At least one worker is required to run the trials')
+        if trial_timeout and not on_timeout:
+            raise ValueError('on_timeout is required to replace the workers of timed-out leases')
+        if concurrency and not (add_worker and remove_worker):
+            raise ValueError('add_worker and remove_worker are required to change the number of workers')
+        self.idle_workers = list(workers)
+        self.submit = submit
+        self.num_trials = num_trials
+        self.trials_per_lease = trials_per_lease
+        self.trial_timeout = trial_timeout
+        self.on_timeout = on_timeout
+        self.grace_period = grace_period
+        self.promote = promote
+        self.concurrency = concurrency
+        self.add_worker = add_worker
+        self.remove_worker = remove_worker
+        self.on_worker_lost = on_worker_lost
+        self.max_retries = max_retries
+        self.num_retries = 0
+        self.recycle = recycle
+        self.num_dispatched = 0
+        self.num_completed = 0
+        self.num_timed_out = 0
+        self.pending: Dict[ray.ObjectRef, Tuple[Any, int]] = {}
+        self.deadlines: Dict[ray.ObjectRef, float] = {}
+
+    def _dispatch(self):
+        while self.idle_workers:
+            worker = self.idle_workers[-1]
+            object_id = self.promote(worker) if self.promote else None
+            if object_id is not None:
+                # Resumes a trial that was already dispatched
+                lease = 0
+            elif self.num_dispatched < self.num_trials:
+                lease = min(self.trials_per_lease, self.num_trials - self.num_dispatched)
+                object_id = self.submit(worker, lease)
+            else:
+                break
+            self.idle_workers.pop()
+            self.pending[object_id] = (worker, lease)
+            if self.trial_timeout:
+                self.deadlines[object_id] = time.monotonic() + max(lease, 1) * (self.trial_timeout +
+                                                                                 self.grace_period)
+            self.num_dispatched += lease
+
+    @property
+    def num_workers(self) -> int:
+        return len(self.idle_workers) + len(self.pending)
+
+    def _resize(self):
+        if not self.concurrency:
+            return
+        target = self.concurrency.target(self.num_completed)
+        # New workers are only worth it while there are new trials to run
+        while self.num_workers < target and self.num_dispatched < self.num_trials:
+            self.idle_workers.append(self.add_worker())
+        # Busy workers are removed once their lease finishes
+        while self.num_workers > target and self.idle_workers:
+            self.remove_worker(self.idle_workers.pop())
+
+    def _wait_timeout(self) -> Optional[float]:
+        timeouts = []
+        if self.deadlines:
+            timeouts.append(max(0.0, min(self.deadlines.values()) - time.monotonic()))
+        if self.concurrency and self.concurrency.next_check_in() is not None:
+            timeouts.append(self.concurrency.next_check_in())
+        return min(timeouts) if timeouts else None
+
+    def _replace_timed_out_workers(self):
+        now = time.monotonic()
+        for object_id, deadline in list(self.deadlines.items()):
+            if deadline <= now:
+                worker, lease = self.pending.pop(object_id)
+                del self.deadlines[object_id]
+                logger.warning(f'A lease of {max(lease, 1)} trials exceeded its time limit. Replacing its worker')
+                new_worker, num_unrun = self.on_timeout(worker, lease)
+                self.idle_workers.append(new_worker)
+                self.num_dispatched -= num_unrun
+                self.num_completed += lease - num_unrun
+                self.num_timed_out += lease - num_unrun
+
+    def _can_recover(self) -> bool:
+        return self.on_worker_lost is not None and self.num_retries < self.max_retries
+
+    def _recover(self, worker: Any, lease: int, error: Exception):
+        self.num_retries += 1
+        logger.warning(f'The worker of a lease of {lease} trials died ({type(error).__name__}). '
+                       f'Replacing it (retry {self.num_retries}/{self.max_retries})')
+        new_worker, num_lost = self.on_worker_lost(worker, lease)
+        self.idle_workers.append(new_worker)
+        self.num_dispatched -= num_lost
+        self.num_completed += lease - num_lost
+
+    def cancel(self):
+        """
+        Cancel the pending leases. Running actor tasks are not interrupted, kill the actors for that.
+        """
+        for object_id in self.pending:
+            ray.cancel(object_id)
+        self.pending.clear()
+        self.deadlines.clear()
+
+    def run(self, on_result: Optional[Callable[[Any], None]] = None) -> List[Any]:
+        """
+        Run every trial, processing the finished leases as soon as they complete.
+        If a lease fails (and its failure can't be recovered), the running ones are cancelled
+        and its exception is raised.
+
+        :param on_result: Function called with the result of every finished lease
+        :return: The results of all the leases, in completion order
+        """
+        results = []
+        self._resize()
+        self._dispatch()
+
+        try:
+            while self.pending:
+                ready, _ = ray.wait(list(self.pending), num_returns=1, timeout=self._wait_timeout())
+                for object_id in ready:
+                    worker, lease = self.pending.pop(object_id)
+                    self.deadlines.pop(object_id, None)
+                    try:
+                        result = ray.get(object_id)
+                    except WORKER_FAILURES as e:
+                        if not self._can_recover():
+                            raise
+                        self._recover(worker, lease, e)
+                        continue
+                    if self.recycle and (self.num_dispatched < self.num_trials or self.promote):
+                        worker = self.recycle(worker, lease, result)
+                    self.idle_workers.append(worker)
+                    self.num_completed += lease
+                    logger.debug(f'Completed {self.num_completed}/{self.num_trials} trials')
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+                self._replace_timed_out_workers()
+                self._resize()
+                self._dispatch()
+        except BaseException:
+            self.cancel()
+            raise
+
+        return results
@@ -226,6 +226,7 @@ PARAM_SPACE_HELP = f'Job parameter space. {ONLY_GROUP} {DICT_OVERLAP}'
 NUM_TRIALS_HELP = f'Number of experiments to execute in parallel. {ONLY_GROUP} {OVERRIDE_CONFIG}'
 TIMEOUT_HELP = 'Timeout per trial. In case of an experiment taking too long, it will be aborted.' \
                f'{ONLY_GROUP} {OVERRIDE_CONFIG}'
+FRESH_START_HELP = f'Delete the trials of a previous run of the group instead of resuming it. {ONLY_GROUP}'
 SAMPLER_HELP = f'Sampler name. {ONLY_GROUP} {OVERRIDE_CONFIG}'
 PRUNER_HELP = f'Pruner name. {ONLY_GROUP} {OVERRIDE_CONFIG}'
 METRIC_KEY_HELP = 'Name of the metric to optimize. It must be one of the keys of the metrics dictionary ' \
@@ -254,6 +255,7 @@ def run(scripts: List[Path] = ExistentFile('.py', None),
                                                 metavar='POSITIVE_FLOAT', help=TIMEOUT_HELP),
         sampler: SamplerEnum = typer.Option(None, help=SAMPLER_HELP),
         pruner: PrunerEnum = typer.Option(None, help=PRUNER_HELP),
+        fresh_start: bool = typer.Option(False, '--fresh_start', help=FRESH_START_HELP),
         metric_key: str = typer.Option(None, '--metric_key', help=METRIC_KEY_HELP),
         metric_direction: OptimizationDirection = typer.Option(None, '--metric_direction', help=METRIC_DIRECTION_HELP),
         docker_image: str = typer.Option(None, '--docker_image', help=DOCKER_IMAGE_HELP),
@@ -340,6 +342,7 @@ def run(scripts: List[Path] = ExistentFile('.py', None),
                                     pruner=pruner,
                                     num_trials=num_trials,
                                     timeout_per_trial=timeout_per_trial,
+                                    fresh_start=fresh_start,
                                     metric=metric,
                                     param_space=param_space)
                 group_config = {k: v for k, v in group_config.items() if v}
@@ -426,5 +429,109 @@ def make(target: str = typer.Argument("docker", help="Makefile target to execute
         sys.exit(1)
 
 
+CACHE_HELP = 'Inspect and manage the on-disk cache of parsed dataset files.'
+CACHE_DIR_HELP = 'Cache directory. Defaults to $SNAPPER_ML_CACHE_DIR or ./artifacts/cache'
+
+cache_app = typer.Typer(help=CACHE_HELP)
+app.add_typer(cache_app, name='cache')
+
+
+def _format_bytes(num_bytes: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num_bytes < 1024:
+            return f'{num_bytes:.1f} {unit}'
+        num_bytes /= 1024
+    return f'{num_bytes:.1f} TB'
+
+
+@cache_app.command('list', help='List the cached dataset files.')
+def cache_list(cache_dir: Path = typer.Option(None, '--cache_dir', help=CACHE_DIR_HELP)):
+    from snapper_ml.data.cache import DatasetCache
+
+    entries = DatasetCache(cache_dir and str(cache_dir)).entries()
+    if not entries:
+        typer.echo('The dataset cache is empty.')
+        return
+
+    for entry in entries:
+        status = 'ok' if entry.fingerprint.matches() else 'stale'
+        typer.echo(f'{entry.key}  {_format_bytes(entry.nbytes):>10}  {str(entry.shape):>16}  '
+                   f'{entry.dtype:>5}  {status:>5}  {entry.fingerprint.path}')
+    typer.echo(f'\n{len(entries)} entries, {_format_bytes(sum(e.nbytes for e in entries))} in total.')
+
+
+@cache_app.command('warm', help='Parse and cache every data file matched by a config file.')
+def cache_warm(config_file: Path = typer.Argument(..., exists=True, dir_okay=False, resolve_path=True),
+               cache_dir: Path = typer.Option(None, '--cache_dir', help=CACHE_DIR_HELP)):
+    from snapper_ml.data import warm_cache
+    from snapper_ml.data.cache import CACHE_DIR_ENV
+
+    config = parse_config(config_file, get_validation_model)
+    if not config.data:
+        typer.echo(f'Error: {config_file} does not define a data section.', err=True)
+        raise typer.Exit(code=1)
+
+    if cache_dir:
+        os.environ[CACHE_DIR_ENV] = str(cache_dir)
+
+    config.data.folder = os.path.join(config.root_path, config.data.folder)
+    files = warm_cache(config.data)
+    typer.echo(f'Cached {len(files)} files.')
+
+
+@cache_app.command('stats', help='Show the per-column statistics of cached dataset files.')
+def cache_stats(paths: List[Path] = typer.Argument(None, help='Only show the entries of these source files.'),
+                merge: bool = typer.Option(False, '--merge', help='Merge the statistics of all the selected entries.'),
+                cache_dir: Path = typer.Option(None, '--cache_dir', help=CACHE_DIR_HELP)):
+    from snapper_ml.data.cache import DatasetCache
+    from snapper_ml.data.statistics import ColumnStatistics
+
+    sources = {str(path.absolute()) for path in paths or []}
+    entries = [entry for entry in DatasetCache(cache_dir and str(cache_dir)).entries()
+               if not sources or entry.fingerprint.path in sources]
+    if not entries:
+        typer.echo('No matching entries in the dataset cache.')
+        return
+
+    def echo_statistics(title: str, stats: ColumnStatistics):
+        typer.echo(f'{title} ({stats.count} rows)')
+        typer.echo(f'{"column":>8}  {"mean":>12}  {"std":>12}  {"min":>12}  {"max":>12}')
+        for i, values in enumerate(zip(stats.mean, stats.var ** 0.5, stats.min, stats.max)):
+            typer.echo(f'{i:>8}  ' + '  '.join(f'{value:>12.6g}' for value in values))
+
+    if merge:
+        shapes = {entry.shape[1:] for entry in entries}
+        if len(shapes) > 1:
+            typer.echo('Error: the selected entries have a different number of columns.', err=True)
+            raise typer.Exit(code=1)
+        echo_statistics(f'{len(entries)} entries', ColumnStatistics.merge_all(e.statistics() for e in entries))
+        return
+
+    for entry in entries:
+        echo_statistics(f'{entry.key}  {entry.fingerprint.path}', entry.statistics())
+        typer.echo()
+
+
+@cache_app.command('evict', help='Remove cache entries. By default, only the stale ones are removed.')
+def cache_evict(paths: List[Path] = typer.Argument(None, help='Only evict the entries of these source files.'),
+                all_entries: bool = typer.Option(False, '--all', help='Remove every entry.'),
+                cache_dir: Path = typer.Option(None, '--cache_dir', help=CACHE_DIR_HELP)):
+    from snapper_ml.data.cache import DatasetCache
+
+    cache = DatasetCache(cache_dir and str(cache_dir))
+    sources = {str(path.absolute()) for path in paths or []}
+
+    if all_entries:
+        evicted = cache.evict()
+    elif sources:
+        evicted = cache.evict(lambda entry: entry.fingerprint.path in sources)
+    else:
+        evicted = cache.evict(lambda entry: not entry.fingerprint.matches())
+
+    for entry in evicted:
+        typer.echo(f'Evicted {entry.key}  {entry.fingerprint.path}')
+    typer.echo(f'{len(evicted)} entries removed.')
+
+
 if __name__ == '__main__':
     app()
@@ -0,0 +1,104 @@
+"""
+Thread limits and CPU affinity of the workers of a group.
+
+Native libraries size their thread pools by the cores of the machine, not by the CPUs reserved by
+a worker: N workers on a node would run N times as many threads as cores, and the group would be
+slower than with fewer workers. Workers limit the pools to the threads of their resources:
+
+- Environment variables read by the libraries when they start (OpenMP, which XGBoost and scikit-learn
+  also use, MKL, OpenBLAS, BLIS, Accelerate, NumExpr and TensorFlow). They are set in the runtime
+  environment of the Ray actors, so they apply before any library is imported.
+- threadpoolctl (if installed) for the libraries already loaded, and TensorFlow if it is imported.
+
+With CPU pinning, every worker is pinned to its own set of cores. The cores are claimed with a lock
+file per core, held while the worker process lives, so the workers of a node never share cores. The
+operating system releases the locks when the process exits, also when Ray kills the worker.
+"""
+import os
+import sys
+import tempfile
+from typing import *
+
+from .loggings import logger
+
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'BLIS_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS']
+# Concurrent TensorFlow operations, each of them using up to TF_NUM_INTRAOP_THREADS threads
+TF_INTEROP_THREADS = 2
+# One directory per user, since the lock files of other users can't be opened
+CPU_LOCKS_DIR = os.path.join(tempfile.gettempdir(),
+                             f'snapper_ml_cpus_{os.getuid()}' if hasattr(os, 'getuid') else 'snapper_ml_cpus')
+
+# Lock files of the cores claimed by this process, kept open to hold the locks until it exits
+_cpu_locks: List[IO] = []
+
+
+def thread_env_vars(num_threads: int) -> Dict[str, str]:
+    """
+    Environment variables that limit the thread pools of the native libraries.
+    """
+    env_vars = {name: str(num_threads) for name in THREAD_ENV_VARS}
+    env_vars['TF_NUM_INTEROP_THREADS'] = str(min(num_threads, TF_INTEROP_THREADS))
+    return env_vars
+
+
+def limit_threads(num_threads: int):
+    """
+    Limit the thread pools of this process, including the libraries already loaded.
+    """
+    os.environ.update(thread_env_vars(num_threads))
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=num_threads)
+    except ImportError:
+        pass
+
+    if 'tensorflow' in sys.modules:
+        tf = sys.modules['tensorflow']
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(min(num_threads, TF_INTEROP_THREADS))
+        except RuntimeError:
+            # TensorFlow was already initialized, it keeps the limits of the environment variables
+            pass
+
+
+def pin_to_cpus(num_cpus: int, locks_dir: str = CPU_LOCKS_DIR) -> Optional[List[int]]:
+    """
+    Pin this process to *num_cpus* cores not claimed by other processes of the node.
+
+    :return: The cores of the process, or None if it could not be pinned
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        logger.warning('CPU pinning is not supported on this platform')
+        return None
+
+    import fcntl
+    os.makedirs(locks_dir, exist_ok=True)
+    claimed, locks = [], []
+    for cpu in sorted(os.sched_getaffinity(0)):
+        if len(claimed) == num_cpus:
+            break
+        try:
+            lock = open(os.path.join(locks_dir, f'{cpu}.lock'), 'w')
+        except OSError:
+            continue
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        locks.append(lock)
+        claimed.append(cpu)
+
+    if len(claimed) < num_cpus:
+        logger.warning(f'Only {len(claimed)} of {num_cpus} cores are free. The worker is not pinned')
+        for lock in locks:
+            lock.close()
+        return None
+
+    _cpu_locks.extend(locks)
+    os.sched_setaffinity(0, claimed)
+    logger.info(f'Worker pinned to the cores {claimed}')
+    return claimed
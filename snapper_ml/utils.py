@@ -1,3 +1,8 @@
+import os
+import re
+import sys
+import ctypes
+import threading
 from typing import *
 from docstring_parser import parse as parse_docstring
 
@@ -34,3 +39,98 @@ def get_description_from_function(func):
         docstring = parse_docstring(func.__doc__)
         description = f'{docstring.short_description}\n\n{docstring.long_description or ""}'
     return description
+
+
+BYTE_UNITS = {'': 1, 'k': 10 ** 3, 'm': 10 ** 6, 'g': 10 ** 9, 't': 10 ** 12,
+              'ki': 2 ** 10, 'mi': 2 ** 20, 'gi': 2 ** 30, 'ti': 2 ** 40}
+
+
+def parse_bytes(value: Union[int, str]) -> int:
+    """
+    Number of bytes of a size like 6GB, 512 MiB, 2g or 1000000.
+
+    :param value: Size in bytes, or a string with a decimal (KB, MB, GB, TB) or binary (KiB, MiB, GiB, TiB) unit
+    """
+    if isinstance(value, int):
+        return value
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]i?)?b?\s*', value.lower())
+    if not match:
+        raise ValueError(f'Invalid size: {value}. Use bytes or a unit like 512MB or 6GiB')
+    number, unit = match.groups()
+    return int(float(number) * BYTE_UNITS[unit or ''])
+
+
+def peak_memory() -> Optional[int]:
+    """
+    Peak resident memory of this process in bytes, or None if the platform doesn't report it.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_memory() -> Optional[int]:
+    """
+    Resident memory of this process in bytes, or None if the platform doesn't report it.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class TimeLimit:
+    """
+    Context manager that raises *exception* in the current thread when the block runs for more
+    than *seconds*.
+
+    The exception is raised asynchronously, the next time the thread runs Python code, so a
+    block stuck in native code (a C extension, a blocking call) is not interrupted.
+
+    :param seconds: Time limit. If None, the block is not limited
+    :param exception: Exception class raised in the thread
+    """
+
+    def __init__(self, seconds: Optional[float], exception: Type[BaseException] = TimeoutError):
+        self.seconds = seconds
+        self.exception = exception
+        self.expired = False
+        self._lock = threading.Lock()
+        self._finished = False
+        self._timer: Optional[threading.Timer] = None
+        self._thread_id: Optional[int] = None
+
+    def _set_async_exception(self, exception: Optional[Type[BaseException]]):
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(self._thread_id),
+                                                   ctypes.py_object(exception) if exception else None)
+
+    def _expire(self):
+        with self._lock:
+            if not self._finished:
+                self.expired = True
+                self._set_async_exception(self.exception)
+
+    def __enter__(self):
+        if self.seconds:
+            self._thread_id = threading.get_ident()
+            self._timer = threading.Timer(self.seconds, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, _):
+        if self._timer is None:
+            return False
+
+        with self._lock:
+            self._finished = True
+            self._timer.cancel()
+            if self.expired and exception_type is None:
+                # The block finished right after the time limit, before the exception was raised
+                self._set_async_exception(None)
+        return False
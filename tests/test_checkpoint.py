@@ -0,0 +1,26 @@
+import mlflow
+
+from snapper_ml import checkpoint
+
+
+def test_checkpoint_is_stored_when_paused_and_restored_on_resume(tmp_path):
+    mlflow.set_tracking_uri(f'sqlite:///{tmp_path}/mlflow.db')
+    # Artifacts are stored under tmp_path instead of ./mlruns
+    mlflow.set_experiment(experiment_id=mlflow.create_experiment('checkpoint', artifact_location=tmp_path.as_uri()))
+
+    with mlflow.start_run() as run:
+        checkpoint.reset()
+        assert checkpoint.load() is None and not checkpoint.store()
+        checkpoint.save({'epoch': 1})
+        checkpoint.save({'epoch': 2})
+        assert checkpoint.store()
+
+    checkpoint.reset()
+    checkpoint.restore(run.info.run_id)
+    assert checkpoint.load() == {'epoch': 2}
+
+    with mlflow.start_run() as other_run:
+        pass
+    # Trials that never saved a checkpoint start from the first step
+    checkpoint.restore(other_run.info.run_id)
+    assert checkpoint.load() is None
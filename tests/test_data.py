@@ -0,0 +1,297 @@
+# python -m pytest
+import os
+import numpy as np
+import pytest
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler, MinMaxScaler, MaxAbsScaler
+
+import snapper_ml.data
+
+from snapper_ml.config.models import Data, DataType
+from snapper_ml.data import UnifiedDataLoader, SplitDataLoader, DELIMITER, SEED, VALIDATION_SPLIT, \
+    find_data_files, load_file, load_files, warm_cache
+from snapper_ml.data.cache import DatasetCache, FileFingerprint, CACHE_DIR_ENV
+from snapper_ml.data.manifest import IngestManifest
+from snapper_ml.data.parsing import read_numeric_text
+from snapper_ml.data.statistics import ColumnStatistics
+from snapper_ml.data.streaming import StreamingDataLoader
+
+NUM_ROWS = 200
+NUM_COLUMNS = 8
+
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path / 'cache'))
+    rng = np.random.default_rng(0)
+    folder = tmp_path / 'data'
+    folder.mkdir()
+    for name in ['protonQGSJet.txt', 'ironQGSJet.txt']:
+        np.savetxt(folder / name, rng.random((NUM_ROWS, NUM_COLUMNS)), delimiter=DELIMITER, fmt='%.6f')
+    return folder
+
+
+@pytest.fixture
+def data(data_folder):
+    return Data(folder=str(data_folder), files=['*QGSJet.txt'])
+
+
+def test_cache_stores_parsed_files(data, data_folder):
+    cache = DatasetCache()
+    assert cache.entries() == []
+
+    files = warm_cache(data)
+    entries = cache.entries()
+    assert len(entries) == len(files) == 2
+    assert all(entry.shape == (NUM_ROWS, NUM_COLUMNS - 3) for entry in entries)
+
+    cached = load_file(files[0], data)
+    assert isinstance(cached, np.memmap)
+    parsed = load_file(files[0], data.model_copy(update={'cache': False}))
+    np.testing.assert_array_equal(cached, parsed)
+
+
+def test_cache_misses_when_file_changes(data, data_folder):
+    warm_cache(data)
+    path = data_folder / 'ironQGSJet.txt'
+    np.savetxt(path, np.ones((10, NUM_COLUMNS)), delimiter=DELIMITER, fmt='%.6f')
+
+    assert load_file(str(path), data).shape == (10, NUM_COLUMNS - 3)
+    cache = DatasetCache()
+    assert len(cache.entries()) == 3
+
+    evicted = cache.evict(lambda entry: not entry.fingerprint.matches())
+    assert len(evicted) == 1
+    assert evicted[0].shape == (NUM_ROWS, NUM_COLUMNS - 3)
+
+
+def test_fingerprint_includes_contents(data_folder):
+    path = str(data_folder / 'protonQGSJet.txt')
+    fingerprint = FileFingerprint.from_path(path)
+    assert fingerprint.matches()
+    assert fingerprint == FileFingerprint.from_path(path)
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_loaders_output_shapes(data, cache):
+    data = data.model_copy(update={'cache': cache})
+    UnifiedDataLoader.set_data(data)
+    X_train, X_val, y_train, y_val = UnifiedDataLoader.load_data()
+    assert X_train.shape == (2 * NUM_ROWS * 0.8, NUM_COLUMNS - 3)
+    assert X_val.shape == (2 * NUM_ROWS * 0.2, NUM_COLUMNS - 3)
+    assert set(np.unique(y_train)) == {0, 1}
+
+    SplitDataLoader.set_data(data)
+    train_datasets, val_datasets = SplitDataLoader.load_data()
+    assert len(train_datasets) == len(val_datasets) == 2
+
+
+def test_fast_parser_matches_genfromtxt(data, data_folder):
+    path = str(data_folder / 'protonQGSJet.txt')
+    expected = np.genfromtxt(path, delimiter=DELIMITER, dtype=float, encoding='utf-8')
+    np.testing.assert_array_equal(read_numeric_text(path, delimiter=DELIMITER, chunk_rows=7), expected)
+
+
+def test_parallel_load_matches_sequential_load(data):
+    files = sorted(warm_cache(data))
+    sequential = load_files(files, data.model_copy(update={'num_workers': 1, 'cache': False}))
+    parallel = load_files(files, data.model_copy(update={'num_workers': 2}))
+    for expected, result in zip(sequential, parallel):
+        np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize('parser', ['fast', 'genfromtxt'])
+def test_column_projection(data_folder, parser):
+    path = data_folder / 'header.txt'
+    values = np.arange(20, dtype=float).reshape(4, 5)
+    np.savetxt(path, values, delimiter=DELIMITER, fmt='%.1f', header=DELIMITER.join('abcde'))
+
+    data = Data(folder=str(data_folder), files=['header.txt'], header=True, usecols=['e', 1], parser=parser)
+    np.testing.assert_array_equal(load_file(str(path), data), values[:, [4, 1]])
+
+    data = data.model_copy(update={'usecols': None, 'drop_columns': ['a', -1]})
+    np.testing.assert_array_equal(load_file(str(path), data), values[:, 1:4])
+
+
+def test_column_selection_validation():
+    with pytest.raises(ValueError):
+        Data(files=['*.txt'], usecols=[0], drop_columns=[1])
+    with pytest.raises(ValueError):
+        Data(files=['*.txt'], usecols=['energy'])
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float16'])
+def test_reduced_precision_datasets(data, dtype):
+    UnifiedDataLoader.set_data(data.model_copy(update={'dtype': DataType(dtype)}))
+    X_train, X_val, y_train, y_val = UnifiedDataLoader.load_data()
+    assert X_train.dtype == X_val.dtype == np.dtype(dtype)
+    assert y_train.dtype == y_val.dtype == np.int8
+
+    SplitDataLoader.set_data(data.model_copy(update={'dtype': DataType(dtype)}))
+    train_datasets, _ = SplitDataLoader.load_data()
+    assert all(X.dtype == np.dtype(dtype) and y.dtype == np.int8 for X, y in train_datasets)
+
+
+def test_unified_loader_matches_train_test_split(data):
+    UnifiedDataLoader.set_data(data)
+    X_train, X_val, y_train, y_val = UnifiedDataLoader.load_data()
+
+    datasets = [load_file(file, data) for file in find_data_files(data)]
+    X = np.concatenate(datasets)
+    y = np.concatenate([np.full(len(dataset), i) for i, dataset in enumerate(datasets)])
+    X_train_ref, X_val_ref, y_train_ref, y_val_ref = train_test_split(X, y, test_size=VALIDATION_SPLIT,
+                                                                      random_state=SEED)
+    scaler = StandardScaler()
+    np.testing.assert_allclose(X_train, scaler.fit_transform(X_train_ref), atol=1e-10)
+    np.testing.assert_allclose(X_val, scaler.transform(X_val_ref), atol=1e-10)
+    np.testing.assert_array_equal(y_train, y_train_ref)
+    np.testing.assert_array_equal(y_val, y_val_ref)
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_streaming_loader_batches(data, cache):
+    StreamingDataLoader.set_data(data.model_copy(update={'cache': cache, 'batch_size': 32}))
+    dataset = StreamingDataLoader.load_data()
+    assert dataset.num_train_rows + dataset.num_validation_rows == 2 * NUM_ROWS
+
+    train_batches = list(dataset.train_batches(seed=0))
+    assert all(len(X) == 32 for X, _ in train_batches[:-1])
+    assert len(train_batches) == dataset.steps_per_epoch()
+    X_train = np.concatenate([X for X, _ in train_batches])
+    y_train = np.concatenate([y for _, y in train_batches])
+    assert len(X_train) == dataset.num_train_rows
+    assert set(np.unique(train_batches[0][1])) == {0, 1}
+    np.testing.assert_allclose(X_train.mean(axis=0), 0, atol=1e-10)
+    np.testing.assert_allclose(X_train.std(axis=0), 1, atol=1e-10)
+
+    X_val = np.concatenate([X for X, _ in dataset.validation_batches()])
+    assert len(X_val) == dataset.num_validation_rows
+    second_pass = np.concatenate([X for X, _ in dataset.validation_batches()])
+    np.testing.assert_array_equal(X_val, second_pass)
+
+    entries = DatasetCache().entries()
+    assert [entry.shape for entry in entries] == ([(NUM_ROWS, NUM_COLUMNS - 3)] * 2 if cache else [])
+
+
+def test_incremental_loading_only_ingests_new_files(data, data_folder, monkeypatch):
+    data = data.model_copy(update={'incremental': True})
+    UnifiedDataLoader.set_data(data)
+    X_train, X_val, y_train, y_val = UnifiedDataLoader.load_data()
+    assert len(X_train) + len(X_val) == 2 * NUM_ROWS
+    np.testing.assert_allclose(X_train.mean(axis=0), 0, atol=1e-10)
+    np.testing.assert_allclose(X_train.std(axis=0), 1, atol=1e-10)
+
+    manifest = IngestManifest.open(data)
+    labels = {path: record.label for path, record in manifest.records.items()}
+    np.savetxt(data_folder / 'heliumQGSJet.txt', np.ones((50, NUM_COLUMNS)), delimiter=DELIMITER, fmt='%.1f')
+
+    ingested = []
+    original_load_entries = snapper_ml.data.load_entries
+    monkeypatch.setattr(snapper_ml.data, 'load_entries',
+                        lambda paths, data: ingested.extend(paths) or original_load_entries(paths, data))
+    UnifiedDataLoader.set_data(data)
+    X_train_new, X_val_new, y_train_new, _ = UnifiedDataLoader.load_data()
+
+    assert [os.path.basename(path) for path in ingested] == ['heliumQGSJet.txt']
+    assert len(X_train_new) + len(X_val_new) == 2 * NUM_ROWS + 50
+    assert set(np.unique(y_train_new)) == {0, 1, 2}
+    manifest = IngestManifest.open(data)
+    assert all(manifest.records[path].label == label for path, label in labels.items())
+    # The split of the files already ingested doesn't change
+    assert np.count_nonzero(y_train_new < 2) == len(X_train)
+
+
+def test_incremental_loading_after_removing_an_evicted_file(data, data_folder):
+    data = data.model_copy(update={'incremental': True})
+    UnifiedDataLoader.set_data(data)
+    UnifiedDataLoader.load_data()
+
+    path = data_folder / 'ironQGSJet.txt'
+    os.remove(path)
+    assert len(DatasetCache().evict(lambda entry: entry.fingerprint.path == str(path))) == 1
+
+    UnifiedDataLoader.set_data(data)
+    X_train, X_val, y_train, _ = UnifiedDataLoader.load_data()
+    assert len(X_train) + len(X_val) == NUM_ROWS
+    assert set(np.unique(y_train)) == {0}
+    assert list(IngestManifest.open(data).records) == [str(data_folder / 'protonQGSJet.txt')]
+
+
+def test_column_statistics_merge(data_folder):
+    rng = np.random.default_rng(0)
+    X = rng.normal(loc=1e6, size=(100, 3))
+    merged = ColumnStatistics.merge_all(ColumnStatistics.from_array(part) for part in np.array_split(X, 7))
+    full = ColumnStatistics.from_array(X)
+    np.testing.assert_allclose(merged.var, X.var(axis=0))
+    np.testing.assert_allclose(merged.sum, full.sum)
+    np.testing.assert_array_equal(merged.min, X.min(axis=0))
+
+    for scaler_class in [StandardScaler, MinMaxScaler]:
+        np.testing.assert_allclose(merged.to_scaler(scaler_class).transform(X),
+                                   scaler_class().fit_transform(X), atol=1e-8)
+
+
+def test_statistics_sidecar(data, monkeypatch):
+    warm_cache(data)
+    entries = DatasetCache().entries()
+    for entry in entries:
+        array = np.asarray(entry.open())
+        stats = entry.statistics()
+        assert stats.count == NUM_ROWS
+        np.testing.assert_allclose(stats.mean, array.mean(axis=0))
+        np.testing.assert_array_equal(stats.max, array.max(axis=0))
+
+    StreamingDataLoader.set_data(data)
+    dataset = StreamingDataLoader.load_data()
+    X_train = np.concatenate([X for X, _ in dataset.train_batches(shuffle=False)])
+    np.testing.assert_allclose(X_train.mean(axis=0), 0, atol=1e-10)
+
+    # The split statistics are stored, so warm loads don't read the data to fit the scaler
+    monkeypatch.setattr(snapper_ml.data.cache, 'iter_row_chunks', None)
+    warm = StreamingDataLoader.load_data()
+    assert (warm.num_train_rows, warm.num_validation_rows) == (dataset.num_train_rows, dataset.num_validation_rows)
+    np.testing.assert_array_equal(warm.scaler.scale_, dataset.scaler.scale_)
+
+
+def test_streaming_loader_caches_files_block_by_block(data, monkeypatch):
+    def parse_file(*args, **kwargs):
+        raise AssertionError('The streaming loader parsed a whole file in memory')
+
+    monkeypatch.setattr(snapper_ml.data, '_parse_file', parse_file)
+    # In this process, so the spy sees the parsing
+    StreamingDataLoader.set_data(data.model_copy(update={'num_workers': 1}))
+    dataset = StreamingDataLoader.load_data()
+    assert dataset.num_train_rows + dataset.num_validation_rows == 2 * NUM_ROWS
+    assert [entry.shape for entry in DatasetCache().entries()] == [(NUM_ROWS, NUM_COLUMNS - 3)] * 2
+
+@pytest.mark.parametrize('scaler_class', [StandardScaler, MaxAbsScaler])
+def test_streaming_epochs_read_the_cached_arrays(data, monkeypatch, scaler_class):
+    monkeypatch.setattr(StreamingDataLoader, 'scaler_class', scaler_class)
+    StreamingDataLoader.set_data(data)
+    dataset = StreamingDataLoader.load_data()
+    first_epoch = np.concatenate([X for X, _ in dataset.train_batches(seed=0)])
+
+    def hash_file(path):
+        raise AssertionError('An epoch hashed a source file again')
+
+    monkeypatch.setattr(snapper_ml.data.cache, '_hash_file', hash_file)
+    np.testing.assert_array_equal(np.concatenate([X for X, _ in dataset.train_batches(seed=0)]), first_epoch)
+
+def test_default_loaders_build_scalers_from_the_sidecar(data, monkeypatch):
+    UnifiedDataLoader.set_data(data)
+    SplitDataLoader.set_data(data)
+    unified = UnifiedDataLoader.load_data()
+    train_datasets, val_datasets = SplitDataLoader.load_data()
+
+    for dataset, (X_train, _), (X_val, _) in zip(load_files(find_data_files(data), data), train_datasets, val_datasets):
+        X_train_ref, X_val_ref = train_test_split(dataset, test_size=VALIDATION_SPLIT, random_state=SEED)
+        scaler = MinMaxScaler()
+        np.testing.assert_allclose(X_train, scaler.fit_transform(X_train_ref), atol=1e-6)
+        np.testing.assert_allclose(X_val, scaler.transform(X_val_ref), atol=1e-6)
+
+    # Warm loads don't read the data to fit the scalers
+    monkeypatch.setattr(snapper_ml.data.cache, 'iter_row_chunks', None)
+    for warm, cold in zip(UnifiedDataLoader.load_data(), unified):
+        np.testing.assert_array_equal(warm, cold)
+    np.testing.assert_array_equal(SplitDataLoader.load_data()[0][0][0], train_datasets[0][0])
+
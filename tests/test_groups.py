@@ -0,0 +1,138 @@
+import gc
+import os
+import time
+import weakref
+
+import mlflow
+import optuna
+import pytest
+import ray
+from optuna.trial import TrialState
+
+from snapper_ml import Trial
+from snapper_ml.callbacks.core import CallbacksHandler
+from snapper_ml.config.models import GroupConfig, Settings
+from snapper_ml.experiments import _run_group
+from snapper_ml.mlflow import AutologgingBackend, clear_sessions
+from snapper_ml.optuna import RETRY_OF_ATTR, PEAK_MEMORY_ATTR, TIMED_OUT_ATTR
+
+CRASHING_TRIAL = 2
+HANGING_TRIAL = 1
+
+
+def crash_on_trial(x: float):
+    # The process of the worker dies, like when it is killed for using too much memory
+    if Trial.get_current().number == CRASHING_TRIAL:
+        os._exit(1)
+    return {'score': x}
+
+
+def crash_on_trial_steps(x: float):
+    for step in range(3):
+        if Trial.get_current().number == CRASHING_TRIAL:
+            os._exit(1)
+        yield {'score': x * (step + 1)}
+
+
+def hang_on_trial(x: float):
+    # Stuck where the time limit can't interrupt it, so its worker is killed
+    if Trial.get_current().number == HANGING_TRIAL:
+        time.sleep(1000)
+    return {'score': x}
+
+
+def record_process(x: float):
+    Trial.get_current().set_user_attr('pid', os.getpid())
+    return {'score': x}
+
+
+@pytest.fixture(scope='module')
+def local_ray(tmp_path_factory):
+    # Workers start in the current directory, where they write their logs
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('workers'))
+    # Workers need to import this module to unpickle the main functions
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    path = os.pathsep.join([tests_dir, os.path.dirname(tests_dir)])
+    ray.init(num_cpus=2, include_dashboard=False, log_to_driver=False,
+             runtime_env={'env_vars': {'PYTHONPATH': path}})
+    yield
+    ray.shutdown()
+    os.chdir(cwd)
+
+
+def run_group(func, tmp_path, monkeypatch, **kwargs) -> optuna.Study:
+    monkeypatch.chdir(tmp_path)
+    settings = Settings(MLFLOW_TRACKING_URI=f'sqlite:///{tmp_path}/mlflow.db',
+                        OPTUNA_STORAGE_URI=f'sqlite:///{tmp_path}/optuna.db')
+    config = GroupConfig(name='group', param_space={'x': 'uniform(0, 1)'},
+                         metric={'name': 'score', 'direction': 'maximize'},
+                         resources_per_worker={'cpu': 1, 'threads': None}, run=[__file__], **kwargs)
+    mlflow.set_tracking_uri(settings.MLFLOW_TRACKING_URI)
+    mlflow.set_experiment(experiment_id=mlflow.create_experiment(config.name, artifact_location=tmp_path.as_uri()))
+
+    _run_group(func, config, None, CallbacksHandler(callbacks=[], config=config), settings,
+               autologging_backends=None, log_seeds=False, delete_if_failed=False, log_system_info=False,
+               tracking_uri=settings.MLFLOW_TRACKING_URI)
+    return optuna.load_study(study_name=config.name, storage=settings.OPTUNA_STORAGE_URI)
+
+
+@pytest.mark.parametrize('func, mode', [(crash_on_trial, {'study_mode': 'workers'}),
+                                        (crash_on_trial, {'study_mode': 'driver'}),
+                                        (crash_on_trial_steps, {'study_mode': 'driver', 'asha': {'max_resource': 3}})])
+def test_trials_of_dead_workers_run_again(local_ray, tmp_path, monkeypatch, func, mode):
+    study = run_group(func, tmp_path, monkeypatch, num_trials=6, trials_per_lease=2, **mode)
+
+    lost = study.trials[CRASHING_TRIAL]
+    assert lost.state == TrialState.FAIL
+    retries = [trial for trial in study.trials if trial.user_attrs.get(RETRY_OF_ATTR) == CRASHING_TRIAL]
+    assert len(retries) == 1 and retries[0].params == lost.params
+    # The lost trial, and any trial of its lease that didn't start, were dispatched again
+    finished = [trial for trial in study.trials if trial.state in (TrialState.COMPLETE, TrialState.PRUNED)]
+    assert len(finished) == 6
+
+
+def test_finished_trials_of_timed_out_leases_are_kept(local_ray, tmp_path, monkeypatch):
+    study = run_group(hang_on_trial, tmp_path, monkeypatch, num_trials=6, trials_per_lease=3,
+                      timeout_per_trial=1, study_mode='driver')
+
+    # The lease of the hanging trial: the trial before it finished, the one after it never started
+    finished, timed_out, unstarted = study.trials[:3]
+    assert finished.state == TrialState.COMPLETE and RETRY_OF_ATTR not in finished.user_attrs
+    assert timed_out.state == TrialState.FAIL and timed_out.user_attrs[TIMED_OUT_ATTR]
+    assert unstarted.state == TrialState.FAIL
+    retries = [trial.user_attrs.get(RETRY_OF_ATTR) for trial in study.trials if RETRY_OF_ATTR in trial.user_attrs]
+    assert retries == [unstarted.number]
+    assert [trial.state for trial in study.trials].count(TrialState.COMPLETE) == 5
+
+
+@pytest.mark.parametrize('study_mode, limit', [('workers', {'max_trials_per_worker': 1}),
+                                               ('driver', {'max_worker_memory': 1})])
+def test_workers_are_recycled(local_ray, tmp_path, monkeypatch, study_mode, limit):
+    study = run_group(record_process, tmp_path, monkeypatch, num_trials=4, study_mode=study_mode, **limit)
+    assert [trial.state for trial in study.trials] == [TrialState.COMPLETE] * 4
+    # Every trial ran in a new worker process
+    assert len({trial.user_attrs['pid'] for trial in study.trials}) == 4
+    # The peak memory is only stored to size the workers of memory: auto
+    assert not any(PEAK_MEMORY_ATTR in trial.user_attrs for trial in study.trials)
+
+
+class Cycle:
+    def __init__(self):
+        self.self = self
+
+
+def test_sessions_are_cleared_between_trials():
+    gc.disable()
+    try:
+        cycle = weakref.ref(Cycle())
+        clear_sessions(None)
+        assert cycle() is None
+    finally:
+        gc.enable()
+
+    tensorflow = pytest.importorskip('tensorflow')
+    tensorflow.keras.layers.Dense(1)
+    clear_sessions([AutologgingBackend.KERAS])
+    # Keras names layers again from scratch in a new session
+    assert tensorflow.keras.layers.Dense(1).name == 'dense'
@@ -0,0 +1,324 @@
+import time
+import pickle
+import threading
+
+import optuna
+import pytest
+import ray
+from ray import cloudpickle
+from optuna.trial import FrozenTrial, TrialState
+
+from snapper_ml.config.models import GroupConfig, Settings, OptimizationDirection
+from snapper_ml.optuna import RETRY_OF_ATTR, create_optuna_study, optimize_optuna_study, resume_optuna_study, \
+    param_space_distributions, sample_params_from_distributions, find_duplicate_trial, PEAK_MEMORY_ATTR, \
+    TIMED_OUT_ATTR
+from snapper_ml.experiments import _workers_fitting, _observed_peak_memory, _configured_max_workers, \
+    _validate_project_settings, _calculate_concurrent_workers
+from snapper_ml.optuna.asha import SuccessiveHalving
+from snapper_ml.optuna.storages import WriteBehindStorage, get_storage, _rdb_backend
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return Settings(MLFLOW_TRACKING_URI='mlruns', OPTUNA_STORAGE_URI=f'sqlite:///{tmp_path}/optuna.db')
+
+
+def make_config(**kwargs) -> GroupConfig:
+    kwargs.setdefault('name', 'resume')
+    return GroupConfig(num_trials=10, param_space={'x': 'uniform(0, 1)'},
+                       metric={'name': 'score', 'direction': 'maximize'}, run=[__file__], **kwargs)
+
+
+def interrupted_study(config: GroupConfig, settings: Settings) -> optuna.Study:
+    study = create_optuna_study(config, settings)
+    distributions = {'x': optuna.distributions.FloatDistribution(0, 1)}
+    for state in [TrialState.COMPLETE, TrialState.PRUNED, TrialState.FAIL]:
+        trial = study.ask(distributions)
+        study.tell(trial, 0.5 if state == TrialState.COMPLETE else None, state=state)
+    # Left running by a worker that died
+    study.ask(distributions)
+    return study
+
+
+def test_resume_counts_finished_trials_and_requeues_failed_ones(settings):
+    config = make_config()
+    interrupted_study(config, settings)
+
+    study = create_optuna_study(config, settings)
+    num_finished, stale_trials = resume_optuna_study(study)
+
+    assert num_finished == 2
+    assert [trial.number for trial in stale_trials] == [3]
+    states = [trial.state for trial in study.trials]
+    assert states[3] == TrialState.FAIL and states.count(TrialState.WAITING) == 1
+    # Only the trial interrupted by the previous launch, not the one that failed during it
+    waiting = study.get_trials(states=(TrialState.WAITING,))
+    assert [trial.user_attrs[RETRY_OF_ATTR] for trial in waiting] == [3]
+    assert waiting[0].system_attrs['fixed_params'] == study.trials[3].params
+
+    # Stale trials are enqueued again only once
+    assert resume_optuna_study(study)[0] == 2
+    assert len(study.get_trials(states=(TrialState.WAITING,))) == 1
+
+
+def test_resume_does_not_requeue_timed_out_trials(settings):
+    config = make_config()
+    study = create_optuna_study(config, settings)
+    distributions = {'x': optuna.distributions.FloatDistribution(0, 1)}
+    timed_out = study.ask(distributions)
+    timed_out.set_user_attr(TIMED_OUT_ATTR, True)
+    study.tell(timed_out, state=TrialState.FAIL)
+    # Interrupted after it was marked as timed out, but before it failed
+    study.ask(distributions).set_user_attr(TIMED_OUT_ATTR, True)
+
+    study = create_optuna_study(config, settings)
+    assert resume_optuna_study(study)[1][0].number == 1
+    assert [trial.state for trial in study.trials] == [TrialState.FAIL] * 2
+
+
+def test_fresh_start_deletes_previous_trials(settings):
+    interrupted_study(make_config(), settings)
+    study = create_optuna_study(make_config(fresh_start=True), settings)
+    assert study.trials == []
+
+
+def test_driver_sampled_params_match_the_param_space():
+    config = GroupConfig(name='driver', num_trials=1, run=[__file__],
+                         param_space={'lr': 'loguniform(0.001, 0.1)', 'units': ['range(2, 10)', 'randint(1, 3)'],
+                                      'activation': "choice(['relu', 'selu'])"})
+    distributions = param_space_distributions(config.param_space)
+    assert sorted(distributions) == ['activation', 'lr', 'units_0', 'units_1']
+
+    trial = optuna.create_study().ask(distributions)
+    # Workers rebuild the structured params from the flat params sampled by the driver
+    params = sample_params_from_distributions(optuna.trial.FixedTrial(trial.params), config.param_space)
+    assert params == {'lr': trial.params['lr'], 'activation': trial.params['activation'],
+                      'units': [trial.params['units_0'], trial.params['units_1']]}
+
+
+def stored_trial(settings: Settings, study: optuna.Study) -> FrozenTrial:
+    return optuna.load_study(study_name=study.study_name, storage=settings.OPTUNA_STORAGE_URI).trials[-1]
+
+
+def test_write_behind_storage_buffers_until_the_trial_finishes(settings):
+    study = create_optuna_study(make_config(optuna_storage={'write_behind': True, 'flush_interval': None}), settings)
+    assert isinstance(study._storage, WriteBehindStorage)
+
+    trial = study.ask()
+    x = trial.suggest_float('x', 0, 1)
+    trial.report(0.1, step=0)
+    trial.report(0.2, step=1)
+
+    # The buffered writes are visible through the study, not yet in the database
+    assert study.trials[-1].params == {'x': x} and study.trials[-1].intermediate_values == {0: 0.1, 1: 0.2}
+    assert stored_trial(settings, study).params == {}
+
+    study.tell(trial, 0.3)
+    stored = stored_trial(settings, study)
+    assert stored.state == TrialState.COMPLETE
+    assert stored.params == {'x': x} and stored.intermediate_values == {0: 0.1, 1: 0.2}
+
+
+def test_write_behind_storage_flushes_periodically_and_when_pickled(settings):
+    study = create_optuna_study(make_config(optuna_storage={'write_behind': True, 'flush_interval': 0.1}), settings)
+    trial = study.ask()
+    trial.suggest_float('x', 0, 1)
+
+    deadline = time.time() + 5
+    while not stored_trial(settings, study).params and time.time() < deadline:
+        time.sleep(0.05)
+    assert 'x' in stored_trial(settings, study).params
+
+    trial.report(0.5, step=0)
+    copy = pickle.loads(pickle.dumps(study))
+    assert stored_trial(settings, study).intermediate_values == {0: 0.5}
+    assert copy.trials[-1].intermediate_values == {0: 0.5}
+    study._storage.close()
+
+
+def test_write_behind_storage_stops_flushing_after_each_lease(settings):
+    config = make_config(optuna_storage={'write_behind': True, 'flush_interval': 0.1})
+    study = create_optuna_study(config, settings)
+    num_threads = threading.active_count()
+
+    for _ in range(5):
+        # Every lease unpickles its own copy of the study
+        lease = pickle.loads(pickle.dumps(study))
+        optimize_optuna_study(lease, lambda trial: trial.suggest_float('x', 0, 1),
+                              config.model_copy(update={'num_trials': 1}))
+
+    assert threading.active_count() == num_threads
+    assert [len(trial.params) for trial in optuna.load_study(study_name=study.study_name,
+                                                                storage=settings.OPTUNA_STORAGE_URI).trials] == [1] * 5
+
+def test_write_behind_storage_keeps_the_writes_that_fail(settings):
+    study = create_optuna_study(make_config(optuna_storage={'write_behind': True, 'flush_interval': None}), settings)
+    storage = study._storage
+    # The pinned Optuna versions are written through the private API of the relational storages
+    assert _rdb_backend(storage) is not None
+    study.optimize(lambda trial: trial.suggest_float('x', 0, 1), n_trials=1)
+
+    bad, good = study.ask(), study.ask()
+    storage.set_trial_param(bad._trial_id, 'x', 0, optuna.distributions.CategoricalDistribution(['a']))
+    good.report(0.5, step=0)
+    with pytest.raises(ValueError):
+        storage.flush()
+    # The writes of the other trials are not held back
+    assert stored_trial(settings, study).intermediate_values == {0: 0.5}
+
+    # The failed ones stay buffered, visible and raised again
+    assert study.trials[bad.number].params == {'x': 'a'}
+    with pytest.raises(ValueError):
+        storage.flush(bad._trial_id)
+    assert storage._pending[bad._trial_id]
+
+
+def test_history_cache_is_kept_by_the_process_instead_of_pickled(settings):
+    study = create_optuna_study(make_config(), settings)
+    size = len(pickle.dumps(study._storage))
+    study.optimize(lambda trial: trial.suggest_float('x', 0, 1), n_trials=20)
+    assert len(study.trials) == 20
+
+    # The trial history cached by the storage is not sent with the study
+    assert len(pickle.dumps(study._storage)) == size
+    assert pickle.loads(pickle.dumps(study))._storage is study._storage
+    # Ray pickles the study with cloudpickle to send it to the workers
+    assert cloudpickle.loads(cloudpickle.dumps(study))._storage is study._storage
+    assert create_optuna_study(make_config(), settings)._storage is study._storage
+
+
+def test_local_mode_stores_the_study_in_a_journal_file(tmp_path, monkeypatch):
+    monkeypatch.delenv('MLFLOW_TRACKING_URI', raising=False)
+    monkeypatch.delenv('OPTUNA_STORAGE_URI', raising=False)
+    settings = Settings(LOCAL_STORAGE_DIR=str(tmp_path / 'local'))
+    assert settings.MLFLOW_TRACKING_URI == f'sqlite:///{tmp_path}/local/mlflow.db'
+    assert settings.OPTUNA_STORAGE_URI == f'journal://{tmp_path}/local/optuna.journal'
+
+    study = create_optuna_study(make_config(), settings)
+    study.optimize(lambda trial: trial.suggest_float('x', 0, 1), n_trials=3)
+
+    assert (tmp_path / 'local' / 'optuna.journal').exists()
+    stored = optuna.load_study(study_name='resume', storage=get_storage(settings.OPTUNA_STORAGE_URI))
+    assert [trial.state for trial in stored.trials] == [TrialState.COMPLETE] * 3
+
+
+def test_local_mode_is_decided_by_the_unset_storage_uris(tmp_path, monkeypatch):
+    monkeypatch.delenv('MLFLOW_TRACKING_URI', raising=False)
+    monkeypatch.delenv('OPTUNA_STORAGE_URI', raising=False)
+    local_dir = tmp_path / 'local'
+    # A server URI that happens to contain the local directory is not local storage
+    settings = Settings(LOCAL_STORAGE_DIR=str(local_dir), OPTUNA_STORAGE_URI=f'sqlite:///{local_dir}/optuna.db')
+    assert settings.is_local('MLFLOW_TRACKING_URI') and not settings.is_local('OPTUNA_STORAGE_URI')
+
+    settings = Settings(LOCAL_STORAGE_DIR=str(local_dir), MLFLOW_TRACKING_URI=f'sqlite:///{tmp_path}/mlflow.db',
+                        OPTUNA_STORAGE_URI='')
+    assert not settings.is_local('MLFLOW_TRACKING_URI') and settings.is_local('OPTUNA_STORAGE_URI')
+    _validate_project_settings(make_config(), settings)
+    assert local_dir.is_dir()
+
+
+def test_group_samplers_account_for_running_trials(settings):
+    assert create_optuna_study(make_config(), settings).sampler._constant_liar
+    assert create_optuna_study(make_config(name='tpe', sampler='tpe'), settings).sampler._constant_liar
+
+
+def test_duplicates_of_complete_trials_are_found(settings):
+    study = create_optuna_study(make_config(), settings)
+    distributions = {'units': optuna.distributions.CategoricalDistribution([16, 32])}
+    for units, state in [(16, TrialState.FAIL), (32, TrialState.COMPLETE), (16, TrialState.COMPLETE)]:
+        study.enqueue_trial({'units': units})
+        trial = study.ask(distributions)
+        study.tell(trial, 1.0 if state == TrialState.COMPLETE else None, state=state)
+
+    assert find_duplicate_trial(study, {'units': 16}).number == 2
+    assert find_duplicate_trial(study, {'units': 32}).number == 1
+    assert find_duplicate_trial(study, {'units': 64}) is None
+
+
+def test_asha_promotes_the_best_trial_of_every_rung():
+    asha = SuccessiveHalving(min_resource=1, reduction_factor=3, max_resource=9,
+                             direction=OptimizationDirection.MAXIMIZE)
+    assert asha.rungs == [1, 3, 9] and asha.start_step(2) == 3
+
+    asha.report(0, rung=0, value=0.5)
+    asha.report(1, rung=0, value=0.9)
+    assert asha.next_promotion() is None
+    asha.report(2, rung=0, value=0.1)
+    assert asha.next_promotion() == (1, 1)
+    assert asha.next_promotion() is None
+
+    for number, value in [(3, 0.8), (4, 0.2), (5, 0.3)]:
+        asha.report(number, rung=0, value=value)
+    # The second best trial of the rung, since the best one was already promoted
+    assert asha.next_promotion() == (3, 1)
+    assert asha.paused_trials() == {0: 0, 2: 0, 4: 0, 5: 0}
+
+
+def test_asha_requires_the_driver_study_mode():
+    with pytest.raises(ValueError):
+        make_config(asha={'max_resource': 9})
+    config = make_config(asha={'max_resource': 9}, study_mode='driver')
+    assert config.asha.min_resource == 1 and config.asha.reduction_factor == 3
+
+
+def test_driver_study_mode_has_no_pruner():
+    with pytest.raises(ValueError):
+        make_config(pruner='median', study_mode='driver')
+    assert make_config(pruner='median').pruner
+
+
+def test_driver_study_mode_writes_the_params_of_a_trial_at_once(settings):
+    study = create_optuna_study(make_config(study_mode='driver'), settings)
+    trial = study.ask({'x': optuna.distributions.FloatDistribution(0, 1),
+                       'y': optuna.distributions.FloatDistribution(0, 1)})
+    assert stored_trial(settings, study).params == {}
+    # Flushed by the driver before it dispatches the lease
+    study._storage.flush()
+    assert stored_trial(settings, study).params == trial.params
+
+
+def test_worker_memory_caps_the_number_of_workers(settings):
+    config = make_config(resources_per_worker={'cpu': 1, 'memory': '6GB'})
+    assert config.resources_per_worker.memory == 6 * 10 ** 9
+    assert make_config(resources_per_worker={'memory': '512 MiB'}).resources_per_worker.memory == 2 ** 29
+    with pytest.raises(ValueError):
+        make_config(resources_per_worker={'memory': 'lots'})
+    # 16 CPUs, but memory for 2 workers only
+    assert _workers_fitting(config, 16, 0, 13 * 10 ** 9, config.resources_per_worker.memory) == pytest.approx(13 / 6)
+
+    config = make_config(resources_per_worker={'memory': 'auto'})
+    study = create_optuna_study(config, settings)
+    assert _observed_peak_memory(study) is None
+    for peak in [100, 200]:
+        trial = study.ask()
+        trial.set_user_attr(PEAK_MEMORY_ATTR, peak)
+        study.tell(trial, 1.0)
+    assert _observed_peak_memory(study) == 240
+
+
+def test_workers_that_do_not_fit_name_the_missing_resource(monkeypatch):
+    monkeypatch.setattr(ray, 'available_resources', lambda: {'CPU': 8.0, 'memory': 4.0 * 10 ** 9})
+    config = make_config(resources_per_worker={'cpu': 1, 'memory': '6GB'})
+    with pytest.raises(ValueError, match='6000000000 bytes of memory requested, 4000000000 available'):
+        _calculate_concurrent_workers(config, config.resources_per_worker.memory)
+    with pytest.raises(ValueError, match='16 CPUs requested, 8 available'):
+        _calculate_concurrent_workers(make_config(resources_per_worker={'cpu': 16}))
+    assert _calculate_concurrent_workers(make_config(resources_per_worker={'cpu': 4})) == 2
+
+def test_ray_config_caps_the_number_of_workers():
+    assert _configured_max_workers(make_config()) is None
+    config = make_config(kind='group', ray_config={'num_cpus': 8}, resources_per_worker={'cpu': 2})
+    assert _configured_max_workers(config) == 4
+    config = make_config(kind='group', ray_config={'num_cpus': 8, 'num_gpus': 1},
+                         resources_per_worker={'cpu': 2, 'gpu': 0.5})
+    assert _configured_max_workers(config) == 2
+    # GPUs don't limit workers that don't use them
+    assert _configured_max_workers(make_config(kind='group', ray_config={'num_gpus': 1})) is None
+
+
+def test_worker_recycling_limits_are_parsed():
+    config = make_config(max_trials_per_worker=20, max_worker_memory='2GB')
+    assert config.max_trials_per_worker == 20 and config.max_worker_memory == 2 * 10 ** 9
+    assert make_config().max_trials_per_worker is None and make_config().max_worker_memory is None
+    with pytest.raises(ValueError):
+        make_config(max_trials_per_worker=0)
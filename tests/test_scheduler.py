@@ -0,0 +1,236 @@
+import os
+import time
+
+import pytest
+import ray
+from ray.exceptions import RayActorError
+
+from snapper_ml.exceptions import TrialTimeout
+from snapper_ml import scheduler as scheduler_module
+from snapper_ml.scheduler import TrialScheduler, ConcurrencyController
+from snapper_ml.utils import TimeLimit
+
+
+@pytest.fixture(scope='module')
+def local_ray():
+    ray.init(num_cpus=2, include_dashboard=False, log_to_driver=False)
+    yield
+    ray.shutdown()
+
+
+@ray.remote
+def run_lease(num_trials: int, duration: float):
+    time.sleep(duration)
+    return num_trials
+
+
+def test_trials_are_leased_as_workers_free_up(local_ray):
+    durations = {'slow': 1.0, 'fast': 0.0}
+    submitted = []
+
+    def submit(worker, num_trials):
+        submitted.append((worker, num_trials))
+        return run_lease.remote(num_trials, durations[worker])
+
+    scheduler = TrialScheduler(['slow', 'fast'], submit, num_trials=7, trials_per_lease=2)
+    results = scheduler.run()
+
+    assert sorted(num_trials for _, num_trials in submitted) == [1, 2, 2, 2]
+    assert sum(results) == scheduler.num_completed == 7
+    # The fast worker ran the rest of the trials while the slow one was busy
+    assert [worker for worker, _ in submitted].count('slow') == 1
+    assert sorted(scheduler.idle_workers) == ['fast', 'slow']
+
+
+def test_failed_lease_cancels_the_rest(local_ray):
+    @ray.remote
+    def fail():
+        raise ValueError('Trial failed')
+
+    def submit(worker, num_trials):
+        return fail.remote() if worker == 'failing' else run_lease.remote(num_trials, 30)
+
+    scheduler = TrialScheduler(['failing', 'slow'], submit, num_trials=2)
+
+    with pytest.raises(ValueError):
+        scheduler.run()
+    assert not scheduler.pending
+
+
+def test_promoted_trials_are_resumed_before_new_ones(local_ray):
+    promotions = [('promoted', 0)]
+    submitted = []
+
+    def submit(worker, num_trials):
+        submitted.append('new')
+        return run_lease.remote(num_trials, 0)
+
+    def promote(worker):
+        if not promotions or not submitted:
+            return None
+        submitted.append(promotions.pop()[0])
+        return run_lease.remote(0, 0)
+
+    scheduler = TrialScheduler(['worker'], submit, num_trials=2, promote=promote)
+    results = scheduler.run()
+
+    # Promotions don't count as new trials, and the scheduler waits for them
+    assert submitted == ['new', 'promoted', 'new']
+    assert sum(results) == scheduler.num_completed == 2
+
+
+def test_scheduler_requires_workers():
+    with pytest.raises(ValueError):
+        TrialScheduler([], lambda worker, num_trials: None, num_trials=1)
+
+
+def test_stuck_leases_are_replaced_after_their_timeout(local_ray):
+    replaced = []
+
+    def submit(worker, num_trials):
+        # The stuck task is not killed, so it must not hold the CPUs of the next leases
+        if worker == 'stuck':
+            return run_lease.options(num_cpus=0).remote(num_trials, 60)
+        return run_lease.remote(num_trials, 0.1)
+
+    def on_timeout(worker, num_trials):
+        replaced.append(worker)
+        return 'replacement', 0
+
+    scheduler = TrialScheduler(['stuck', 'healthy'], submit, num_trials=6,
+                               trial_timeout=1, on_timeout=on_timeout, grace_period=1)
+    start = time.monotonic()
+    results = scheduler.run()
+
+    assert replaced == ['stuck'] and time.monotonic() - start < 20
+    assert scheduler.num_timed_out == 1 and sum(results) == 5
+    assert sorted(scheduler.idle_workers) == ['healthy', 'replacement']
+
+
+def test_unstarted_trials_of_timed_out_leases_are_dispatched_again(local_ray):
+    def submit(worker, num_trials):
+        if worker == 'stuck':
+            return run_lease.options(num_cpus=0).remote(num_trials, 60)
+        return run_lease.remote(num_trials, 0)
+
+    def on_timeout(worker, num_trials):
+        # The first trial of the lease got stuck, the other two never started
+        return 'replacement', num_trials - 1
+
+    scheduler = TrialScheduler(['stuck', 'healthy'], submit, num_trials=6, trials_per_lease=3,
+                               trial_timeout=0.5, on_timeout=on_timeout, grace_period=0.5)
+    assert sum(scheduler.run()) == 5
+    assert scheduler.num_timed_out == 1 and scheduler.num_completed == 6
+
+
+def test_workers_are_added_when_the_cluster_grows(local_ray):
+    cluster_size = [1]
+    workers = ['worker-0']
+    submitted = set()
+
+    def submit(worker, num_trials):
+        # The cluster grows while the first lease runs
+        cluster_size[0] = 3
+        submitted.add(worker)
+        return run_lease.options(num_cpus=0).remote(num_trials, 0.5)
+
+    def add_worker():
+        workers.append(f'worker-{len(workers)}')
+        return workers[-1]
+
+    concurrency = ConcurrencyController(lambda: cluster_size[0], check_interval=0.1)
+    scheduler = TrialScheduler(list(workers), submit, num_trials=7, concurrency=concurrency,
+                               add_worker=add_worker, remove_worker=workers.remove)
+    assert sum(scheduler.run()) == 7
+
+    assert len(workers) == 3 and sorted(scheduler.idle_workers) == workers
+    # Every new worker ran trials
+    assert submitted == set(workers)
+
+
+def test_auto_tune_settles_on_the_concurrency_with_the_highest_throughput(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(scheduler_module.time, 'monotonic', lambda: now[0])
+    concurrency = ConcurrencyController(lambda: 4, elastic=False, auto_tune=True, trials_per_level=2)
+    completed = 0
+
+    def run_level(level: int, seconds: float) -> int:
+        # Warm-up trials of every worker, and then the measured ones
+        nonlocal completed
+        assert concurrency.target(completed) == level
+        completed += level
+        assert concurrency.target(completed) == level
+        now[0] += seconds
+        completed += 2
+        return concurrency.target(completed)
+
+    assert run_level(4, seconds=60) == 3
+    assert run_level(3, seconds=30) == 2
+    # Slower than with 3 workers, which is kept
+    assert run_level(2, seconds=60) == 3
+    assert concurrency.target(completed + 10) == 3
+    assert concurrency.throughputs == {4: 2.0, 3: 4.0, 2: 2.0}
+
+
+@ray.remote(num_cpus=0)
+class CrashingWorker:
+    def __init__(self, crash: bool):
+        self.crash = crash
+
+    def run(self, num_trials: int):
+        if self.crash:
+            os._exit(1)
+        return num_trials
+
+
+def test_trials_of_dead_workers_are_dispatched_again(local_ray):
+    lost = []
+
+    def submit(worker, num_trials):
+        return worker.run.remote(num_trials)
+
+    def on_worker_lost(worker, num_trials):
+        lost.append(num_trials)
+        return CrashingWorker.remote(False), num_trials
+
+    scheduler = TrialScheduler([CrashingWorker.remote(True), CrashingWorker.remote(False)], submit,
+                               num_trials=5, on_worker_lost=on_worker_lost, max_retries=1)
+    assert sum(scheduler.run()) == scheduler.num_completed == 5
+    assert lost == [1] and scheduler.num_retries == 1
+
+    # Without retries left, a dead worker fails the run
+    scheduler = TrialScheduler([CrashingWorker.remote(True)], submit, num_trials=1,
+                               on_worker_lost=on_worker_lost, max_retries=0)
+    with pytest.raises(RayActorError):
+        scheduler.run()
+
+
+def test_workers_are_recycled_between_leases(local_ray):
+    recycled = []
+
+    def recycle(worker, num_trials, result):
+        # Replaced after every second lease
+        if worker.endswith('-1'):
+            recycled.append(worker)
+            return worker[:-1] + str(len(recycled) + 1)
+        return worker[:-1] + '1'
+
+    def submit(worker, num_trials):
+        return run_lease.remote(num_trials, 0)
+
+    scheduler = TrialScheduler(['worker-0'], submit, num_trials=5, recycle=recycle)
+    assert sum(scheduler.run()) == 5
+    # The last lease leaves no work to do, so its worker is not recycled
+    assert recycled == ['worker-1', 'worker-1'] and scheduler.idle_workers == ['worker-3']
+
+
+def test_time_limit_interrupts_python_code():
+    with pytest.raises(TrialTimeout):
+        with TimeLimit(0.2, TrialTimeout):
+            while True:
+                pass
+
+    with TimeLimit(0.2, TrialTimeout) as limit:
+        pass
+    time.sleep(0.3)
+    assert not limit.expired
@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pytest
+import ray
+
+from snapper_ml import DataLoader
+from snapper_ml.config.models import Data, Settings
+from snapper_ml.dataset_holder import DatasetHolder, dataset_fingerprint, get_dataset_holder
+from snapper_ml.experiments import data_registry, _register_data_loader, _share_persistent_data
+
+calls = []
+
+
+class CountingDataLoader(DataLoader):
+    @classmethod
+    def load_data(cls):
+        calls.append(cls)
+        return np.arange(10)
+
+
+class ChildDataLoader(CountingDataLoader):
+    @classmethod
+    def load_data(cls):
+        return super().load_data() * 2
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    calls.clear()
+    data_registry.clear()
+    yield
+    data_registry.clear()
+
+
+def test_load_data_runs_once_per_process():
+    _register_data_loader(CountingDataLoader, None)
+    first = CountingDataLoader.load_data()
+    assert CountingDataLoader.load_data() is first
+    # The base class returns the data of the registered loader
+    assert DataLoader.load_data() is first
+    assert calls == [CountingDataLoader]
+    assert data_registry.load_counts[CountingDataLoader.key()] == 1
+
+
+def test_subclass_calling_parent_load_data():
+    np.testing.assert_array_equal(ChildDataLoader.load_data(), np.arange(10) * 2)
+    ChildDataLoader.load_data()
+    assert calls == [ChildDataLoader]
+    assert data_registry.load_counts == {ChildDataLoader.key(): 1}
+
+
+def test_plain_function_loader():
+    _register_data_loader(lambda: calls.append(None) or 'data', None)
+    assert DataLoader.load_data() == DataLoader.load_data() == 'data'
+    assert len(calls) == 1
+
+
+def load_ones():
+    return np.ones(3)
+
+
+def load_zeros():
+    return np.zeros(3)
+
+
+def test_function_loaders_have_their_own_fingerprint(tmp_path):
+    (tmp_path / 'a.txt').write_text('1 2 3 4')
+    data = Data(folder=str(tmp_path), files=['*.txt'])
+    ones_key = _register_data_loader(load_ones, data)
+    assert DataLoader.load_data().sum() == 3
+    zeros_key = _register_data_loader(load_zeros, data)
+    assert DataLoader.load_data().sum() == 0
+
+    assert ones_key != zeros_key
+    assert dataset_fingerprint(ones_key, data) != dataset_fingerprint(zeros_key, data)
+
+
+@pytest.fixture(scope='module')
+def local_ray():
+    # Workers need to import this module to unpickle the data loader
+    ray.init(num_cpus=1, include_dashboard=False, log_to_driver=False,
+             runtime_env={'env_vars': {'PYTHONPATH': os.path.dirname(__file__)}})
+    yield
+    ray.shutdown()
+
+
+def test_workers_use_the_shared_copy(local_ray):
+    key = _register_data_loader(CountingDataLoader, None)
+    shared_data = {key: data_registry.share(key)}
+
+    @ray.remote
+    def trial(shared_data):
+        # The registry of the worker process, not a pickled copy of the driver's one
+        from snapper_ml.experiments import data_registry
+        data_registry.update(shared_data)
+        return CountingDataLoader.load_data().sum(), dict(data_registry.load_counts)
+
+    results = ray.get([trial.remote(shared_data) for _ in range(3)])
+    assert all(total == 45 and not load_counts for total, load_counts in results)
+    assert data_registry.load_counts[key] == 1
+
+
+def test_persistent_data_survives_the_registry(local_ray, tmp_path):
+    (tmp_path / 'a.txt').write_text('1 2 3 4')
+    data = Data(folder=str(tmp_path), files=['*.txt'], persist=True)
+    settings = Settings(MLFLOW_TRACKING_URI='mlruns', OPTUNA_STORAGE_URI=None)
+
+    key = _register_data_loader(CountingDataLoader, data)
+    object_id = _share_persistent_data(key, CountingDataLoader, data, settings)
+    # Loaded by the holder: the driver doesn't keep another copy
+    assert not data_registry.load_counts and not calls
+    # A later job in the same cluster starts with an empty registry
+    data_registry.clear()
+    _register_data_loader(CountingDataLoader, data)
+    assert _share_persistent_data(key, CountingDataLoader, data, settings) == object_id
+    assert ray.get(object_id).sum() == 45
+    assert len(ray.get(get_dataset_holder().list.remote())) == 1
+
+    # Modified data files produce a different fingerprint
+    fingerprint = dataset_fingerprint(key, data)
+    (tmp_path / 'a.txt').write_text('1 2 3 4 5')
+    assert dataset_fingerprint(key, data) != fingerprint
+    ray.kill(get_dataset_holder())
+
+
+def test_dataset_holder_evicts_least_recently_used(local_ray):
+    holder = DatasetHolder.remote(max_bytes=250)
+    for name in ['a', 'b']:
+        ray.get(holder.load.remote(name, lambda: np.zeros(100, dtype=np.uint8)))
+    ray.get(holder.get.remote('a'))
+    object_id = ray.put(np.zeros(100, dtype=np.uint8))
+    # Stored as given, without a copy
+    assert ray.get(holder.put.remote('c', [object_id], 100)) == [object_id]
+    assert [name for name, _ in ray.get(holder.list.remote())] == ['a', 'c']
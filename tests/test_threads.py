@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+
+import pytest
+
+from snapper_ml.config.models import WorkerResourcesConfig
+from snapper_ml.threads import thread_env_vars, pin_to_cpus
+
+
+def test_thread_limits_follow_the_cpus_of_the_workers():
+    assert WorkerResourcesConfig(cpu=4).num_threads == 4
+    assert WorkerResourcesConfig(cpu=0.5).num_threads == 1
+    assert WorkerResourcesConfig(cpu=4, threads=2).num_threads == 2
+    assert WorkerResourcesConfig(threads=None).num_threads is None
+    with pytest.raises(ValueError):
+        WorkerResourcesConfig(threads=None, pin_cpus=True)
+
+    env_vars = thread_env_vars(4)
+    assert env_vars['OMP_NUM_THREADS'] == env_vars['OPENBLAS_NUM_THREADS'] == env_vars['TF_NUM_INTRAOP_THREADS'] == '4'
+    assert env_vars['TF_NUM_INTEROP_THREADS'] == '2'
+
+
+def pin_in_new_process(num_cpus: int, locks_dir: str, cpus: Set[int]) -> Optional[List[int]]:
+    os.sched_setaffinity(0, cpus)
+    claimed = pin_to_cpus(num_cpus, locks_dir=locks_dir)
+    assert os.sched_getaffinity(0) == (set(claimed) if claimed else cpus)
+    return claimed
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'), reason='CPU affinity is not supported')
+def test_workers_are_pinned_to_cores_not_claimed_by_others(tmp_path):
+    cpus = os.sched_getaffinity(0)
+    locks_dir = str(tmp_path)
+    with ProcessPoolExecutor(max_workers=1) as worker:
+        claimed = worker.submit(pin_in_new_process, 1, locks_dir, cpus).result()
+        assert len(claimed) == 1
+        # The claimed core is locked, so all the cores are no longer free
+        with ProcessPoolExecutor(max_workers=1) as other_worker:
+            assert other_worker.submit(pin_in_new_process, len(cpus), locks_dir, cpus).result() is None
+
+    # The cores are released when the process exits
+    with ProcessPoolExecutor(max_workers=1) as worker:
+        assert len(worker.submit(pin_in_new_process, len(cpus), locks_dir, cpus).result()) == len(cpus)
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'), reason='CPU affinity is not supported')
+def test_lock_files_that_cannot_be_opened_are_skipped(tmp_path):
+    cpus = os.sched_getaffinity(0)
+    # Like the lock files of another user, they can't be opened for writing
+    for cpu in cpus:
+        (tmp_path / f'{cpu}.lock').mkdir()
+    with ProcessPoolExecutor(max_workers=1) as worker:
+        assert worker.submit(pin_in_new_process, 1, str(tmp_path), cpus).result() is None